@@ -1,3 +1,10 @@
 # from textabstractor.about import __project_name__, __version__  # noqa: E402, F401
+import importlib
 from clinspacy import about  # noqa: E402, F401
-from clinspacy import abstract  # noqa: E402, F401
+
+
+def __getattr__(name):
+    # submodules pull in spaCy, so they are only imported on first access
+    if name in ["abstract", "extract", "match", "negate", "parse", "segment", "tag"]:
+        return importlib.import_module(f"clinspacy.{name}")
+    raise AttributeError(f"module 'clinspacy' has no attribute '{name}'")
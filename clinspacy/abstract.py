@@ -1,48 +1,137 @@
-import spacy
-from spacy.symbols import ORTH
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import warnings
+import threading
 import textabstractor
-from contextlib import contextmanager
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
 from pluggy import HookimplMarker
-from clinspacy.match import *  # noqa: F401
-from clinspacy.negate import Negex  # noqa: F401
-from clinspacy.parse import *  # noqa: F401
-from clinspacy.segment import *  # noqa: F401
-from clinspacy.extract import *  # noqa: F401
+from clinspacy.about import __version__
+from clinspacy.budget import Budget
+from clinspacy.memo import SentenceMemo
+from clinspacy.profile import LatencyProfiler, MemoryProfiler, Profile, Profiles
 from textabstractor.dataclasses import (
     SuggestRequest,
     ProcessTextResponse,
+    AbstractionSchema,
     AbstractionSchemaMetaData,
     SectionSpan,
     SentenceSpan,
     Suggestion,
 )
 
+# spaCy and the pipeline components are imported on first use, so that plugin discovery
+# through the textabstractor entry point does not pay for them
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from spacy.tokens import Doc
+    from clinspacy.columnar import TextColumns
+    from clinspacy.recycle import AbstractorPool
+    from clinspacy.refresh import Manifest, SchemaRefresher
+
 # --------------------------------------------------------------------------------------------------
 hookimpl = HookimplMarker(textabstractor.__project_name__)
 
 
+# pipeline components that depend on the request's schemas, run after tokenization,
+# sentence splitting, sectioning and lemmatization
+MATCH_PIPES = ["span_match_ruler", "negex", "relextractor"]
+
+
+# --------------------------------------------------------------------------------------------------
+def load_components():
+    """
+    Import the modules defining the clinspacy pipeline components, which registers their
+    spaCy factories. Installed packages also register them through the `spacy_factories`
+    entry points.
+    """
+    from clinspacy import segment, tag, match, negate, extract  # noqa: F401
+
+
 # --------------------------------------------------------------------------------------------------
 class TextAbstractor:
-    def __init__(self):
-        self.nlp = spacy.load(
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        if path is None:
+            self.nlp = TextAbstractor.build()
+        else:
+            self.nlp = TextAbstractor.load(path)
+        self.sentencer = self.nlp.get_pipe("pysbd")
+        self.sectionizer = self.nlp.get_pipe("sectionizer")
+        self.span_ruler = self.nlp.get_pipe("span_match_ruler")
+        self.negex = self.nlp.get_pipe("negex")
+        self.relextractor = self.nlp.get_pipe("relextractor")
+
+    @staticmethod
+    def build() -> Language:
+        import spacy
+        from spacy.symbols import ORTH
+
+        load_components()
+        nlp = spacy.load(
             "en_core_web_sm", exclude=["parser", "tok2vec", "senter", "ner"]
         )
-        self.sentencer = self.nlp.add_pipe("pysbd", first=True)
-        self.sectionizer = self.nlp.add_pipe(
-            "sectionizer", after="pysbd", config={"newline_breaks": False}
+        nlp.add_pipe("pysbd", first=True)
+        nlp.add_pipe("sectionizer", after="pysbd", config={"newline_breaks": False})
+        nlp.add_pipe("token_typer", after="lemmatizer")
+        nlp.add_pipe("span_match_ruler", after="token_typer")
+        nlp.add_pipe(
+            "negex", after="span_match_ruler", config={"scope_window": scope_window}
+        )
+        nlp.add_pipe(
+            "relextractor", after="negex", config={"value_window": value_window}
         )
-        self.span_ruler = self.nlp.add_pipe("span_match_ruler", after="lemmatizer")
-        self.negex = self.nlp.add_pipe("negex", after="span_match_ruler")
-        self.relextractor = self.nlp.add_pipe("relextractor", after="negex")
 
         # Add tokenization rules and special cases
-        self.nlp.tokenizer.add_special_case("in-", [{ORTH: "in"}, {ORTH: "-"}])
-        self.nlp.tokenizer.add_special_case("-situ", [{ORTH: "-"}, {ORTH: "situ"}])
+        nlp.tokenizer.add_special_case("in-", [{ORTH: "in"}, {ORTH: "-"}])
+        nlp.tokenizer.add_special_case("-situ", [{ORTH: "-"}, {ORTH: "situ"}])
 
-        prefixes = list(self.nlp.Defaults.prefixes)
+        prefixes = list(nlp.Defaults.prefixes)
         prefixes.extend(spacy.lang.char_classes.HYPHENS)
         prefix_re = spacy.util.compile_prefix_regex(prefixes)
-        self.nlp.tokenizer.prefix_search = prefix_re.search
+        nlp.tokenizer.prefix_search = prefix_re.search
+
+        nlp.meta["name"] = "clinspacy"
+        nlp.meta["version"] = __version__
+        return nlp
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> Language:
+        """
+        Load a pipeline previously written with `TextAbstractor.to_disk`. The tokenizer
+        rules, component configs and Negex trigger patterns are deserialized as-is, so
+        nothing is rebuilt from `en_core_web_sm`, and Negex never parses the trigger
+        phrases of `config.yml`.
+        :param path: directory or installed package name of the prebuilt pipeline
+        :return:
+        """
+        import spacy
+
+        load_components()
+        nlp = spacy.load(path)
+        version = nlp.meta.get("version")
+        if nlp.meta.get("name") != "clinspacy" or version != __version__:
+            warnings.warn(
+                f"pipeline at {path} was built by {nlp.meta.get('name')} {version}, "
+                f"not clinspacy {__version__}; rebuild it with TextAbstractor.to_disk"
+            )
+        return nlp
+
+    @property
+    def signature(self) -> str:
+        """Hash of the pipeline config, part of the key of memoized sentence results."""
+        if getattr(self, "_signature", None) is None:
+            config = f"{self.nlp.meta.get('version')}\n{self.nlp.config.to_str()}"
+            self._signature = hashlib.sha1(config.encode("utf-8")).hexdigest()
+        return self._signature
+
+    def to_disk(self, path: Union[str, Path]):
+        self.clear()
+        self.nlp.to_disk(path)
 
     def clear(self):
         self.span_ruler.clear()
@@ -54,57 +143,421 @@ class TextAbstractor:
 # TODO: add cache for compiled schemas in SpanRuler
 schema_cache: Dict[str, Tuple[AbstractionSchemaMetaData, Tuple[Dict, List[Dict]]]] = {}
 
+# hashes of the compiled patterns in schema_cache, by schema key
+schema_hashes: Dict[str, Tuple[Tuple[Dict, List[Dict]], str]] = {}
+
+# schema fetches in flight, shared by concurrent requests missing the same schema
+schema_fetches: Dict[str, Tuple[AbstractionSchemaMetaData, Future]] = {}
+schema_fetch_lock = threading.RLock()
+schema_fetch_workers = int(os.environ.get("CLINSPACY_SCHEMA_FETCH_WORKERS", "8"))
+schema_fetch_executor: Optional[ThreadPoolExecutor] = None
+
+# serves out-of-date schemas while their new versions are fetched in the background, set
+# by `enable_schema_refresh`
+schema_refresher: Optional[SchemaRefresher] = None
+
+# sentence-level memo of match, negation and relation results, off when the size is 0
+sentence_memo = SentenceMemo(int(os.environ.get("CLINSPACY_SENTENCE_MEMO", "0")))
+
+# memory profiling of a sampled fraction of requests, off when the rate is 0; debug adds
+# block and live doc counts, which walk the heap
+memory_profiler = MemoryProfiler(
+    float(os.environ.get("CLINSPACY_MEMORY_SAMPLE_RATE", "0")),
+    os.environ.get("CLINSPACY_MEMORY_LOG"),
+    os.environ.get("CLINSPACY_MEMORY_DEBUG", "0") == "1",
+)
+
+# saves requests slower than the threshold, with their timings, off unless a directory
+# is set
+latency_profiler = LatencyProfiler(
+    os.environ.get("CLINSPACY_SLOW_REQUEST_DIR"),
+    float(os.environ.get("CLINSPACY_SLOW_REQUEST_SECONDS", "1.0")),
+    float(os.environ.get("CLINSPACY_SLOW_REQUEST_SAMPLE_RATE", "0.1")),
+)
+
+# texts longer than this are processed in windows, see `clinspacy.chunk`; 0 never splits
+window_chars = int(os.environ.get("CLINSPACY_WINDOW_CHARS", "200000"))
+
+# worker processes for the windows of one text, 1 processes them in turn; the workers
+# are started with the first long text and kept
+window_workers = int(os.environ.get("CLINSPACY_WINDOW_WORKERS", "1"))
+
+# seconds a request may spend in the pipeline before it returns partial results, see
+# `clinspacy.budget`; 0 is unlimited
+time_budget = float(os.environ.get("CLINSPACY_TIME_BUDGET", "0"))
+
+# long-lived pipelines, see `clinspacy.recycle.AbstractorPool`, are rebuilt after this
+# many docs or strings added to their vocab; 0 never rebuilds
+recycle_docs = int(os.environ.get("CLINSPACY_RECYCLE_DOCS", "0"))
+recycle_strings = int(os.environ.get("CLINSPACY_RECYCLE_STRINGS", "0"))
+
+# most tokens from a span that its negation scopes and its value search extend to, within
+# its sentence, for the pipelines built by TextAbstractor.build; 0 is the whole sentence
+scope_window = int(os.environ.get("CLINSPACY_SCOPE_WINDOW", "100")) or None
+value_window = int(os.environ.get("CLINSPACY_VALUE_WINDOW", "100")) or None
+
+# prebuilt pipeline written with TextAbstractor.to_disk, see `make pipeline`
+pipeline_path: Optional[str] = os.environ.get("CLINSPACY_PIPELINE")
+
+# pipeline that requests reuse instead of building their own, set by the preforked
+# workers of `clinspacy.prefork`, which process one request at a time
+shared_pool: Optional[AbstractorPool] = None
+
 
 # --------------------------------------------------------------------------------------------------
 @hookimpl
 def process_text(request: SuggestRequest) -> ProcessTextResponse:
-    with apply_nlp(request) as doc:
-        sections = extract_sections(doc)
-        sentences = extract_sentences(doc)
-        suggestions = filter_out_covered(extract_suggestions(doc))
-    return ProcessTextResponse(
-        sections=sections, sentences=sentences, suggestions=suggestions
+    profile = Profiles.combine(
+        memory_profiler.sample(request), latency_profiler.sample(request)
     )
+    budget = Budget(time_budget) if time_budget else None
+    try:
+        if window_chars and len(request.text) > window_chars:
+            from clinspacy.chunk import process_windows
+
+            args = (request, window_chars, window_workers, budget)
+            if profile is None:
+                return process_windows(*args)
+            response = profile.measure("windows", process_windows, *args)
+            profile.count(None, response)
+            return response
+
+        with apply_nlp(request, profile, budget) as doc:
+            response = extract_response(doc, budget)
+            if profile is not None:
+                profile.count(doc, response)
+    finally:
+        if profile is not None:
+            profile.profiler.finish(profile)
+    return response
+
+
+# --------------------------------------------------------------------------------------------------
+def process_text_columns(request: SuggestRequest) -> TextColumns:
+    """
+    Same as `process_text`, but returns suggestions and sentences as compact arrays for
+    bulk consumers. `TextColumns.to_response` gives the `ProcessTextResponse`.
+    """
+    from clinspacy.columnar import extract_columns
+
+    with apply_nlp(request) as doc:
+        columns = extract_columns(doc, extract_sections(doc))
+    return columns.filter_out_covered()
 
 
 # --------------------------------------------------------------------------------------------------
 @contextmanager
-def apply_nlp(request: SuggestRequest) -> Doc:
-    try:
-        abstractor = TextAbstractor()
-        for section in request.abstractor_sections:
-            abstractor.sectionizer.add_patterns(*parse_section(section, abstractor.nlp))
-        for meta_schema in request.abstractor_abstraction_schemas:
-            name_patterns, value_patterns = get_schema_patterns(abstractor, meta_schema)
-            if len(name_patterns) > 0 and len(value_patterns) > 0:
-                name_patterns["value_patterns"] = value_patterns
-                abstractor.span_ruler.add(name_patterns["predicate"], name_patterns)
-            else:
-                for vp in value_patterns:
-                    abstractor.span_ruler.add(vp["value"], vp)
-        yield abstractor.nlp(request.text)
-    finally:
-        pass
+def apply_nlp(
+    request: SuggestRequest,
+    profile: Optional[Profile] = None,
+    budget: Optional[Budget] = None,
+) -> Doc:
+    with shared_pool.acquire() if shared_pool else nullcontext() as shared:
+        if profile is None:
+            abstractor = create_abstractor(request, shared)
+        else:
+            abstractor = profile.measure("setup", create_abstractor, request, shared)
+        yield annotate(abstractor, request.text, request, profile, budget)
+
+
+# --------------------------------------------------------------------------------------------------
+def create_abstractor(
+    request: SuggestRequest, abstractor: Optional[TextAbstractor] = None
+) -> TextAbstractor:
+    """
+    Set up a pipeline with the sections and schemas of `request`.
+    :param request:
+    :param abstractor: pipeline to clear and reuse, a new one is built if unset
+    :return:
+    """
+    if abstractor is None:
+        abstractor = TextAbstractor(pipeline_path)
+    else:
+        abstractor.clear()
+    add_sections(abstractor, request)
+    prefetch_schemas(abstractor, request.abstractor_abstraction_schemas)
+    for meta_schema in request.abstractor_abstraction_schemas:
+        add_schema(abstractor, meta_schema)
+    return abstractor
+
+
+# --------------------------------------------------------------------------------------------------
+def annotate(
+    abstractor: TextAbstractor,
+    text: str,
+    request: SuggestRequest,
+    profile: Optional[Profile] = None,
+    budget: Optional[Budget] = None,
+) -> Doc:
+    def run(nlp: Language, text: str) -> Doc:
+        if budget is not None:
+            return run_within(nlp, text, budget, profile)
+        return nlp(text) if profile is None else profile.run(nlp, text)
+
+    if sentence_memo.enabled:
+        from clinspacy.memo import match_sentences
+
+        with abstractor.nlp.select_pipes(disable=MATCH_PIPES):
+            doc = run(abstractor.nlp, text)
+        ruleset = get_ruleset_hash(abstractor, request)
+        args = (abstractor, doc, sentence_memo, ruleset, budget)
+        if profile is None:
+            return match_sentences(*args)
+        return profile.measure("sentence_memo", match_sentences, *args)
+    return run(abstractor.nlp, text)
+
+
+# --------------------------------------------------------------------------------------------------
+def run_within(
+    nlp: Language, text: str, budget: Budget, profile: Optional[Profile] = None
+) -> Doc:
+    """
+    `nlp(text)` within `budget`: the doc carries it as `doc._.budget` for components to
+    check, and components left when it is exceeded are skipped.
+    """
+    from clinspacy.match import get_attrs
+
+    def measure(name: str, func, *args):
+        return func(*args) if profile is None else profile.measure(name, func, *args)
+
+    doc = measure("tokenizer", nlp.make_doc, text)
+    doc._.budget = budget
+    if profile is not None:
+        profile.attach(doc)
+    for name, proc in nlp.pipeline:
+        if not budget.exceeded():
+            doc = measure(name, proc, doc)
+            continue
+        # schemas matched but not negated, or names not related to their values
+        rule_types = {"negex": ["name", "value"], "relextractor": ["name"]}
+        budget.skip(
+            name,
+            [
+                key
+                for key, group in doc.spans.items()
+                if get_attrs(group).get("rule_type") in rule_types.get(name, [])
+            ],
+        )
+    return doc
+
+
+# --------------------------------------------------------------------------------------------------
+def add_sections(abstractor: TextAbstractor, request: SuggestRequest):
+    from clinspacy.parse import parse_section
+
+    for section in request.abstractor_sections:
+        abstractor.sectionizer.add_patterns(*parse_section(section, abstractor.nlp))
+
+
+# --------------------------------------------------------------------------------------------------
+def add_schema(abstractor: TextAbstractor, meta_schema: AbstractionSchemaMetaData):
+    name_patterns, value_patterns = get_schema_patterns(abstractor, meta_schema)
+    if len(name_patterns) > 0 and len(value_patterns) > 0:
+        name_patterns["value_patterns"] = value_patterns
+        abstractor.span_ruler.add(name_patterns["predicate"], name_patterns)
+    else:
+        for vp in value_patterns:
+            abstractor.span_ruler.add(vp["value"], vp)
 
 
 # --------------------------------------------------------------------------------------------------
 def get_schema_patterns(
     abstractor: TextAbstractor, schema_metadata: AbstractionSchemaMetaData
 ) -> Tuple[Dict, List[Dict]]:
-    schema_uri = schema_metadata.abstractor_abstraction_schema_uri
-    rule_type = schema_metadata.abstractor_rule_type
-    key = f"{schema_uri}:{rule_type}"
-    if key in schema_cache:
-        m, patterns = schema_cache[key]
-        if schema_metadata.updated_at <= m.updated_at:
-            return patterns
+    from clinspacy.parse import parse_schema
+
+    patterns = lookup_schema(schema_metadata)
+    if patterns is not None:
+        return patterns
 
+    key = get_schema_key(schema_metadata)
     schema = textabstractor.textabstract.get_abstraction_schema(schema_metadata)
     patterns = parse_schema(schema, schema_metadata, abstractor.nlp)
-    schema_cache[key] = (schema_metadata, patterns)
+    cache_schema(key, schema_metadata, patterns)
     return patterns
 
 
+def cache_schema(
+    key: str, schema_metadata: AbstractionSchemaMetaData, patterns: Tuple[Dict, List]
+):
+    """Cache the patterns of a schema, and forget the version they replace."""
+    from clinspacy.match import forget_rulesets
+
+    replaced = schema_cache.get(key)
+    schema_cache[key] = (schema_metadata, patterns)
+    if replaced is not None and replaced[1] is not patterns:
+        name_patterns, value_patterns = replaced[1]
+        forget_rulesets([name_patterns, *value_patterns])
+
+
+# --------------------------------------------------------------------------------------------------
+def get_schema_key(schema_metadata: AbstractionSchemaMetaData) -> str:
+    schema_uri = schema_metadata.abstractor_abstraction_schema_uri
+    rule_type = schema_metadata.abstractor_rule_type
+    return f"{schema_uri}:{rule_type}"
+
+
+def is_cached(schema_metadata: AbstractionSchemaMetaData) -> bool:
+    key = get_schema_key(schema_metadata)
+    return (
+        key in schema_cache
+        and schema_metadata.updated_at <= schema_cache[key][0].updated_at
+    )
+
+
+def lookup_schema(
+    schema_metadata: AbstractionSchemaMetaData,
+) -> Optional[Tuple[Dict, List[Dict]]]:
+    """
+    Cached patterns for `schema_metadata`, None if they have to be fetched. With a
+    `schema_refresher`, out-of-date patterns are returned too, and the refresher fetches
+    the new version in the background.
+    """
+    cached = schema_cache.get(get_schema_key(schema_metadata))
+    if cached is None:
+        return None
+    if schema_metadata.updated_at <= cached[0].updated_at:
+        return cached[1]
+    if schema_refresher is not None:
+        schema_refresher.refresh(schema_metadata)
+        return cached[1]
+    return None
+
+
+# --------------------------------------------------------------------------------------------------
+def enable_schema_refresh(
+    manifest: Optional[Manifest] = None, interval: float = 60.0
+) -> SchemaRefresher:
+    """
+    Serve cached schemas stale while revalidating them, and keep the schemas listed by
+    `manifest` up to date, polling it every `interval` seconds.
+    """
+    global schema_refresher
+    from clinspacy.refresh import SchemaRefresher
+
+    if schema_refresher is not None:
+        schema_refresher.stop(wait=False)
+    schema_refresher = SchemaRefresher(manifest, interval)
+    schema_refresher.start()
+    return schema_refresher
+
+
+# --------------------------------------------------------------------------------------------------
+def fetch_schemas(
+    schema_metadatas: List[AbstractionSchemaMetaData],
+) -> Dict[str, AbstractionSchema]:
+    """
+    Fetch the schemas missing from `schema_cache` concurrently, at most
+    `schema_fetch_workers` at a time. A schema already being fetched for another request
+    is waited for rather than fetched again.
+    :return: the fetched schemas by schema key
+    """
+    global schema_fetch_executor
+
+    futures = {}
+    with schema_fetch_lock:
+        for m in schema_metadatas:
+            key = get_schema_key(m)
+            if key in futures or lookup_schema(m) is not None:
+                continue
+            fetching, future = schema_fetches.get(key, (None, None))
+            if future is None or m.updated_at > fetching.updated_at:
+                if schema_fetch_executor is None:
+                    schema_fetch_executor = ThreadPoolExecutor(schema_fetch_workers)
+                future = schema_fetch_executor.submit(
+                    textabstractor.textabstract.get_abstraction_schema, m
+                )
+                schema_fetches[key] = (m, future)
+                future.add_done_callback(lambda f, key=key: forget_fetch(key, f))
+            futures[key] = (m, future)
+    return {key: future.result() for key, (_, future) in futures.items()}
+
+
+def forget_fetch(key: str, future: Future):
+    with schema_fetch_lock:
+        if key in schema_fetches and schema_fetches[key][1] is future:
+            del schema_fetches[key]
+
+
+# --------------------------------------------------------------------------------------------------
+def prefetch_schemas(
+    abstractor: TextAbstractor, schema_metadatas: List[AbstractionSchemaMetaData]
+):
+    """
+    Fill `schema_cache` for all of a request's schemas: the missing ones are fetched
+    concurrently with `fetch_schemas` and then parsed one after another, since parsing
+    runs the abstractor's pipeline.
+    """
+    from clinspacy.parse import parse_schema
+
+    schemas = fetch_schemas(schema_metadatas)
+    stale = False
+    for m in schema_metadatas:
+        key = get_schema_key(m)
+        if key in schemas and not is_cached(m):
+            patterns = parse_schema(schemas.pop(key), m, abstractor.nlp)
+            cache_schema(key, m, patterns)
+        elif not is_cached(m):
+            stale = True
+    # counted once per request, however often its stale schemas are looked up
+    if stale and schema_refresher is not None:
+        schema_refresher.served_stale()
+
+
+# --------------------------------------------------------------------------------------------------
+def get_schema_hash(
+    abstractor: TextAbstractor, schema_metadata: AbstractionSchemaMetaData
+) -> str:
+    key = get_schema_key(schema_metadata)
+    patterns = get_schema_patterns(abstractor, schema_metadata)
+    if key in schema_hashes and schema_hashes[key][0] is patterns:
+        return schema_hashes[key][1]
+
+    name_patterns, value_patterns = patterns
+    # add_schema attaches the value patterns to the name patterns, hash them once
+    name_patterns = {k: v for k, v in name_patterns.items() if k != "value_patterns"}
+    compiled = json.dumps([name_patterns, value_patterns], sort_keys=True, default=str)
+    schema_hash = hashlib.sha1(compiled.encode("utf-8")).hexdigest()
+    schema_hashes[key] = (patterns, schema_hash)
+    return schema_hash
+
+
+# --------------------------------------------------------------------------------------------------
+def get_ruleset_hash(abstractor: TextAbstractor, request: SuggestRequest) -> str:
+    digest = hashlib.sha1(abstractor.signature.encode("utf-8"))
+    for meta_schema in request.abstractor_abstraction_schemas:
+        digest.update(get_schema_hash(abstractor, meta_schema).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# --------------------------------------------------------------------------------------------------
+def extract_response(doc: Doc, budget: Optional[Budget] = None) -> ProcessTextResponse:
+    if budget is None:
+        return ProcessTextResponse(
+            sections=extract_sections(doc),
+            sentences=extract_sentences(doc),
+            suggestions=filter_out_covered(extract_suggestions(doc)),
+        )
+    sections, sentences, groups = extract_partial(doc, budget)
+    response = ProcessTextResponse(
+        sections=sections,
+        sentences=sentences,
+        suggestions=filter_out_covered([s for g in groups.values() for s in g]),
+    )
+    return budget.response(response)
+
+
+def extract_partial(
+    doc: Doc, budget: Budget
+) -> Tuple[List[SectionSpan], List[SentenceSpan], Dict[str, List[Suggestion]]]:
+    """What there is of a doc processed within `budget`."""
+    return (
+        [] if "sectionizer" in budget.skipped else extract_sections(doc),
+        [] if "pysbd" in budget.skipped else extract_sentences(doc),
+        extract_suggestion_groups(doc, budget.incomplete),
+    )
+
+
 # --------------------------------------------------------------------------------------------------
 def extract_sections(doc: Doc) -> List[SectionSpan]:
     sections = []
@@ -138,29 +591,45 @@ def extract_sentences(doc: Doc) -> List[SentenceSpan]:
 
 # --------------------------------------------------------------------------------------------------
 def extract_suggestions(doc: Doc) -> List[Suggestion]:
-    suggestions = []
-    for _, span_group in doc.spans.items():
-        rule_type: str = span_group.attrs.get("rule_type", None)
-        if rule_type not in ["name", "value"]:
+    return [s for group in extract_suggestion_groups(doc).values() for s in group]
+
+
+# --------------------------------------------------------------------------------------------------
+def extract_suggestion_groups(
+    doc: Doc, exclude: Iterable[str] = ()
+) -> Dict[str, List[Suggestion]]:
+    """
+    Suggestions keyed by the span group they come from, in span group order, leaving out
+    the span groups in `exclude`.
+    """
+    from clinspacy.extract import get_relations
+    from clinspacy.match import get_attrs
+
+    suggestions = {}
+    for key, span_group in doc.spans.items():
+        attrs = get_attrs(span_group)
+        rule_type: str = attrs.get("rule_type", None)
+        if rule_type not in ["name", "value"] or key in exclude:
             continue
-        for span in span_group:
+        group_suggestions = suggestions[key] = []
+        relations = get_relations(span_group)
+        for idx, span in enumerate(span_group):
             # suggestions for name and stand-alone value matches
-            suggestions.append(
+            group_suggestions.append(
                 Suggestion(
-                    predicate=span_group.attrs["predicate"],
+                    predicate=attrs["predicate"],
                     begin=span.start_char,
                     end=span.end_char - 1,
-                    type=span_group.attrs["rule_type"],
-                    value=span_group.attrs["value"],
+                    type=attrs["rule_type"],
+                    value=attrs["value"],
                     assertion="absent" if span._.negated else "present",
                 )
             )
             # suggestions for value matches corresponding to name matches
-            value_map: Dict[Span, SpanGroup] = span_group.attrs.get("value_map", {})
-            for value_span in value_map.get(span, []):
-                suggestions.append(
+            for value_span in relations.get(idx, []):
+                group_suggestions.append(
                     Suggestion(
-                        predicate=span_group.attrs["predicate"],
+                        predicate=attrs["predicate"],
                         begin=value_span.start_char,
                         end=value_span.end_char - 1,
                         type="value",
@@ -184,3 +653,17 @@ def filter_out_covered(suggestions: List[Suggestion]) -> List[Suggestion]:
             and len(s) > len(suggestion)
         ]
     ]
+
+
+# --------------------------------------------------------------------------------------------------
+if os.environ.get("CLINSPACY_SCHEMA_REFRESH"):
+    from clinspacy.refresh import load_manifest
+
+    enable_schema_refresh(
+        (
+            load_manifest(os.environ["CLINSPACY_SCHEMA_MANIFEST"])
+            if os.environ.get("CLINSPACY_SCHEMA_MANIFEST")
+            else None
+        ),
+        float(os.environ.get("CLINSPACY_SCHEMA_POLL_SECONDS", "60")),
+    )
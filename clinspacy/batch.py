@@ -0,0 +1,171 @@
+import json
+import hashlib
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+from spacy.tokens import Doc
+from textabstractor.dataclasses import ProcessTextResponse, SuggestRequest
+from clinspacy import abstract
+from clinspacy.abstract import TextAbstractor
+
+# characters of note text per batch, and most notes per batch
+BATCH_CHARS = 100000
+BATCH_SIZE = 64
+
+
+# --------------------------------------------------------------------------------------------------
+class BatchReport:
+    """
+    Per-batch statistics of `process_batches`. The fill of a batch is its characters
+    over its size times its longest note, 1.0 when all its notes are the same length;
+    the lower it is, the longer the batch waits on its longest note.
+    """
+
+    def __init__(self):
+        self.batches: List[Dict] = []
+
+    def add(self, lengths: List[int], seconds: float, outlier: bool = False):
+        self.batches.append(
+            {
+                "docs": len(lengths),
+                "chars": sum(lengths),
+                "max_chars": max(lengths),
+                "fill": fill(lengths),
+                "seconds": seconds,
+                "outlier": outlier,
+            }
+        )
+
+    def to_dict(self) -> Dict:
+        docs = sum(b["docs"] for b in self.batches)
+        chars = sum(b["chars"] for b in self.batches)
+        capacity = sum(b["docs"] * b["max_chars"] for b in self.batches)
+        seconds = sum(b["seconds"] for b in self.batches)
+        return {
+            "docs": docs,
+            "batches": len(self.batches),
+            "outliers": sum(1 for b in self.batches if b["outlier"]),
+            "fill": chars / capacity if capacity else 1.0,
+            "seconds": seconds,
+            "docs_per_second": docs / seconds if seconds else None,
+            "chars_per_second": chars / seconds if seconds else None,
+        }
+
+
+def fill(lengths: List[int]) -> float:
+    longest = max(lengths, default=0)
+    return sum(lengths) / (len(lengths) * longest) if longest else 1.0
+
+
+# --------------------------------------------------------------------------------------------------
+def schedule(
+    lengths: List[int],
+    batch_chars: int = BATCH_CHARS,
+    batch_size: int = BATCH_SIZE,
+    by_length: bool = True,
+) -> List[List[int]]:
+    """
+    Split notes into batches of at most `batch_size` notes and `batch_chars` characters,
+    a note longer than `batch_chars` making a batch of its own.
+    :param lengths: lengths of the notes
+    :param batch_chars:
+    :param batch_size:
+    :param by_length: batch notes of similar length together, shortest first, rather
+    than in the order given
+    :return: the indices into `lengths` of the notes of each batch
+    """
+    order = range(len(lengths))
+    if by_length:
+        order = sorted(order, key=lambda i: lengths[i])
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    chars = 0
+    for i in order:
+        if batch and (chars + lengths[i] > batch_chars or len(batch) >= batch_size):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append(i)
+        chars += lengths[i]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# --------------------------------------------------------------------------------------------------
+def get_ruleset_key(abstractor: TextAbstractor, request: SuggestRequest) -> str:
+    """Requests with the same key can share a pipeline: same schemas and sections."""
+    sections = json.dumps(
+        [s.dict() for s in request.abstractor_sections], sort_keys=True, default=str
+    )
+    digest = hashlib.sha1(
+        abstract.get_ruleset_hash(abstractor, request).encode("utf-8")
+    )
+    digest.update(sections.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# --------------------------------------------------------------------------------------------------
+def annotate_batch(
+    abstractor: TextAbstractor, texts: List[str], request: SuggestRequest
+) -> Iterator[Doc]:
+    """`abstract.annotate` for a batch of notes sharing the ruleset of `request`."""
+    if abstract.sentence_memo.enabled:
+        from clinspacy.memo import match_sentences
+
+        with abstractor.nlp.select_pipes(disable=abstract.MATCH_PIPES):
+            docs = list(abstractor.nlp.pipe(texts, batch_size=len(texts)))
+        ruleset = abstract.get_ruleset_hash(abstractor, request)
+        for doc in docs:
+            yield match_sentences(abstractor, doc, abstract.sentence_memo, ruleset)
+    else:
+        yield from abstractor.nlp.pipe(texts, batch_size=len(texts))
+
+
+# --------------------------------------------------------------------------------------------------
+def process_batches(
+    requests: List[SuggestRequest],
+    batch_chars: int = BATCH_CHARS,
+    batch_size: int = BATCH_SIZE,
+    outlier_chars: Optional[int] = None,
+    by_length: bool = True,
+) -> Tuple[List[ProcessTextResponse], BatchReport]:
+    """
+    `process_text` for many requests at once. Requests are grouped by ruleset, so that
+    each group builds its pipeline once, and each group runs through `nlp.pipe` in
+    batches from `schedule`. Notes longer than `outlier_chars`, by default
+    `batch_chars`, go through `process_text` one at a time instead.
+    :return: the responses, in the order of `requests`, and the batch statistics
+    """
+    if outlier_chars is None:
+        outlier_chars = batch_chars
+    responses: List[Optional[ProcessTextResponse]] = [None] * len(requests)
+    report = BatchReport()
+
+    groups: Dict[str, List[int]] = {}
+    hasher = None
+    for i, request in enumerate(requests):
+        if len(request.text) > outlier_chars:
+            start = perf_counter()
+            responses[i] = abstract.process_text(request)
+            report.add([len(request.text)], perf_counter() - start, outlier=True)
+            continue
+        if hasher is None:
+            hasher = TextAbstractor(abstract.pipeline_path)
+            schema_metadatas = {
+                abstract.get_schema_key(m): m
+                for r in requests
+                for m in r.abstractor_abstraction_schemas
+            }
+            abstract.prefetch_schemas(hasher, list(schema_metadatas.values()))
+        groups.setdefault(get_ruleset_key(hasher, request), []).append(i)
+
+    for indices in groups.values():
+        first = requests[indices[0]]
+        abstractor = abstract.create_abstractor(first)
+        lengths = [len(requests[i].text) for i in indices]
+        for batch in schedule(lengths, batch_chars, batch_size, by_length):
+            start = perf_counter()
+            texts = [requests[indices[b]].text for b in batch]
+            for b, doc in zip(batch, annotate_batch(abstractor, texts, first)):
+                responses[indices[b]] = abstract.extract_response(doc)
+            report.add([lengths[b] for b in batch], perf_counter() - start)
+    return responses, report
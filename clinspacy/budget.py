@@ -0,0 +1,72 @@
+from time import monotonic
+from typing import Iterable, List, Optional, Set
+from textabstractor.dataclasses import ProcessTextResponse
+
+
+# --------------------------------------------------------------------------------------------------
+class PartialResponse(ProcessTextResponse):
+    """
+    Response of a request that ran out of its time budget. `skipped` lists the pipeline
+    components that did not run, `truncated` those that stopped part way, and
+    `incomplete` the span groups, by schema predicate or value, whose suggestions were
+    left out because they were not fully matched, negated and related.
+    """
+
+    skipped: List[str] = []
+    truncated: List[str] = []
+    incomplete: List[str] = []
+
+
+# --------------------------------------------------------------------------------------------------
+class Budget:
+    """
+    Cooperative time budget of one request. Components that can run long check
+    `exceeded` between units of work, sentences or schemas, and record what they did
+    not finish instead of raising, so that the request returns what it has.
+    """
+
+    def __init__(self, seconds: float, deadline: Optional[float] = None):
+        self.seconds = seconds
+        # time.monotonic is system-wide, so a deadline also holds in worker processes
+        self.deadline = monotonic() + seconds if deadline is None else deadline
+        self.skipped: List[str] = []
+        self.truncated: List[str] = []
+        self.incomplete: Set[str] = set()
+
+    def exceeded(self) -> bool:
+        return monotonic() > self.deadline
+
+    @property
+    def complete(self) -> bool:
+        return not self.skipped and not self.truncated
+
+    def skip(self, stage: str, groups: Iterable[str] = ()):
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+        self.incomplete.update(groups)
+
+    def truncate(self, stage: str, groups: Iterable[str] = ()):
+        if stage not in self.truncated:
+            self.truncated.append(stage)
+        self.incomplete.update(groups)
+
+    def merge(self, other: "Budget"):
+        """Add the records of `other`, e.g. of a window run in another process."""
+        for stage in other.skipped:
+            self.skip(stage)
+        for stage in other.truncated:
+            self.truncate(stage)
+        self.incomplete.update(other.incomplete)
+
+    def response(self, response: ProcessTextResponse) -> ProcessTextResponse:
+        """`response` as is if the request completed, else as a `PartialResponse`."""
+        if self.complete:
+            return response
+        return PartialResponse(
+            sections=response.sections,
+            sentences=response.sentences,
+            suggestions=response.suggestions,
+            skipped=self.skipped,
+            truncated=self.truncated,
+            incomplete=sorted(self.incomplete),
+        )
@@ -0,0 +1,315 @@
+import os
+import sys
+import copy
+import json
+import argparse
+from pathlib import Path
+from time import perf_counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
+from textabstractor.dataclasses import ProcessTextResponse, SuggestRequest
+from clinspacy.batch import BATCH_CHARS, BATCH_SIZE, process_batches
+from clinspacy.corpus import Corpus, is_corpus
+from clinspacy.writer import TABLES, ResponseWriter
+
+# notes per shard, the unit of work of a worker and of a checkpoint
+SHARD_SIZE = 1000
+CHECKPOINT = "checkpoint.jsonl"
+
+
+# --------------------------------------------------------------------------------------------------
+def read_notes(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Stream `(note id, text)` pairs from `.jsonl` files of `{"note_id", "text"}` lines,
+    from text files, whose note id is their name without the suffix, and from
+    directories of `*.txt` files, in a stable order so that shards are the same from
+    one run to the next.
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            for txt in sorted(path.rglob("*.txt")):
+                yield txt.stem, txt.read_text()
+        elif path.suffix == ".jsonl":
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        note = json.loads(line)
+                        yield str(note["note_id"]), note["text"]
+        else:
+            yield path.stem, path.read_text()
+
+
+def make_shards(
+    notes: Union[Iterable[Tuple[str, str]], Corpus], shard_size: int = SHARD_SIZE
+) -> Iterator[Tuple[int, Union[List[Tuple[str, str]], range]]]:
+    """
+    Number `notes` into shards of `shard_size` notes. The shards of a `Corpus` are index
+    ranges, that workers read from their own mapping of the corpus.
+    """
+    if isinstance(notes, Corpus):
+        yield from enumerate(notes.ranges(shard_size))
+        return
+    shard: List[Tuple[str, str]] = []
+    number = 0
+    for note in notes:
+        shard.append(note)
+        if len(shard) >= shard_size:
+            yield number, shard
+            shard, number = [], number + 1
+    if shard:
+        yield number, shard
+
+
+# --------------------------------------------------------------------------------------------------
+class Checkpoint:
+    """
+    Append-only log of the shards whose results are on disk, under the output directory.
+    A shard is logged, and fsynced, only after its part files are complete, and the
+    part files of shards that are not logged, left by a killed run, are removed on
+    resume, so every note is written exactly once however often the job is restarted.
+    """
+
+    def __init__(self, output: Path, shard_size: int):
+        self.path = output / CHECKPOINT
+        self.shard_size = shard_size
+        self.shards: Dict[int, Dict] = {}
+        if self.path.exists():
+            self._load()
+        else:
+            output.mkdir(parents=True, exist_ok=True)
+            self._append({"shard_size": shard_size})
+
+    def _load(self):
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0])
+        if header["shard_size"] != self.shard_size:
+            raise ValueError(
+                f"{self.path} was written with shard size {header['shard_size']}, "
+                f"not {self.shard_size}"
+            )
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of a run killed while logging it
+                break
+            self.shards[entry["shard"]] = entry
+
+    def _append(self, entry: Dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def done(self, shard: int) -> bool:
+        return shard in self.shards
+
+    def add(self, shard: int, notes: int, chars: int, parts: List[Path]):
+        entry = {
+            "shard": shard,
+            "notes": notes,
+            "chars": chars,
+            "parts": sorted(str(p.relative_to(self.path.parent)) for p in parts),
+        }
+        self._append(entry)
+        self.shards[shard] = entry
+
+    def remove_orphans(self) -> List[Path]:
+        """Remove the part files, complete or not, of shards that were not logged."""
+        logged = {p for entry in self.shards.values() for p in entry["parts"]}
+        orphans = [
+            p
+            for table in TABLES
+            for p in (self.path.parent / table).glob("part-*")
+            if str(p.relative_to(self.path.parent)) not in logged
+        ]
+        for p in orphans:
+            p.unlink()
+        return orphans
+
+
+# --------------------------------------------------------------------------------------------------
+class Progress:
+    """
+    Throughput of a run, in notes and characters per second, written as a JSON line to
+    `stream`, if any, as every shard completes.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+        self.start = perf_counter()
+        self.notes = 0
+        self.chars = 0
+        self.shards = 0
+
+    def add(self, notes: int, chars: int):
+        self.notes += notes
+        self.chars += chars
+        self.shards += 1
+        if self.stream is not None:
+            print(json.dumps(self.to_dict()), file=self.stream, flush=True)
+
+    def to_dict(self) -> Dict:
+        seconds = perf_counter() - self.start
+        return {
+            "shards": self.shards,
+            "notes": self.notes,
+            "chars": self.chars,
+            "seconds": seconds,
+            "notes_per_second": self.notes / seconds if seconds else None,
+            "chars_per_second": self.chars / seconds if seconds else None,
+        }
+
+
+# --------------------------------------------------------------------------------------------------
+# request template of a worker process, that every note of a shard is a copy of
+worker_template: Optional[SuggestRequest] = None
+worker_corpus: Optional[Corpus] = None
+worker_batch_chars = BATCH_CHARS
+worker_batch_size = BATCH_SIZE
+
+
+def init_worker(
+    template: SuggestRequest,
+    batch_chars: int = BATCH_CHARS,
+    batch_size: int = BATCH_SIZE,
+    corpus: Optional[Corpus] = None,
+):
+    global worker_template, worker_corpus, worker_batch_chars, worker_batch_size
+    worker_template = template
+    worker_corpus = corpus
+    worker_batch_chars = batch_chars
+    worker_batch_size = batch_size
+
+
+def process_shard(
+    shard: int, notes: Union[List[Tuple[str, str]], range]
+) -> Tuple[int, List[Tuple[str, ProcessTextResponse]], int]:
+    """
+    Run the notes of a shard through `process_batches`, with the worker's template.
+    :param shard:
+    :param notes: the notes, or their index range in the worker's corpus
+    :return: the shard, its responses by note id and its characters
+    """
+    if isinstance(notes, range):
+        notes = list(worker_corpus.notes(notes.start, notes.stop))
+    requests = []
+    for _, text in notes:
+        request = copy.copy(worker_template)
+        request.text = text
+        requests.append(request)
+    responses, _ = process_batches(requests, worker_batch_chars, worker_batch_size)
+    chars = sum(len(text) for _, text in notes)
+    return shard, [(note_id, r) for (note_id, _), r in zip(notes, responses)], chars
+
+
+# --------------------------------------------------------------------------------------------------
+def run(
+    notes: Union[Iterable[Tuple[str, str]], Corpus],
+    template: SuggestRequest,
+    output: Path,
+    processes: int = 1,
+    shard_size: int = SHARD_SIZE,
+    fmt: str = "jsonl",
+    batch_chars: int = BATCH_CHARS,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Progress] = None,
+) -> Progress:
+    """
+    Process a corpus into `ResponseWriter` tables under `output`, shard by shard,
+    checkpointing every shard once written. Running it again on the same notes, in the
+    same order and with the same shard size, resumes after the logged shards.
+    :param notes: `(note id, text)` pairs, or a corpus
+    :param template: request whose schemas and sections every note is processed with
+    :param output:
+    :param processes: worker processes, shards are processed in the calling process
+    when 1
+    :param shard_size: notes per shard
+    :param fmt: "jsonl" or "parquet"
+    :param batch_chars: see `process_batches`
+    :param batch_size: see `process_batches`
+    :param progress:
+    :return: the throughput of the shards processed by this run
+    """
+    output = Path(output)
+    corpus = notes if isinstance(notes, Corpus) else None
+    checkpoint = Checkpoint(output, shard_size)
+    checkpoint.remove_orphans()
+    progress = progress or Progress()
+    pending = (s for s in make_shards(notes, shard_size) if not checkpoint.done(s[0]))
+
+    # one part file per table and shard, so that a shard's rows are logged as a whole
+    with ResponseWriter(output, fmt, rows_per_file=None) as writer:
+
+        def write(shard: int, responses: List, chars: int):
+            writer.write_all(responses)
+            checkpoint.add(shard, len(responses), chars, writer.rotate())
+            progress.add(len(responses), chars)
+
+        if processes <= 1:
+            init_worker(template, batch_chars, batch_size, corpus)
+            for shard, shard_notes in pending:
+                write(*process_shard(shard, shard_notes))
+            return progress
+
+        with ProcessPoolExecutor(
+            processes,
+            initializer=init_worker,
+            initargs=(template, batch_chars, batch_size, corpus),
+        ) as executor:
+            # keep a couple of shards queued per worker, not the whole corpus in memory
+            futures: Set = set()
+            for shard, shard_notes in pending:
+                futures.add(executor.submit(process_shard, shard, shard_notes))
+                if len(futures) >= 2 * processes:
+                    finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write(*future.result())
+            for future in futures:
+                write(*future.result())
+    return progress
+
+
+# --------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Process a corpus of notes into NOTE_NLP staging tables"
+    )
+    parser.add_argument(
+        "notes",
+        nargs="+",
+        help="note .jsonl files, text files or directories, or one corpus directory",
+    )
+    parser.add_argument(
+        "--request", required=True, help="SuggestRequest JSON file, its text unused"
+    )
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--batch-chars", type=int, default=BATCH_CHARS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    template = SuggestRequest(**json.loads(Path(args.request).read_text()))
+    if len(args.notes) == 1 and is_corpus(args.notes[0]):
+        notes = Corpus(args.notes[0])
+    else:
+        notes = read_notes(args.notes)
+    progress = run(
+        notes,
+        template,
+        Path(args.output),
+        args.processes,
+        args.shard_size,
+        args.format,
+        args.batch_chars,
+        args.batch_size,
+        Progress(sys.stderr),
+    )
+    print(json.dumps(progress.to_dict()))
+
+
+if __name__ == "__main__":
+    main()
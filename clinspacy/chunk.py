@@ -0,0 +1,250 @@
+import os
+import re
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from textabstractor.dataclasses import (
+    ProcessTextResponse,
+    SectionSpan,
+    SentenceSpan,
+    SuggestRequest,
+    Suggestion,
+)
+from clinspacy import abstract
+from clinspacy.abstract import (
+    TextAbstractor,
+    annotate,
+    create_abstractor,
+    extract_partial,
+    extract_sections,
+    extract_sentences,
+    extract_suggestion_groups,
+    filter_out_covered,
+)
+from clinspacy.budget import Budget
+from clinspacy.recycle import AbstractorPool
+from clinspacy.revision import shift
+
+# preferred window boundaries, best first: blank lines between paragraphs and sections,
+# line breaks, then any whitespace
+BREAKS = [re.compile(r"\n[ \t\r\f\v]*\n\s*"), re.compile(r"\n\s*"), re.compile(r"\s+")]
+
+
+# --------------------------------------------------------------------------------------------------
+class WindowResult:
+    """
+    Results of one window, with offsets relative to the start of the window. `lead_end`
+    is the end of the text before the window's first section header, or None if the
+    window starts with a header; a section left open by earlier windows ends there.
+    `budget` is the time budget the window ran within, if any.
+    """
+
+    def __init__(
+        self,
+        sections: List[SectionSpan],
+        sentences: List[SentenceSpan],
+        groups: Dict[str, List[Suggestion]],
+        lead_end: Optional[int],
+        budget: Optional[Budget] = None,
+    ):
+        self.sections = sections
+        self.sentences = sentences
+        self.groups = groups
+        self.lead_end = lead_end
+        self.budget = budget
+
+
+# --------------------------------------------------------------------------------------------------
+def split_windows(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Split `text` into windows of at most `max_chars` characters, ending each window at
+    the best break in its second half. Windows only split inside a token when there is
+    no whitespace at all to break at.
+    :param text:
+    :param max_chars:
+    :return: (begin, end) offsets of the windows, covering the whole text
+    """
+    windows = []
+    begin = 0
+    while len(text) - begin > max_chars:
+        limit = begin + max_chars
+        end = limit
+        for pattern in BREAKS:
+            breaks = [
+                m.end()
+                for m in pattern.finditer(text, begin + max_chars // 2, limit)
+                if m.end() <= limit
+            ]
+            if breaks:
+                end = breaks[-1]
+                break
+        windows.append((begin, end))
+        begin = end
+    windows.append((begin, len(text)))
+    return windows
+
+
+# --------------------------------------------------------------------------------------------------
+def process_window(
+    abstractor: TextAbstractor,
+    request: SuggestRequest,
+    text: str,
+    budget: Optional[Budget] = None,
+):
+    doc = annotate(abstractor, text, request, budget=budget)
+    headers = sorted(doc.spans.get("section_headers", []), key=lambda s: s.start)
+    if not headers:
+        lead_end = doc[:].end_char - 1 if len(doc) else None
+    elif headers[0].start > 0:
+        lead_end = doc[: headers[0].start].end_char - 1
+    else:
+        lead_end = None
+    if budget is not None:
+        return WindowResult(*extract_partial(doc, budget), lead_end, budget)
+    return WindowResult(
+        extract_sections(doc),
+        extract_sentences(doc),
+        extract_suggestion_groups(doc),
+        lead_end,
+    )
+
+
+# --------------------------------------------------------------------------------------------------
+# pools of window workers by worker count, kept for the life of the process so that
+# their pipelines are loaded once; a forked child starts its own
+window_pools: Dict[int, ProcessPoolExecutor] = {}
+window_pools_lock = threading.Lock()
+os.register_at_fork(after_in_child=window_pools.clear)
+
+
+def get_window_pool(workers: int) -> ProcessPoolExecutor:
+    with window_pools_lock:
+        if workers not in window_pools:
+            window_pools[workers] = ProcessPoolExecutor(workers)
+        return window_pools[workers]
+
+
+# pipeline of a worker process, set up again only for a request with another ruleset
+worker_pool: Optional[AbstractorPool] = None
+worker_abstractor: Optional[TextAbstractor] = None
+worker_ruleset: Optional[str] = None
+
+
+def get_window_ruleset(request: SuggestRequest) -> str:
+    """Requests with the same key have the same schemas and sections."""
+    ruleset = request.json(exclude={"text"}, sort_keys=True)
+    return hashlib.sha1(ruleset.encode("utf-8")).hexdigest()
+
+
+def process_worker_window(
+    request: SuggestRequest, ruleset: str, text: str, budget: Optional[Budget] = None
+) -> WindowResult:
+    global worker_pool, worker_abstractor, worker_ruleset
+    if worker_pool is None:
+        worker_pool = AbstractorPool(abstract.recycle_docs, abstract.recycle_strings)
+    with worker_pool.acquire() as abstractor:
+        if abstractor is not worker_abstractor or ruleset != worker_ruleset:
+            worker_abstractor = create_abstractor(request, abstractor)
+            worker_ruleset = ruleset
+        return process_window(abstractor, request, text, budget)
+
+
+# --------------------------------------------------------------------------------------------------
+def process_windows(
+    request: SuggestRequest,
+    max_chars: int,
+    workers: int = 1,
+    budget: Optional[Budget] = None,
+) -> ProcessTextResponse:
+    """
+    `process_text` for very long notes. The text is split into windows of at most
+    `max_chars` characters at paragraph or line breaks, each window runs through the
+    pipeline on its own, in a pool of `workers` processes when more than 1, and the
+    results are merged with offsets shifted and sections and sentences renumbered.
+    Results equal those of a single pass except where a sentence or a match spans a
+    window boundary. Every window checks the same `budget`, so windows past its deadline
+    only get tokenized.
+    """
+    windows = split_windows(request.text, max_chars)
+    texts = [request.text[begin:end] for begin, end in windows]
+    if workers > 1 and len(windows) > 1:
+        # the windows carry the text, so it is not sent again with every window
+        rules = request.copy(update={"text": ""})
+        ruleset = get_window_ruleset(request)
+        executor = get_window_pool(workers)
+        try:
+            results = list(
+                executor.map(
+                    process_worker_window,
+                    *zip(*[(rules, ruleset, text, budget) for text in texts]),
+                )
+            )
+        except BrokenProcessPool:
+            with window_pools_lock:
+                if window_pools.get(workers) is executor:
+                    del window_pools[workers]
+            raise
+    else:
+        abstractor = create_abstractor(request)
+        results = [process_window(abstractor, request, text, budget) for text in texts]
+    return merge_windows(windows, results, budget)
+
+
+# --------------------------------------------------------------------------------------------------
+def merge_windows(
+    windows: List[Tuple[int, int]],
+    results: List[WindowResult],
+    budget: Optional[Budget] = None,
+) -> ProcessTextResponse:
+    sections: List[SectionSpan] = []
+    sentences: List[SentenceSpan] = []
+    groups: Dict[str, List[Suggestion]] = {}
+    for (offset, _), result in zip(windows, results):
+        # a section runs on to the next header, which may be windows later
+        if sections and result.lead_end is not None:
+            last = sections[-1]
+            sections[-1] = SectionSpan(
+                section_number=last.section_number,
+                section_name=last.section_name,
+                begin=last.begin,
+                end=result.lead_end + offset,
+                begin_header=last.begin_header,
+                end_header=last.end_header,
+            )
+        for s in result.sections:
+            sections.append(
+                SectionSpan(
+                    section_number=len(sections),
+                    section_name=s.section_name,
+                    begin=s.begin + offset,
+                    end=s.end + offset,
+                    begin_header=s.begin_header + offset,
+                    end_header=s.end_header + offset,
+                )
+            )
+        for s in result.sentences:
+            sentences.append(
+                SentenceSpan(
+                    sentence_number=len(sentences),
+                    begin=s.begin + offset,
+                    end=s.end + offset,
+                )
+            )
+        for key, suggestions in result.groups.items():
+            groups.setdefault(key, []).extend(shift(s, offset) for s in suggestions)
+
+    if budget is not None:
+        # with the records of windows run in worker processes
+        for result in results:
+            if result.budget is not None and result.budget is not budget:
+                budget.merge(result.budget)
+        groups = {k: g for k, g in groups.items() if k not in budget.incomplete}
+
+    response = ProcessTextResponse(
+        sections=sections,
+        sentences=sentences,
+        suggestions=filter_out_covered([s for group in groups.values() for s in group]),
+    )
+    return response if budget is None else budget.response(response)
@@ -0,0 +1,184 @@
+import numpy as np
+from typing import Dict, List
+from spacy.tokens.doc import Doc
+from textabstractor.dataclasses import (
+    ProcessTextResponse,
+    SectionSpan,
+    SentenceSpan,
+    Suggestion,
+)
+from clinspacy.extract import get_relations
+from clinspacy.match import get_attrs
+
+TYPES = ["name", "value"]
+ASSERTIONS = ["present", "absent"]
+
+
+# --------------------------------------------------------------------------------------------------
+class TextColumns:
+    """
+    Columnar alternative to `ProcessTextResponse` for bulk consumers. Suggestions are kept
+    as parallel arrays, with predicates and values stored as ids into small lookup tables
+    and type and assertion as codes into `TYPES` and `ASSERTIONS`. Ends are inclusive,
+    as in `Suggestion` and `SentenceSpan`.
+    """
+
+    def __init__(
+        self,
+        sections: List[SectionSpan],
+        sentence_begins: np.ndarray,
+        sentence_ends: np.ndarray,
+        begins: np.ndarray,
+        ends: np.ndarray,
+        predicate_ids: np.ndarray,
+        value_ids: np.ndarray,
+        types: np.ndarray,
+        assertions: np.ndarray,
+        predicates: List[str],
+        values: List[str],
+    ):
+        self.sections = sections
+        self.sentence_begins = sentence_begins
+        self.sentence_ends = sentence_ends
+        self.begins = begins
+        self.ends = ends
+        self.predicate_ids = predicate_ids
+        self.value_ids = value_ids
+        self.types = types
+        self.assertions = assertions
+        self.predicates = predicates
+        self.values = values
+
+    def __len__(self):
+        return len(self.begins)
+
+    def select(self, mask: np.ndarray) -> "TextColumns":
+        return TextColumns(
+            self.sections,
+            self.sentence_begins,
+            self.sentence_ends,
+            self.begins[mask],
+            self.ends[mask],
+            self.predicate_ids[mask],
+            self.value_ids[mask],
+            self.types[mask],
+            self.assertions[mask],
+            self.predicates,
+            self.values,
+        )
+
+    def filter_out_covered(self) -> "TextColumns":
+        return self.select(~covered_mask(self.begins, self.ends))
+
+    def to_suggestions(self) -> List[Suggestion]:
+        return [
+            Suggestion(
+                predicate=self.predicates[p],
+                begin=b,
+                end=e,
+                type=TYPES[t],
+                value=self.values[v],
+                assertion=ASSERTIONS[a],
+            )
+            for b, e, p, v, t, a in zip(
+                self.begins.tolist(),
+                self.ends.tolist(),
+                self.predicate_ids.tolist(),
+                self.value_ids.tolist(),
+                self.types.tolist(),
+                self.assertions.tolist(),
+            )
+        ]
+
+    def to_sentences(self) -> List[SentenceSpan]:
+        return [
+            SentenceSpan(sentence_number=idx, begin=b, end=e)
+            for idx, (b, e) in enumerate(
+                zip(self.sentence_begins.tolist(), self.sentence_ends.tolist())
+            )
+        ]
+
+    def to_response(self) -> ProcessTextResponse:
+        return ProcessTextResponse(
+            sections=self.sections,
+            sentences=self.to_sentences(),
+            suggestions=self.to_suggestions(),
+        )
+
+
+# --------------------------------------------------------------------------------------------------
+def covered_mask(begins: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Columnar equivalent of `abstract.filter_out_covered`: marks every interval that lies
+    within a longer one.
+    :param begins:
+    :param ends:
+    :return: boolean mask, True for covered intervals
+    """
+    n = len(begins)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    # sorted by begin and then longest first, any interval covering another one comes
+    # before it, and identical intervals (which never cover each other) are adjacent
+    order = np.lexsort((-ends, begins))
+    b, e = begins[order], ends[order]
+    first = np.ones(n, dtype=bool)
+    first[1:] = (b[1:] != b[:-1]) | (e[1:] != e[:-1])
+    group_start = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+    max_end = np.maximum.accumulate(e)
+    prior_end = np.where(group_start > 0, max_end[group_start - 1], -1)
+    mask = np.empty(n, dtype=bool)
+    mask[order] = prior_end >= e
+    return mask
+
+
+# --------------------------------------------------------------------------------------------------
+def extract_columns(doc: Doc, sections: List[SectionSpan]) -> TextColumns:
+    sentence_begins, sentence_ends = [], []
+    for sent in doc.sents:
+        sentence_begins.append(sent.start_char)
+        sentence_ends.append(sent.end_char - 1)
+
+    predicates: Dict[str, int] = {}
+    values: Dict[str, int] = {}
+    begins, ends, predicate_ids, value_ids, types, assertions = [], [], [], [], [], []
+    value_type = TYPES.index("value")
+    for _, span_group in doc.spans.items():
+        attrs = get_attrs(span_group)
+        rule_type = attrs.get("rule_type", None)
+        if rule_type not in TYPES:
+            continue
+        predicate_id = predicates.setdefault(attrs["predicate"], len(predicates))
+        value_id = values.setdefault(attrs["value"], len(values))
+        type_id = TYPES.index(rule_type)
+        relations = get_relations(span_group)
+        for idx, span in enumerate(span_group):
+            # suggestions for name and stand-alone value matches
+            begins.append(span.start_char)
+            ends.append(span.end_char - 1)
+            predicate_ids.append(predicate_id)
+            value_ids.append(value_id)
+            types.append(type_id)
+            assertions.append(1 if span._.negated else 0)
+            # suggestions for value matches corresponding to name matches
+            for value_span in relations.get(idx, []):
+                begins.append(value_span.start_char)
+                ends.append(value_span.end_char - 1)
+                predicate_ids.append(predicate_id)
+                value_ids.append(values.setdefault(value_span.label_, len(values)))
+                types.append(value_type)
+                assertions.append(0)
+
+    return TextColumns(
+        sections,
+        np.array(sentence_begins, dtype=np.int64),
+        np.array(sentence_ends, dtype=np.int64),
+        np.array(begins, dtype=np.int64),
+        np.array(ends, dtype=np.int64),
+        np.array(predicate_ids, dtype=np.int32),
+        np.array(value_ids, dtype=np.int32),
+        np.array(types, dtype=np.uint8),
+        np.array(assertions, dtype=np.uint8),
+        list(predicates),
+        list(values),
+    )
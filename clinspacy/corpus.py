@@ -0,0 +1,164 @@
+import json
+import mmap
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# byte ranges of a note's text, id and metadata in their blobs
+INDEX_DTYPE = np.dtype(
+    [
+        ("begin", "<i8"),
+        ("end", "<i8"),
+        ("id_begin", "<i8"),
+        ("id_end", "<i8"),
+        ("meta_begin", "<i8"),
+        ("meta_end", "<i8"),
+    ]
+)
+BLOBS = ["text", "ids", "meta"]
+INDEX = "index.npy"
+
+
+# --------------------------------------------------------------------------------------------------
+def is_corpus(path: Union[str, Path]) -> bool:
+    return (Path(path) / INDEX).exists()
+
+
+# --------------------------------------------------------------------------------------------------
+class Corpus:
+    """
+    Read side of a corpus directory: the UTF-8 note texts, ids and JSON metadata
+    concatenated into `text.bin`, `ids.bin` and `meta.bin`, and `index.npy` with the
+    byte range of every note in each. Blobs and index are memory-mapped, so opening a
+    corpus reads nothing, a note is decoded when it is accessed, and processes that
+    open the same corpus share its pages. A corpus pickles as its path, to be reopened
+    in worker processes.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.index = np.load(self.path / INDEX, mmap_mode="r")
+        self.blobs: Dict[str, Union[mmap.mmap, bytes]] = {}
+        for blob in BLOBS:
+            with open(self.path / f"{blob}.bin", "rb") as f:
+                # an empty file cannot be mapped
+                size = f.seek(0, 2)
+                self.blobs[blob] = (
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+                )
+
+    def __reduce__(self):
+        return Corpus, (self.path,)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        return self.note_id(i), self.text(i)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return self.notes(0, len(self))
+
+    def _slice(self, blob: str, begin: int, end: int) -> str:
+        return self.blobs[blob][begin:end].decode("utf-8")
+
+    def text(self, i: int) -> str:
+        row = self.index[i]
+        return self._slice("text", row["begin"], row["end"])
+
+    def note_id(self, i: int) -> str:
+        row = self.index[i]
+        return self._slice("ids", row["id_begin"], row["id_end"])
+
+    def metadata(self, i: int) -> Dict:
+        row = self.index[i]
+        return json.loads(self._slice("meta", row["meta_begin"], row["meta_end"]))
+
+    def lengths(self) -> np.ndarray:
+        """Byte lengths of the note texts, from the index alone."""
+        return self.index["end"] - self.index["begin"]
+
+    def notes(self, start: int, stop: int) -> Iterator[Tuple[str, str]]:
+        for i in range(start, min(stop, len(self))):
+            yield self[i]
+
+    def ranges(self, size: int) -> List[range]:
+        """Disjoint index ranges of `size` notes, to hand out to workers."""
+        return [range(i, min(i + size, len(self))) for i in range(0, len(self), size)]
+
+
+# --------------------------------------------------------------------------------------------------
+class CorpusWriter:
+    """
+    Write side of `Corpus`, streaming notes into the blobs of `path`. The index is
+    written last, on `close`, so a directory is only a corpus once complete.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / INDEX).unlink(missing_ok=True)
+        self.files = {blob: open(self.path / f"{blob}.bin", "wb") for blob in BLOBS}
+        self.offsets = {blob: 0 for blob in BLOBS}
+        self.rows: List[Tuple[int, ...]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, blob: str, data: bytes) -> Tuple[int, int]:
+        begin = self.offsets[blob]
+        self.files[blob].write(data)
+        self.offsets[blob] += len(data)
+        return begin, self.offsets[blob]
+
+    def add(self, note_id: str, text: str, metadata: Optional[Dict] = None):
+        self.rows.append(
+            self._write("text", text.encode("utf-8"))
+            + self._write("ids", str(note_id).encode("utf-8"))
+            + self._write("meta", json.dumps(metadata or {}).encode("utf-8"))
+        )
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        np.save(self.path / INDEX, np.array(self.rows, dtype=INDEX_DTYPE))
+
+
+# --------------------------------------------------------------------------------------------------
+def read_text_files(directory: Union[str, Path]) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    `(note id, text, metadata)` of the `*.txt` files under `directory`, in name order,
+    the note id being the file name without the suffix.
+    """
+    directory = Path(directory)
+    for path in sorted(directory.rglob("*.txt")):
+        yield path.stem, path.read_text(), {"path": str(path.relative_to(directory))}
+
+
+def convert(notes: Iterable[Tuple[str, str, Dict]], path: Union[str, Path]) -> Corpus:
+    with CorpusWriter(path) as writer:
+        for note_id, text, metadata in notes:
+            writer.add(note_id, text, metadata)
+    return Corpus(path)
+
+
+# --------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Convert directories of .txt notes into a corpus directory"
+    )
+    parser.add_argument("directories", nargs="+", help="directories of .txt notes")
+    parser.add_argument("--output", required=True, help="corpus directory")
+    args = parser.parse_args(argv)
+    corpus = convert(
+        (note for d in args.directories for note in read_text_files(d)), args.output
+    )
+    print(json.dumps({"notes": len(corpus), "bytes": int(corpus.lengths().sum())}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import argparse
+from pathlib import Path
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+from textabstractor.dataclasses import AbstractionSchemaMetaData, SuggestRequest
+from clinspacy import abstract
+from clinspacy.abstract import TextAbstractor
+from clinspacy.match import pattern_anchor
+
+# token operators that make a pattern token optional, each doubling the token sequences
+# the Matcher tries from every start
+OPTIONAL_OPS = ["?", "*"]
+
+
+# --------------------------------------------------------------------------------------------------
+def is_regex(value) -> bool:
+    return isinstance(value, dict) and "REGEX" in value
+
+
+def pattern_stats(patterns: List[List[Dict]]) -> Dict:
+    """
+    Cost indicators of a list of Matcher token patterns.
+    :return: `patterns` and `tokens` counts, `optional` tokens and their share of all
+    tokens, `regex` tokens, `unanchored` patterns, that the prefilter cannot narrow down
+    to candidate regions so they run over the whole doc, `branches`, the token
+    sequences the optional operators expand to, and the `longest` pattern
+    """
+    tokens = optional = regex = unanchored = branches = longest = 0
+    for pattern in patterns:
+        n_optional = sum(1 for t in pattern if t.get("OP") in OPTIONAL_OPS)
+        tokens += len(pattern)
+        optional += n_optional
+        regex += sum(1 for t in pattern if any(is_regex(v) for v in t.values()))
+        unanchored += pattern_anchor(pattern) is None
+        branches += 2**n_optional
+        longest = max(longest, len(pattern))
+    return {
+        "patterns": len(patterns),
+        "tokens": tokens,
+        "optional": optional,
+        "optional_density": optional / tokens if tokens else 0.0,
+        "regex": regex,
+        "unanchored": unanchored,
+        "branches": branches,
+        "longest": longest,
+    }
+
+
+# --------------------------------------------------------------------------------------------------
+def schema_cost(name_patterns: Dict, value_patterns: List[Dict]) -> Dict:
+    """
+    Cost indicators of a schema compiled by `parse_schema`, over its name and value
+    patterns. Number and date values are matched from token types, not by the Matcher,
+    and only counted as `typed`.
+    """
+    matched = [vp for vp in value_patterns if "value_type" not in vp]
+    patterns = name_patterns.get("patterns", []) + [
+        p for vp in matched for p in vp["patterns"]
+    ]
+    predicate = name_patterns.get("predicate") or next(
+        (vp["predicate"] for vp in value_patterns), None
+    )
+    return {
+        "predicate": predicate,
+        "names": len(name_patterns.get("patterns", [])),
+        "values": len(value_patterns),
+        "typed": len(value_patterns) - len(matched),
+        **pattern_stats(patterns),
+    }
+
+
+# --------------------------------------------------------------------------------------------------
+def analyze(
+    schema_metadatas: List[AbstractionSchemaMetaData],
+    abstractor: Optional[TextAbstractor] = None,
+) -> List[Dict]:
+    """
+    Cost indicators of every schema, compiled or taken from the schema cache as for a
+    request, costliest first by `branches`, then `regex` and `patterns`.
+    """
+    abstractor = abstractor or TextAbstractor(abstract.pipeline_path)
+    abstract.prefetch_schemas(abstractor, schema_metadatas)
+    reports = []
+    for m in schema_metadatas:
+        name_patterns, value_patterns = abstract.get_schema_patterns(abstractor, m)
+        report = schema_cost(name_patterns, value_patterns)
+        report["schema_uri"] = m.abstractor_abstraction_schema_uri
+        reports.append(report)
+    return sorted(
+        reports, key=lambda r: (r["branches"], r["regex"], r["patterns"]), reverse=True
+    )
+
+
+# --------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Report the pattern cost of the schemas of a request"
+    )
+    parser.add_argument(
+        "--request",
+        help="SuggestRequest JSON file, request.json of the fixtures if unset",
+    )
+    parser.add_argument(
+        "--fixtures", help="schema JSON dir or package, the schema service if unset"
+    )
+    args = parser.parse_args(argv)
+    if not args.request and not args.fixtures:
+        parser.error("--request is required without --fixtures")
+
+    service = None
+    if args.fixtures:
+        from clinspacy.loadtest import SchemaService
+
+        service = SchemaService(args.fixtures)
+    if args.request:
+        request_json = Path(args.request).read_text()
+    else:
+        request_json = service.fixtures.joinpath("request.json").read_text()
+    request = SuggestRequest(**json.loads(request_json))
+    with service.installed() if service else nullcontext():
+        for report in analyze(request.abstractor_abstraction_schemas):
+            print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
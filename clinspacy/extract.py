@@ -1,71 +1,149 @@
+import threading
+import numpy as np
+from bisect import bisect_right
+from collections import OrderedDict
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
 from spacy.language import Language
-from spacy.tokens import Span, SpanGroup
-from clinspacy.match import SpanMatcher
+from spacy.tokens import Doc, Span, SpanGroup
+from clinspacy.match import SpanMatcher, add_schema_time, get_attrs, over_budget
 
+# name rulesets whose value matchers a RelationExtractor keeps, the least recently used
+# dropped first, so that the matchers of replaced schema versions do not pile up
+MAX_VALUE_MATCHERS = 256
 
-@Language.factory("relextractor")
+
+# --------------------------------------------------------------------------------------------------
+def set_relations(
+    name_group: SpanGroup, relations: List[Tuple[int, int, int]], labels: List[str]
+):
+    """
+    Store the values related to the spans of `name_group` in its attrs, as rows of
+    (index of the span in the group, value start, value end) and the value labels.
+    """
+    name_group.attrs["relations"] = np.array(relations, dtype=np.int32).reshape(-1, 3)
+    name_group.attrs["labels"] = labels
+
+
+def get_relations(name_group: SpanGroup) -> Dict[int, List[Span]]:
+    """
+    Value spans related to the spans of `name_group`, by the index of the span in the
+    group.
+    """
+    relations = {}
+    doc = name_group.doc
+    rows = name_group.attrs.get("relations", [])
+    for (idx, start, end), label in zip(rows, name_group.attrs.get("labels", [])):
+        relations.setdefault(int(idx), []).append(
+            Span(doc, int(start), int(end), label=label)
+        )
+    return relations
+
+
+# --------------------------------------------------------------------------------------------------
+@Language.factory("relextractor", default_config={"value_window": 100})
 class RelationExtractor:
-    def __init__(self, nlp: Language, name: str):
+    """
+    Relates the values of a name schema to its name spans, searching the sentence on the
+    right of each span, then on its left, up to `value_window` tokens away, None for the
+    whole sentence.
+    """
+
+    def __init__(self, nlp: Language, name: str, value_window: Optional[int]):
         self._name = name
+        self.value_window = value_window
+        # value matchers by the ruleset id of their name group, a bounded LRU
+        self.value_matchers: "OrderedDict[str, List[SpanMatcher]]" = OrderedDict()
+        self._lock = threading.Lock()
 
     @property
     def name(self):
         return self._name
 
-    def __call__(self, doc):
-        for name_group, value_patterns in [
-            (group, group.attrs["value_patterns"])
-            for _, group in doc.spans.items()
-            if group.attrs.get("rule_type", "") == "name"
-        ]:
-            name_group.attrs["value_map"] = {}
-            for vp in value_patterns:
-                span_matcher = SpanMatcher(vp["predicate"], vp)
-                for span in name_group:
-                    # look for values on the right side of the span
-                    right_span = doc[span.end : span.sent.end]
-                    right_span_as_doc = right_span.as_doc()
-                    value_group = span_matcher.match(
-                        right_span_as_doc, keep_longest=True
-                    )
-                    if len(value_group) > 0:
-                        group = name_group.attrs["value_map"].get(
-                            span, SpanGroup(doc, spans=[])
-                        )
-                        for idx, s in enumerate(value_group):
-                            group.append(
-                                Span(
-                                    doc,
-                                    right_span.start + s.start,
-                                    right_span.start + s.end,
-                                    label=s.text
-                                    if vp["value"] in ["date", "number"]
-                                    else vp["value"],
-                                )
-                            )
-                        name_group.attrs["value_map"][span] = group
+    def get_value_matchers(self, name_group: SpanGroup) -> List[SpanMatcher]:
+        ruleset_id = name_group.attrs["ruleset"]
+        with self._lock:
+            matchers = self.value_matchers.get(ruleset_id)
+            if matchers is not None:
+                self.value_matchers.move_to_end(ruleset_id)
+                return matchers
+        matchers = [
+            SpanMatcher(vp["predicate"], vp)
+            for vp in get_attrs(name_group)["value_patterns"]
+        ]
+        with self._lock:
+            self.value_matchers[ruleset_id] = matchers
+            while len(self.value_matchers) > MAX_VALUE_MATCHERS:
+                self.value_matchers.popitem(last=False)
+        return matchers
+
+    def contexts(
+        self, doc: Doc, span: Span, sent_bounds: Tuple[int, int]
+    ) -> List[Tuple[Span, Doc]]:
+        """
+        The spans, and their docs, to look for values of `span` in: on its right side
+        within its sentence, then on its left, clipped to `value_window`.
+        """
+        start, end = sent_bounds
+        if self.value_window is not None:
+            start = max(start, span.start - self.value_window)
+            end = min(end, span.end + self.value_window)
+        return [
+            (context, context.as_doc())
+            for context in [doc[span.end : end], doc[start : span.start]]
+        ]
 
-                    # look for values on the left side of the span
-                    left_span = doc[span.sent.start : span.start]
-                    left_span_as_doc = left_span.as_doc()
-                    value_group = span_matcher.match(
-                        left_span_as_doc, keep_longest=True
-                    )
-                    if len(value_group) > 0:
-                        group = name_group.attrs["value_map"].get(
-                            span, SpanGroup(doc, spans=[])
+    def __call__(self, doc):
+        name_groups = [
+            (key, group)
+            for key, group in doc.spans.items()
+            if get_attrs(group).get("rule_type", "") == "name"
+        ]
+        if not name_groups:
+            return doc
+        sents = [(sent.start, sent.end) for sent in doc.sents]
+        sent_starts = [start for start, _ in sents]
+        timed = doc._.schema_times is not None
+        for group_idx, (_, name_group) in enumerate(name_groups):
+            began = perf_counter() if timed else 0.0
+            # contexts of each span, shared by the value matchers
+            contexts: Dict[int, List[Tuple[Span, Doc]]] = {}
+            # rows grouped by span, in the order values were found for it
+            relations: Dict[int, List[Tuple[int, int, int, str]]] = {}
+            for span_matcher in self.get_value_matchers(name_group):
+                vp = span_matcher.patterns
+                for idx, span in enumerate(name_group):
+                    budget = over_budget(doc)
+                    if budget is not None:
+                        # this and later name groups are left without relations
+                        budget.truncate(
+                            self.name, [key for key, _ in name_groups[group_idx:]]
                         )
-                        for idx, s in enumerate(value_group):
-                            group.append(
-                                Span(
-                                    doc,
-                                    left_span.start + s.start,
-                                    left_span.start + s.end,
-                                    label=s.text
-                                    if vp["value"] in ["date", "number"]
-                                    else vp["value"],
+                        return doc
+                    if idx not in contexts:
+                        sent = sents[bisect_right(sent_starts, span.start) - 1]
+                        contexts[idx] = self.contexts(doc, span, sent)
+                    for context, context_doc in contexts[idx]:
+                        value_group = span_matcher.match(context_doc, keep_longest=True)
+                        for s in value_group:
+                            relations.setdefault(idx, []).append(
+                                (
+                                    idx,
+                                    context.start + s.start,
+                                    context.start + s.end,
+                                    (
+                                        s.text
+                                        if vp["value"] in ["date", "number"]
+                                        else vp["value"]
+                                    ),
                                 )
                             )
-                        name_group.attrs["value_map"][span] = group
+            rows = [row for idx in sorted(relations) for row in relations[idx]]
+            set_relations(
+                name_group, [row[:3] for row in rows], [row[3] for row in rows]
+            )
+            if timed:
+                predicate = get_attrs(name_group)["predicate"]
+                add_schema_time(doc, self.name, predicate, perf_counter() - began)
 
         return doc
@@ -0,0 +1,126 @@
+import hashlib
+from typing import Dict, List, MutableMapping, Optional
+from spacy.tokens.doc import Doc
+from textabstractor.dataclasses import (
+    AbstractionSchemaMetaData,
+    ProcessTextResponse,
+    SuggestRequest,
+    Suggestion,
+)
+from clinspacy import abstract
+from clinspacy.abstract import (
+    MATCH_PIPES,
+    TextAbstractor,
+    add_schema,
+    add_sections,
+    extract_sections,
+    extract_sentences,
+    extract_suggestion_groups,
+    filter_out_covered,
+    get_schema_key,
+)
+from clinspacy.recycle import AbstractorPool
+
+
+# --------------------------------------------------------------------------------------------------
+class IncrementalAbstractor:
+    """
+    Reprocesses notes schema by schema. For every note id the store keeps the tokenized,
+    sentence-split, sectioned and lemmatized doc, plus each schema's suggestions along
+    with the schema's `updated_at`. When a schema changes only its matching, negation
+    and relation steps re-run against the stored doc, and the results are merged with
+    the other schemas' stored suggestions in request order, the same way `process_text`
+    collects span groups.
+
+    `store` can be any mutable mapping, e.g. a `shelve` for results that outlive the
+    process; records are reassigned after every update so such stores see the change.
+    The pipeline is rebuilt between notes once it has processed `max_docs` notes or
+    interned `max_strings` new strings, see `AbstractorPool`; stored docs carry their
+    own strings, so they load into the new vocab.
+    """
+
+    def __init__(
+        self,
+        abstractor: Optional[TextAbstractor] = None,
+        store: Optional[MutableMapping] = None,
+        max_docs: Optional[int] = None,
+        max_strings: Optional[int] = None,
+    ):
+        self.pool = AbstractorPool(
+            abstract.recycle_docs if max_docs is None else max_docs,
+            abstract.recycle_strings if max_strings is None else max_strings,
+            abstractor=abstractor,
+        )
+        self.abstractor: Optional[TextAbstractor] = None
+        self.store = {} if store is None else store
+
+    @staticmethod
+    def text_key(request: SuggestRequest) -> str:
+        digest = hashlib.sha1(request.text.encode("utf-8"))
+        for section in request.abstractor_sections:
+            digest.update(repr(section).encode("utf-8"))
+        return digest.hexdigest()
+
+    def tokenize(self, request: SuggestRequest) -> Doc:
+        self.abstractor.clear()
+        add_sections(self.abstractor, request)
+        with self.abstractor.nlp.select_pipes(disable=MATCH_PIPES):
+            return self.abstractor.nlp(request.text)
+
+    def match_schema(
+        self, doc_bytes: bytes, schema_metadata: AbstractionSchemaMetaData
+    ) -> Dict[str, List[Suggestion]]:
+        doc = Doc(self.abstractor.nlp.vocab).from_bytes(doc_bytes)
+        self.abstractor.span_ruler.clear()
+        add_schema(self.abstractor, schema_metadata)
+        for name in MATCH_PIPES:
+            doc = self.abstractor.nlp.get_pipe(name)(doc)
+        return extract_suggestion_groups(doc)
+
+    def process_text(
+        self, note_id: str, request: SuggestRequest
+    ) -> ProcessTextResponse:
+        # the pool only swaps the pipeline between notes
+        with self.pool.acquire() as abstractor:
+            self.abstractor = abstractor
+            return self._process_text(note_id, request)
+
+    def _process_text(
+        self, note_id: str, request: SuggestRequest
+    ) -> ProcessTextResponse:
+        key = IncrementalAbstractor.text_key(request)
+        record = self.store.get(note_id)
+        if record is None or record["key"] != key:
+            doc = self.tokenize(request)
+            record = {
+                "key": key,
+                "doc": doc.to_bytes(),
+                "sections": extract_sections(doc),
+                "sentences": extract_sentences(doc),
+                "schemas": {},
+            }
+
+        groups: Dict[str, List[Suggestion]] = {}
+        schemas = {}
+        for schema_metadata in request.abstractor_abstraction_schemas:
+            skey = get_schema_key(schema_metadata)
+            updated_at, schema_groups = record["schemas"].get(skey, (None, None))
+            if updated_at is None or schema_metadata.updated_at > updated_at:
+                cached = abstract.schema_cache.get(skey)
+                schema_groups = self.match_schema(record["doc"], schema_metadata)
+                # the refresher serves stale patterns, matched again once refreshed
+                updated_at = schema_metadata.updated_at
+                if cached is not None and abstract.schema_refresher is not None:
+                    updated_at = min(updated_at, cached[0].updated_at)
+            schemas[skey] = (updated_at, schema_groups)
+            groups.update(schema_groups)
+        record["schemas"] = schemas
+        self.store[note_id] = record
+
+        return ProcessTextResponse(
+            sections=record["sections"],
+            sentences=record["sentences"],
+            suggestions=filter_out_covered(
+                [s for group in groups.values() for s in group]
+            ),
+        )
@@ -0,0 +1,277 @@
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+import textabstractor
+from pathlib import Path
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.resources import files
+from typing import Dict, Iterator, List, Optional, Union
+from textabstractor.dataclasses import (
+    AbstractionSchema,
+    AbstractionSchemaMetaData,
+    SuggestRequest,
+)
+from clinspacy import abstract
+
+SCENARIOS = ["cold", "warm", "churn"]
+
+
+# --------------------------------------------------------------------------------------------------
+class SchemaServiceError(ConnectionError):
+    pass
+
+
+# --------------------------------------------------------------------------------------------------
+class SchemaService:
+    """
+    Local stand-in for the remote schema service. Serves `<schema id>.json` fixtures, in
+    the service's `{"abstractor_abstraction_schema": {...}}` format, from a directory or
+    a package such as `textabstractor_testdata.breast`. Every fetch sleeps `latency`
+    seconds plus up to `jitter` more, and fails with `SchemaServiceError` at
+    `failure_rate`.
+    """
+
+    def __init__(
+        self,
+        fixtures: Union[str, Path],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+    ):
+        path = Path(fixtures)
+        self.fixtures = path if path.is_dir() else files(str(fixtures))
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.fetches = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def fetch_json(self, schema_id: Union[int, str]) -> Dict:
+        with self._lock:
+            self.fetches += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise SchemaServiceError(f"schema {schema_id} unavailable")
+        return json.loads(self.fixtures.joinpath(f"{schema_id}.json").read_text())
+
+    def get_abstraction_schema(
+        self, schema_metadata: AbstractionSchemaMetaData
+    ) -> AbstractionSchema:
+        json_dict = self.fetch_json(schema_metadata.abstractor_abstraction_schema_id)
+        return AbstractionSchema(**json_dict["abstractor_abstraction_schema"])
+
+    @contextmanager
+    def installed(self) -> Iterator["SchemaService"]:
+        """Serve `get_abstraction_schema` calls from this stand-in."""
+        original = textabstractor.textabstract.get_abstraction_schema
+        textabstractor.textabstract.get_abstraction_schema = self.get_abstraction_schema
+        try:
+            yield self
+        finally:
+            textabstractor.textabstract.get_abstraction_schema = original
+
+    @contextmanager
+    def serving(self, port: int = 0) -> Iterator[str]:
+        """
+        Serve the fixtures over HTTP on localhost, at `<base url>/<schema id>.json`.
+        :param port: 0 picks a free port
+        :return: the base url
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    body = json.dumps(service.fetch_json(Path(self.path).stem))
+                except SchemaServiceError as e:
+                    self.send_error(503, str(e))
+                    return
+                except FileNotFoundError:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body.encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{server.server_address[1]}"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+# --------------------------------------------------------------------------------------------------
+class LoadTestResult:
+    def __init__(
+        self,
+        scenario: str,
+        latencies: List[float],
+        errors: int,
+        elapsed: float,
+        fetches: int,
+    ):
+        self.scenario = scenario
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.fetches = fetches
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        idx = min(int(p / 100 * len(self.latencies)), len(self.latencies) - 1)
+        return self.latencies[idx]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "scenario": self.scenario,
+            "requests": len(self.latencies) + self.errors,
+            "errors": self.errors,
+            "schema_fetches": self.fetches,
+            "throughput": self.throughput,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+# --------------------------------------------------------------------------------------------------
+def clear_schema_cache():
+    abstract.schema_cache.clear()
+    abstract.schema_hashes.clear()
+
+
+# --------------------------------------------------------------------------------------------------
+def cached_updated_at(schema_metadata: AbstractionSchemaMetaData) -> datetime:
+    key = abstract.get_schema_key(schema_metadata)
+    if key in abstract.schema_cache:
+        return abstract.schema_cache[key][0].updated_at
+    return schema_metadata.updated_at
+
+
+def churn(request: SuggestRequest, count: int) -> SuggestRequest:
+    """Copy of `request` with `count` of its schemas updated since they were cached."""
+    request = copy.deepcopy(request)
+    schemas = request.abstractor_abstraction_schemas
+    for m in random.sample(schemas, min(count, len(schemas))):
+        m.updated_at = max(m.updated_at, cached_updated_at(m)) + timedelta(seconds=1)
+    return request
+
+
+# --------------------------------------------------------------------------------------------------
+def run_scenario(
+    scenario: str,
+    requests: List[SuggestRequest],
+    service: SchemaService,
+    concurrency: int = 4,
+    churn_schemas: int = 1,
+) -> LoadTestResult:
+    """
+    Replay `requests` through `process_text` from `concurrency` threads, with schemas
+    fetched from `service`.
+    :param scenario: "cold" starts from an empty schema cache, "warm" from one primed
+    with every schema, and "churn" from a primed cache with `churn_schemas` schemas of
+    every request updated, so that they are fetched and compiled again
+    :param requests:
+    :param service:
+    :param concurrency:
+    :param churn_schemas:
+    :return:
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"unknown scenario: {scenario}")
+    with service.installed():
+        clear_schema_cache()
+        if scenario in ["warm", "churn"]:
+            # the cache is primed without failures, which only the timed requests see
+            failure_rate, service.failure_rate = service.failure_rate, 0.0
+            try:
+                abstractor = abstract.TextAbstractor(abstract.pipeline_path)
+                for request in requests:
+                    for m in request.abstractor_abstraction_schemas:
+                        abstract.get_schema_patterns(abstractor, m)
+            finally:
+                service.failure_rate = failure_rate
+        fetches = service.fetches
+
+        def timed(request: SuggestRequest) -> Optional[float]:
+            if scenario == "churn":
+                request = churn(request, churn_schemas)
+            start = time.perf_counter()
+            try:
+                abstract.process_text(request)
+            except SchemaServiceError:
+                return None
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(timed, requests))
+        elapsed = time.perf_counter() - start
+
+    return LoadTestResult(
+        scenario,
+        [t for t in latencies if t is not None],
+        sum(1 for t in latencies if t is None),
+        elapsed,
+        service.fetches - fetches,
+    )
+
+
+# --------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Load test process_text against a local schema service"
+    )
+    parser.add_argument("texts", nargs="+", help="note text files to replay")
+    parser.add_argument("--fixtures", required=True, help="schema JSON dir or package")
+    parser.add_argument(
+        "--request",
+        help="SuggestRequest JSON file, request.json of the fixtures if unset",
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    args = parser.parse_args(argv)
+
+    service = SchemaService(args.fixtures, args.latency, args.jitter, args.failure_rate)
+    if args.request:
+        request_json = Path(args.request).read_text()
+    else:
+        request_json = service.fixtures.joinpath("request.json").read_text()
+    base = SuggestRequest(**json.loads(request_json))
+    texts = [Path(t).read_text() for t in args.texts]
+    requests = []
+    for i in range(args.requests):
+        request = copy.deepcopy(base)
+        request.text = texts[i % len(texts)]
+        requests.append(request)
+    for scenario in args.scenario or SCENARIOS:
+        result = run_scenario(scenario, requests, service, args.concurrency)
+        print(json.dumps(result.to_dict()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,47 @@
-from typing import List, Dict
+import json
+import weakref
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from time import perf_counter
+from typing import Iterator, List, Dict, Mapping, Optional, Set, Tuple
+from spacy.attrs import LEMMA, LOWER, ORTH
 from spacy.language import Language
 from spacy.matcher import Matcher
 from spacy.tokens import Span, SpanGroup
 from spacy.tokens.doc import Doc
+from spacy.strings import get_string_id
+from clinspacy.tag import match_value_type
+
+# token attributes that can anchor a pattern, by their column in `token_array`
+TOKEN_ATTRS = [ORTH, LOWER, LEMMA]
+ANCHOR_COLUMNS = {"ORTH": 0, "TEXT": 0, "LOWER": 1, "LEMMA": 2}
+
+# read-only metadata of the span groups of every SpanMatcher, by ruleset id, shared by
+# all docs: span groups only carry the id in their attrs. An entry lives as long as a
+# matcher or a doc with groups of it holds it
+rulesets: "weakref.WeakValueDictionary[str, Ruleset]" = weakref.WeakValueDictionary()
+# rulesets of the span groups of a doc, held for as long as the doc lives
+doc_rulesets: "weakref.WeakKeyDictionary[Doc, Dict[str, Ruleset]]" = (
+    weakref.WeakKeyDictionary()
+)
+# rulesets of the pattern dicts they were computed from, by the identity of the dicts,
+# which are shared by all requests through the schema cache; a bounded LRU, and the
+# entries of a schema are dropped when the schema cache replaces it
+ruleset_ids: "OrderedDict[int, Tuple[Dict, Ruleset]]" = OrderedDict()
+RULESET_IDS_MAXSIZE = 1024
+ruleset_lock = threading.Lock()
+
+# the `clinspacy.budget.Budget` of a doc processed within a time budget
+if not Doc.has_extension("budget"):
+    Doc.set_extension("budget", default=None)
+
+# seconds spent on each schema predicate by each matching component, by predicate, for
+# docs of profiled requests; work done once for all schemas is under SHARED
+if not Doc.has_extension("schema_times"):
+    Doc.set_extension("schema_times", default=None)
+SHARED = "(shared)"
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -33,7 +72,9 @@ def covers(span1: Span, span2: Span, strict: bool = True) -> bool:
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def filter_covered(possible_covers: SpanGroup, spans: SpanGroup, strict: bool = True) -> SpanGroup:
+def filter_covered(
+    possible_covers: SpanGroup, spans: SpanGroup, strict: bool = True
+) -> SpanGroup:
     remove_indices = []
     for idx, span in enumerate(spans):
         for s in possible_covers:
@@ -48,11 +89,141 @@ def filter_covered(possible_covers: SpanGroup, spans: SpanGroup, strict: bool =
     return SpanGroup(spans.doc, spans=uncovered_spans)
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def token_array(doc: Doc) -> np.ndarray:
+    return doc.to_array(TOKEN_ATTRS)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def pattern_anchor(pattern: List[Dict]) -> Optional[Tuple[str, Set[str]]]:
+    """
+    Find a token that every match of `pattern` must contain.
+    :param pattern: spaCy Matcher token pattern
+    :return: the attribute of the first required token with a literal ORTH, TEXT, LOWER
+    or LEMMA value, and the values it may take; None if there is no such token
+    """
+    for token in pattern:
+        if token.get("OP", "+") != "+":
+            continue
+        for attr, value in token.items():
+            if attr not in ANCHOR_COLUMNS:
+                continue
+            if isinstance(value, str):
+                return attr, {value}
+            if isinstance(value, dict) and list(value) == ["IN"]:
+                return attr, set(value["IN"])
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def pattern_length(pattern: List[Dict]) -> Optional[int]:
+    """Most tokens a match of `pattern` can span, None if unbounded."""
+    if any(token.get("OP") not in [None, "?", "!"] for token in pattern):
+        return None
+    return len(pattern)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class Ruleset(Mapping):
+    """Read-only span group metadata, registered in `rulesets` under `id`."""
+
+    __slots__ = ("id", "_attrs", "__weakref__")
+
+    def __init__(self, ruleset_id: str, attrs: Dict):
+        self.id = ruleset_id
+        self._attrs = attrs
+
+    def __getitem__(self, key):
+        return self._attrs[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._attrs)
+
+    def __len__(self) -> int:
+        return len(self._attrs)
+
+
+def get_ruleset(patterns: Dict) -> Ruleset:
+    """
+    Register the span group metadata of `patterns`, everything but the token patterns,
+    under an id derived from its content, so that docs from other processes resolve it
+    too.
+    """
+    with ruleset_lock:
+        cached = ruleset_ids.get(id(patterns))
+        if cached is not None and cached[0] is patterns:
+            ruleset_ids.move_to_end(id(patterns))
+            return cached[1]
+    attrs = {k: v for k, v in patterns.items() if k not in ["patterns", "value_type"]}
+    compiled = json.dumps(attrs, sort_keys=True, default=str)
+    ruleset_id = hashlib.sha1(compiled.encode("utf-8")).hexdigest()[:16]
+    with ruleset_lock:
+        ruleset = rulesets.get(ruleset_id)
+        if ruleset is None:
+            ruleset = rulesets[ruleset_id] = Ruleset(ruleset_id, attrs)
+        ruleset_ids[id(patterns)] = (patterns, ruleset)
+        while len(ruleset_ids) > RULESET_IDS_MAXSIZE:
+            ruleset_ids.popitem(last=False)
+    return ruleset
+
+
+def get_ruleset_id(patterns: Dict) -> str:
+    return get_ruleset(patterns).id
+
+
+def hold_ruleset(doc: Doc, ruleset: Ruleset):
+    """Keep `ruleset` registered for as long as `doc` lives."""
+    with ruleset_lock:
+        held = doc_rulesets.get(doc)
+        if held is None:
+            held = doc_rulesets[doc] = {}
+        held[ruleset.id] = ruleset
+
+
+def forget_rulesets(patterns: List[Dict]):
+    """Drop the memoized rulesets of `patterns`, e.g. of a schema no longer cached."""
+    with ruleset_lock:
+        for p in patterns:
+            cached = ruleset_ids.get(id(p))
+            if cached is not None and cached[0] is p:
+                del ruleset_ids[id(p)]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def over_budget(doc: Doc):
+    """The time budget of `doc` if it has one and it is exceeded, else None."""
+    budget = doc._.budget
+    return budget if budget is not None and budget.exceeded() else None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def add_schema_time(doc: Doc, component: str, predicate: str, seconds: float):
+    """Attribute `seconds` of `component` to a schema in `doc._.schema_times`."""
+    times = doc._.schema_times.setdefault(predicate, {})
+    times[component] = times.get(component, 0.0) + seconds
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def get_attrs(group: SpanGroup) -> Mapping:
+    """
+    Metadata of a span group, resolved from its ruleset id if it has one. A ruleset no
+    longer registered, as for a doc from another process that no matcher here shares,
+    leaves the bare attrs.
+    """
+    ruleset_id = group.attrs.get("ruleset")
+    if ruleset_id is None:
+        return group.attrs
+    return rulesets.get(ruleset_id, group.attrs)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 class SpanMatcher:
     def __init__(self, name: str, patterns: Dict):
         self._name = name
         self._patterns = patterns
+        self._matcher = None
+        self._anchors = None
+        self._ruleset: Optional[Ruleset] = None
 
     @property
     def name(self):
@@ -62,6 +233,70 @@ class SpanMatcher:
     def patterns(self):
         return self._patterns
 
+    @property
+    def anchors(self) -> Optional[Dict[str, Set[str]]]:
+        """
+        Values by token attribute, one of which a doc must contain for any pattern to
+        match, or None if some pattern has no literal required token.
+        """
+        anchors = {}
+        for pattern in self.patterns["patterns"]:
+            anchor = pattern_anchor(pattern)
+            if anchor is None:
+                return None
+            anchors.setdefault(anchor[0], set()).update(anchor[1])
+        return anchors
+
+    def anchor_ids(self) -> Optional[Tuple[List[np.ndarray], Optional[int]]]:
+        if self._anchors is None:
+            anchors = self.anchors
+            if anchors is None:
+                self._anchors = (None, None)
+            else:
+                ids = [set() for _ in TOKEN_ATTRS]
+                for attr, values in anchors.items():
+                    ids[ANCHOR_COLUMNS[attr]].update(get_string_id(v) for v in values)
+                lengths = [pattern_length(p) for p in self.patterns["patterns"]]
+                length = None if None in lengths else max(lengths, default=0)
+                self._anchors = (
+                    [np.array(sorted(i), dtype=np.uint64) for i in ids],
+                    length,
+                )
+        return self._anchors
+
+    def candidate_regions(
+        self, doc: Doc, tokens: Optional[np.ndarray] = None
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        Prefilter: the token ranges of `doc` around anchor tokens, within which every
+        match must lie.
+        :param doc:
+        :param tokens: `token_array` of doc, if already computed
+        :return: sorted, disjoint (start, end) ranges, or None to match the whole doc
+        """
+        ids, length = self.anchor_ids()
+        if ids is None:
+            return None
+        if len(doc) == 0:
+            return []
+        if tokens is None:
+            tokens = token_array(doc)
+        hits = np.zeros(len(doc), dtype=bool)
+        for column, values in enumerate(ids):
+            if len(values) > 0:
+                hits |= np.isin(tokens[:, column], values)
+        positions = np.flatnonzero(hits).tolist()
+        if length is None:
+            return [(0, len(doc))] if positions else []
+        regions = []
+        for p in positions:
+            start, end = max(p - length + 1, 0), min(p + length, len(doc))
+            if regions and start < regions[-1][1]:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        return regions
+
     @staticmethod
     def keep_longest(group: SpanGroup) -> SpanGroup:
         if not group.has_overlap:
@@ -77,18 +312,50 @@ class SpanMatcher:
                 longest_spans.append(span)
         return SpanGroup(group.doc, spans=longest_spans, attrs=group.attrs)
 
-    def match(self, doc: Doc, keep_longest: bool = False) -> SpanGroup:
-        matcher = Matcher(doc.vocab)
-        matcher.add(self.name, self.patterns["patterns"])
-        matches = matcher(doc)
+    @property
+    def ruleset(self) -> str:
+        # held by the matcher, so that its span groups resolve while it is in use
+        if self._ruleset is None:
+            self._ruleset = get_ruleset(self.patterns)
+        return self._ruleset.id
+
+    @property
+    def attrs(self) -> Dict:
+        """Attrs of the span groups of matches."""
+        return {"ruleset": self.ruleset}
+
+    def matcher(self, vocab) -> Matcher:
+        # compiled once and reused for every doc sharing the vocab
+        if self._matcher is None or self._matcher.vocab is not vocab:
+            self._matcher = Matcher(vocab)
+            self._matcher.add(self.name, self.patterns["patterns"])
+        return self._matcher
+
+    def match(
+        self,
+        doc: Doc,
+        keep_longest: bool = False,
+        tokens: Optional[np.ndarray] = None,
+    ) -> SpanGroup:
+        if "value_type" in self.patterns:
+            # dates and numbers come from the token types tagged once per doc
+            matches = match_value_type(doc, self.patterns["value_type"])
+        else:
+            matcher = self.matcher(doc.vocab)
+            regions = self.candidate_regions(doc, tokens)
+            if regions is None:
+                matches = [(start, end) for _, start, end in matcher(doc)]
+            else:
+                matches = [
+                    (region_start + start, region_start + end)
+                    for region_start, region_end in regions
+                    for _, start, end in matcher(doc[region_start:region_end])
+                ]
         matched_spans = []
-        for match_id, start, end in matches:
+        for start, end in matches:
             matched_spans.append(Span(doc, start, end))
-        attrs = {}
-        for k, v in self.patterns.items():
-            if k not in ["patterns"]:
-                attrs[k] = v
-        group = SpanGroup(doc, spans=matched_spans, attrs=attrs)
+        group = SpanGroup(doc, spans=matched_spans, attrs=self.attrs)
+        hold_ruleset(doc, self._ruleset)
         return SpanMatcher.keep_longest(group) if keep_longest else group
 
 
@@ -109,8 +376,31 @@ class SpanRuler:
     def clear(self):
         self.matchers = []
 
-    def __call__(self, doc):
+    def anchors(self) -> Optional[Dict[str, Set[str]]]:
+        """
+        Values by token attribute, one of which a doc must contain for any pattern of
+        the ruleset to match, or None if some pattern has no literal required token.
+        """
+        anchors = {}
         for matcher in self.matchers:
-            group = matcher.match(doc, self.keep_longest)
+            if matcher.anchors is None:
+                return None
+            for attr, values in matcher.anchors.items():
+                anchors.setdefault(attr, set()).update(values)
+        return anchors
+
+    def __call__(self, doc):
+        tokens = token_array(doc) if len(doc) > 0 else None
+        timed = doc._.schema_times is not None
+        for idx, matcher in enumerate(self.matchers):
+            budget = over_budget(doc)
+            if budget is not None:
+                budget.truncate(self.name, [m.name for m in self.matchers[idx:]])
+                break
+            start = perf_counter() if timed else 0.0
+            group = matcher.match(doc, self.keep_longest, tokens)
             doc.spans[matcher.name] = group
+            if timed:
+                predicate = matcher.patterns["predicate"]
+                add_schema_time(doc, self.name, predicate, perf_counter() - start)
         return doc
@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# matches of one sentence, by span group: sentence-relative token offsets of each span,
+# whether it is negated, and its related values as (start, end, label)
+SentenceMatches = Dict[str, List[Tuple[int, int, bool, List[Tuple[int, int, str]]]]]
+
+
+# --------------------------------------------------------------------------------------------------
+class SentenceMemo:
+    """
+    Bounded LRU memo of sentence match results, keyed by the sentence's tokens and lemmas
+    and the hash of the ruleset it was matched against. A `maxsize` of 0 disables it.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, SentenceMatches]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: Hashable) -> Optional[SentenceMatches]:
+        with self._lock:
+            matches = self.entries.get(key)
+            if matches is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return matches
+
+    def put(self, key: Hashable, matches: SentenceMatches):
+        with self._lock:
+            self.entries[key] = matches
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+# --------------------------------------------------------------------------------------------------
+def match_sentence(abstractor, sent, budget=None) -> SentenceMatches:
+    from clinspacy.abstract import MATCH_PIPES
+    from clinspacy.extract import get_relations
+    from clinspacy.match import get_attrs
+
+    sent_doc = sent.as_doc()
+    sent_doc._.budget = budget
+    sent_doc._.schema_times = sent.doc._.schema_times
+    for name in MATCH_PIPES:
+        sent_doc = abstractor.nlp.get_pipe(name)(sent_doc)
+    matches = {}
+    for name, group in sent_doc.spans.items():
+        if get_attrs(group).get("rule_type", "") not in ["name", "value"] or not group:
+            continue
+        relations = get_relations(group)
+        matches[name] = [
+            (
+                span.start,
+                span.end,
+                span._.negated,
+                [(v.start, v.end, v.label_) for v in relations.get(idx, [])],
+            )
+            for idx, span in enumerate(group)
+        ]
+    return matches
+
+
+# --------------------------------------------------------------------------------------------------
+def match_sentences(abstractor, doc, memo: SentenceMemo, ruleset: str, budget=None):
+    """
+    Memoized stand-in for running span_match_ruler, negex and relextractor over `doc`.
+    Every sentence is matched on its own, or its results are taken from `memo`, and then
+    re-anchored into span groups of `doc` laid out the way the components lay them out.
+    Negation and relations are sentence-scoped anyway; the one difference from the
+    components is that no pattern can match across a sentence boundary. Once `budget`
+    is exceeded, the remaining sentences are only taken from `memo`, and every span
+    group is incomplete.
+    """
+    from spacy.attrs import LEMMA, ORTH, SPACY
+    from spacy.tokens import Span, SpanGroup
+    from clinspacy.extract import set_relations
+    from clinspacy.match import get_attrs
+
+    # span group attrs as SpanMatcher.match sets them, a later matcher replacing an
+    # earlier one with the same name
+    attrs = {}
+    for matcher in abstractor.span_ruler.matchers:
+        attrs[matcher.name] = matcher.attrs
+    spans = {name: [] for name in attrs}
+    relations = {name: ([], []) for name in attrs}
+
+    tokens = doc.to_array([ORTH, LEMMA, SPACY])
+    if budget is not None and "pysbd" in budget.skipped:
+        budget.skip("sentence_memo", attrs)
+        sents = []
+    else:
+        sents = doc.sents
+    for sent in sents:
+        key = (ruleset, tokens[sent.start : sent.end].tobytes())
+        matches = memo.get(key)
+        if matches is None:
+            if budget is not None and budget.exceeded():
+                budget.truncate("sentence_memo", attrs)
+                continue
+            matches = match_sentence(abstractor, sent, budget)
+            if budget is not None and budget.exceeded():
+                # possibly cut short, so not memoized
+                budget.truncate("sentence_memo", attrs)
+                continue
+            memo.put(key, matches)
+        for name, sentence_spans in matches.items():
+            for start, end, negated, values in sentence_spans:
+                span = Span(doc, sent.start + start, sent.start + end)
+                if negated:
+                    span._.negated = True
+                rows, labels = relations[name]
+                for s, e, label in values:
+                    rows.append((len(spans[name]), sent.start + s, sent.start + e))
+                    labels.append(label)
+                spans[name].append(span)
+
+    for name, group_attrs in attrs.items():
+        group = SpanGroup(doc, spans=spans[name], attrs=group_attrs)
+        if get_attrs(group).get("rule_type", "") == "name":
+            set_relations(group, *relations[name])
+        doc.spans[name] = group
+    return doc
@@ -1,124 +1,353 @@
-import yaml
-from typing import Tuple
-from importlib_resources import files
-from clinspacy import data
+import srsly
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
 from clinspacy.match import *
 
+# trigger kinds, in the order of their patterns in patterns.json
+TRIGGERS = ["pseudo_negations", "pre_negations", "post_negations", "terminators"]
 
-config = yaml.safe_load(files(data).joinpath("config.yml").read_text())
+
+@lru_cache(maxsize=None)
+def load_config() -> Dict:
+    import yaml
+    from importlib_resources import files
+    from clinspacy import data
+
+    return yaml.safe_load(files(data).joinpath("config.yml").read_text())
+
+
+def __getattr__(name):
+    # config.yml is parsed on first access rather than at import time
+    if name == "config":
+        return load_config()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
 @Language.factory(
     "negex",
     default_config={
-        "pseudo_negations": config["negation"]["pseudo_negations"],
-        "pre_negations": config["negation"]["pre_negations"],
-        "post_negations": config["negation"]["post_negations"],
-        "terminators": config["negation"]["terminators"],
+        "pseudo_negations": None,
+        "pre_negations": None,
+        "post_negations": None,
+        "terminators": None,
+        "scope_window": 100,
     },
 )
 class Negex:
+    """
+    Negates the name and value spans of a sentence that have a pre negation in their
+    scope on the left or a post negation in their scope on the right. Scopes run from
+    the span to the nearest terminator, the sentence edge or `scope_window` tokens away,
+    whichever is closest; a None window leaves scopes unbounded within the sentence.
+    """
+
     def __init__(
         self,
         nlp: Language,
         name: str,
-        pseudo_negations: List[str],
-        pre_negations: List[str],
-        post_negations: List[str],
-        terminators: List[str],
+        pseudo_negations: Optional[List[str]] = None,
+        pre_negations: Optional[List[str]] = None,
+        post_negations: Optional[List[str]] = None,
+        terminators: Optional[List[str]] = None,
+        scope_window: Optional[int] = 100,
     ):
         if not Span.has_extension("negated"):
             Span.set_extension("negated", default=False)
 
+        # phrases that are not configured come from the packaged config.yml; they are
+        # parsed on first use, so a pipeline loaded from disk never parses them
+        self._phrases = {
+            "pseudo_negations": pseudo_negations,
+            "pre_negations": pre_negations,
+            "post_negations": post_negations,
+            "terminators": terminators,
+        }
+        self._nlp = nlp
+        self._triggers: Optional[List[SpanMatcher]] = None
+        self._matcher: Optional[Matcher] = None
         self.name = name
-        _ = Negex.parse_phrases("pseudo_negations", pseudo_negations, nlp)
-        self.pseudo_neg_matcher = SpanMatcher(_["name"], _)
-        _ = Negex.parse_phrases("pre_negations", pre_negations, nlp)
-        self.pre_neg_matcher = SpanMatcher(_["name"], _)
-        _ = Negex.parse_phrases("post_negations", post_negations, nlp)
-        self.post_neg_matcher = SpanMatcher(_["name"], _)
-        _ = Negex.parse_phrases("terminators", terminators, nlp)
-        self.term_matcher = SpanMatcher(_["name"], _)
+        self.scope_window = scope_window
+
+    def set_patterns(
+        self,
+        pseudo_negations: Dict,
+        pre_negations: Dict,
+        post_negations: Dict,
+        terminators: Dict,
+    ):
+        self._triggers = [
+            SpanMatcher(patterns["name"], patterns)
+            for patterns in [
+                pseudo_negations,
+                pre_negations,
+                post_negations,
+                terminators,
+            ]
+        ]
+        self._matcher = None
+
+    @property
+    def trigger_matchers(self) -> List[SpanMatcher]:
+        if self._triggers is None:
+            self.set_patterns(
+                *[
+                    Negex.parse_phrases(
+                        key,
+                        load_config()["negation"][key] if texts is None else texts,
+                        self._nlp,
+                    )
+                    for key, texts in self._phrases.items()
+                ]
+            )
+        return self._triggers
+
+    @property
+    def pseudo_neg_matcher(self) -> SpanMatcher:
+        return self.trigger_matchers[0]
+
+    @property
+    def pre_neg_matcher(self) -> SpanMatcher:
+        return self.trigger_matchers[1]
+
+    @property
+    def post_neg_matcher(self) -> SpanMatcher:
+        return self.trigger_matchers[2]
+
+    @property
+    def term_matcher(self) -> SpanMatcher:
+        return self.trigger_matchers[3]
+
+    def matcher(self, vocab) -> Matcher:
+        # the triggers of every kind in one matcher, labelled by kind, compiled once and
+        # reused for every doc sharing the vocab
+        if self._matcher is None or self._matcher.vocab is not vocab:
+            trigger_matchers = self.trigger_matchers
+            self._matcher = Matcher(vocab)
+            for kind, trigger_matcher in zip(TRIGGERS, trigger_matchers):
+                self._matcher.add(kind, trigger_matcher.patterns["patterns"])
+        return self._matcher
+
+    def match_triggers(self, doc: Doc) -> Dict[str, List[Tuple[int, int]]]:
+        """All trigger matches in `doc` in one scan, by trigger kind."""
+        triggers = {kind: [] for kind in TRIGGERS}
+        for match_id, start, end in self.matcher(doc.vocab)(doc):
+            triggers[doc.vocab.strings[match_id]].append((start, end))
+        return triggers
 
     @staticmethod
     def parse_phrases(name: str, texts: List[str], nlp: Language) -> Dict:
         pattern_map = {"name": name, "patterns": []}
-        with nlp.select_pipes(enable=["tagger", "attribute_ruler", "lemmatizer"]):
-            for text in texts:
-                pattern = []
-                doc = nlp(text)
-                for token in doc:
-                    pattern.append({"LOWER": token.text.lower()})
-                pattern_map["patterns"].append(pattern)
+        for text in texts:
+            pattern = []
+            doc = nlp.make_doc(text)
+            for token in doc:
+                pattern.append({"LOWER": token.text.lower()})
+            pattern_map["patterns"].append(pattern)
         return pattern_map
 
-    def find_negations(self, doc: Doc) -> Dict[str, SpanGroup]:
-        pseudo_matches = self.pseudo_neg_matcher.match(doc, keep_longest=True)
-        pre_matches = self.pre_neg_matcher.match(doc, keep_longest=True)
-        post_matches = self.post_neg_matcher.match(doc, keep_longest=True)
-        term_matches = self.term_matcher.match(doc, keep_longest=True)
+    def to_disk(self, path, exclude=tuple()):
+        path = Path(path)
+        if not path.exists():
+            path.mkdir()
+        srsly.write_json(
+            path / "patterns.json",
+            [trigger_matcher.patterns for trigger_matcher in self.trigger_matchers],
+        )
+
+    def from_disk(self, path, exclude=tuple()):
+        self.set_patterns(*srsly.read_json(Path(path) / "patterns.json"))
+        return self
+
+    @staticmethod
+    def resolve_triggers(
+        triggers: Dict[str, List[Tuple[int, int]]],
+    ) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Keep the longest triggers of each kind, then drop pre and post negations inside
+        a longer pseudo negation, post negations inside a longer pre negation, and pre
+        negations inside a longer remaining post negation.
+        """
 
-        pre_matches = filter_covered(pseudo_matches, pre_matches)
-        post_matches = filter_covered(pseudo_matches, post_matches)
-        post_matches = filter_covered(pre_matches, post_matches)
-        pre_matches = filter_covered(post_matches, pre_matches)
+        def uncovered(covers: List[Tuple[int, int]], spans: List[Tuple[int, int]]):
+            return [
+                (start, end)
+                for start, end in spans
+                if not any(
+                    s <= start and e >= end and e - s > end - start for s, e in covers
+                )
+            ]
 
+        longest = {kind: uncovered(spans, spans) for kind, spans in triggers.items()}
+        pseudo = longest["pseudo_negations"]
+        pre = uncovered(pseudo, longest["pre_negations"])
+        post = uncovered(pseudo, longest["post_negations"])
+        post = uncovered(pre, post)
+        pre = uncovered(post, pre)
         return {
-            "pseudo_negations": pseudo_matches,
-            "pre_negations": pre_matches,
-            "post_negations": post_matches,
-            "terminators": term_matches,
+            "pseudo_negations": pseudo,
+            "pre_negations": pre,
+            "post_negations": post,
+            "terminators": longest["terminators"],
+        }
+
+    def find_negations(self, doc: Doc) -> Dict[str, SpanGroup]:
+        triggers = Negex.resolve_triggers(self.match_triggers(doc))
+        return {
+            kind: SpanGroup(doc, spans=[Span(doc, start, end) for start, end in spans])
+            for kind, spans in triggers.items()
         }
 
     @staticmethod
-    def find_scopes(doc, span, terminators, **kwargs) -> Tuple[Span, Span]:
-        start = 0
-        end = len(doc)
-        # if len(terminators) == 0:
-        #     start = span.start
-        for t in terminators:
-            if span.start >= t.end > start:
-                start = t.end
-            elif span.end <= t.start < end:
-                end = t.start
-        return doc[start : span.start], doc[span.end : end]
+    def find_scopes(
+        span: Span, bounds: Tuple[int, int], terminators: List[Tuple[int, int]]
+    ) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """
+        Token ranges before and after `span` within `bounds`, up to the nearest
+        terminators.
+        """
+        start, end = bounds
+        for t_start, t_end in terminators:
+            if span.start >= t_end > start:
+                start = t_end
+            elif span.end <= t_start < end:
+                end = t_start
+        return (start, span.start), (span.end, end)
 
     @staticmethod
-    def neg_in_scope(scope: Span, negations: SpanGroup) -> bool:
-        for neg in negations:
-            if covers(scope, neg, strict=False):
-                return True
-        return False
+    def neg_in_scope(scope: Tuple[int, int], negations: List[Tuple[int, int]]) -> bool:
+        return any(scope[0] <= start and end <= scope[1] for start, end in negations)
 
     @staticmethod
-    def aggregate_spans(doc: Doc) -> Dict[Span, List[Span]]:
+    def aggregate_spans(
+        doc: Doc, predicates: Optional[Dict[int, str]] = None
+    ) -> Dict[Span, List[Span]]:
+        """
+        Spans of the name and value groups of `doc` by sentence.
+        :param doc:
+        :param predicates: filled with the schema predicate of every span, by span id
+        :return:
+        """
         span_groups = [
             group
             for _, group in doc.spans.items()
-            if group and group.attrs.get("rule_type", "") in ["value", "name"]
+            if group and get_attrs(group).get("rule_type", "") in ["value", "name"]
         ]
-        spans = [span for group in span_groups for span in group]
+        spans = []
+        for group in span_groups:
+            group_spans = list(group)
+            spans.extend(group_spans)
+            if predicates is not None:
+                predicate = get_attrs(group)["predicate"]
+                predicates.update((id(span), predicate) for span in group_spans)
         sents_to_spans: Dict[Span, List[Span]] = {}
+        if not spans:
+            return sents_to_spans
+        # looked up rather than through span.sent, which walks the sentence every time
+        sents = list(doc.sents)
+        sent_starts = [sent.start for sent in sents]
         for span in spans:
-            if span.sent in sents_to_spans:
-                sents_to_spans[span.sent].append(span)
-            else:
-                sents_to_spans[span.sent] = [span]
+            sent = sents[bisect_right(sent_starts, span.start) - 1]
+            sents_to_spans.setdefault(sent, []).append(span)
         return sents_to_spans
 
+    @staticmethod
+    def clip_triggers(
+        triggers: Dict[str, List[Tuple[int, int]]],
+        starts: Dict[str, List[int]],
+        bounds: Tuple[int, int],
+        slack: int,
+    ) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        The triggers, sorted by start, that can bear on a scope within `bounds`: those
+        starting in it, or up to `slack` tokens, the longest trigger, before it.
+        """
+        clipped = {}
+        for kind, spans in triggers.items():
+            lo = bisect_left(starts[kind], bounds[0] - slack)
+            hi = bisect_left(starts[kind], bounds[1])
+            clipped[kind] = spans[lo:hi]
+        return clipped
+
     def __call__(self, doc):
-        span_map = Negex.aggregate_spans(doc)
-        for sent, spans in span_map.items():
-            sent_doc = sent.doc[sent.start : sent.end].as_doc()
-            neg_matches = self.find_negations(sent_doc)
+        timed = doc._.schema_times is not None
+        predicates = {} if timed else None
+        span_map = Negex.aggregate_spans(doc, predicates)
+        if not span_map:
+            return doc
+        # one scan of the doc, with the triggers then resolved sentence by sentence
+        began = perf_counter() if timed else 0.0
+        matches = {
+            kind: sorted(kind_matches)
+            for kind, kind_matches in self.match_triggers(doc).items()
+        }
+        match_starts = {
+            kind: [start for start, _ in kind_matches]
+            for kind, kind_matches in matches.items()
+        }
+        window = self.scope_window
+        sentences = list(span_map.items())
+        for idx, (sent, spans) in enumerate(sentences):
+            # the matches starting in the sentence, less those running past its end
+            sent_matches = {}
+            for kind, kind_matches in matches.items():
+                lo = bisect_left(match_starts[kind], sent.start)
+                hi = bisect_left(match_starts[kind], sent.end)
+                sent_matches[kind] = [
+                    (start, end)
+                    for start, end in kind_matches[lo:hi]
+                    if end <= sent.end
+                ]
+            triggers = Negex.resolve_triggers(sent_matches)
+            if window is not None:
+                trigger_starts = {
+                    kind: [start for start, _ in kind_triggers]
+                    for kind, kind_triggers in triggers.items()
+                }
+                slack = max(
+                    (end - start for t in triggers.values() for start, end in t),
+                    default=0,
+                )
+            if timed:
+                # trigger matching is shared by every schema, scopes are per span
+                add_schema_time(doc, self.name, SHARED, perf_counter() - began)
             for span in spans:
+                began = perf_counter() if timed else 0.0
+                budget = over_budget(doc)
+                if budget is not None:
+                    # schemas with spans in this or later sentences
+                    starts = {s.start for s, _ in sentences[idx:]}
+                    budget.truncate(
+                        self.name,
+                        [
+                            key
+                            for key, group in doc.spans.items()
+                            if get_attrs(group).get("rule_type") in ["value", "name"]
+                            and any(s.sent.start in starts for s in group)
+                        ],
+                    )
+                    return doc
+                bounds = (sent.start, sent.end)
+                scoped = triggers
+                if window is not None:
+                    bounds = (
+                        max(sent.start, span.start - window),
+                        min(sent.end, span.end + window),
+                    )
+                    scoped = Negex.clip_triggers(
+                        triggers, trigger_starts, bounds, slack
+                    )
                 left_scope, right_scope = Negex.find_scopes(
-                    sent_doc,
-                    Span(sent_doc, span.start - sent.start, span.end - sent.start),
-                    **neg_matches
+                    span, bounds, scoped["terminators"]
                 )
-                if Negex.neg_in_scope(left_scope, neg_matches["pre_negations"]):
+                if Negex.neg_in_scope(left_scope, scoped["pre_negations"]):
                     span._.negated = True
-                elif Negex.neg_in_scope(right_scope, neg_matches["post_negations"]):
+                elif Negex.neg_in_scope(right_scope, scoped["post_negations"]):
                     span._.negated = True
+                if timed:
+                    add_schema_time(
+                        doc, self.name, predicates[id(span)], perf_counter() - began
+                    )
+            began = perf_counter() if timed else 0.0
         return doc
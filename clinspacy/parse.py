@@ -7,6 +7,7 @@ from textabstractor.dataclasses import (
     AbstractorSection,
     Variant,
 )
+from clinspacy import tag
 
 
 def parse_schema(
@@ -38,6 +39,7 @@ def get_number_schema(schema: AbstractionSchema) -> List[Dict]:
                 [{"LIKE_NUM": True}, {"ORTH": "%", "OP": "?"}],
             ],
             "value": "number",
+            "value_type": "number",
             "rule_type": "value",
             "object_type": "number",
         }
@@ -48,8 +50,9 @@ def get_date_schema(schema: AbstractionSchema) -> List[Dict]:
     return [
         {
             "predicate": schema.predicate,
-            "patterns": [[{"TEXT": {"REGEX": r"^\d{1,2}/\d{1,2}/\d\d(\d\d)?$"}}]],
+            "patterns": [[{"TEXT": {"REGEX": tag.date_re.pattern}}]],
             "value": "date",
+            "value_type": "date",
             "rule_type": "value",
             "object_type": "date",
         }
@@ -0,0 +1,319 @@
+import gc
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import multiprocessing
+from pathlib import Path
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from pydantic.json import pydantic_encoder
+from textabstractor.dataclasses import SuggestRequest
+from clinspacy import abstract
+from clinspacy.abstract import TextAbstractor
+from clinspacy.recycle import AbstractorPool
+
+PATH = "/process_text"
+MEASURES = ["uss", "pss", "rss"]
+
+
+# --------------------------------------------------------------------------------------------------
+def memory_usage(pid: Union[int, str] = "self") -> Dict[str, int]:
+    """
+    Memory of a process from `/proc/<pid>/smaps_rollup`, Linux only, in bytes.
+    :return: `rss`, `pss`, which charges shared pages in equal parts to the processes
+    sharing them, `uss`, the pages of the process alone, and `shared`
+    """
+    kb = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            value = value.split()
+            if len(value) == 2 and value[1] == "kB":
+                kb[key] = int(value[0])
+    return {
+        "rss": kb["Rss"] * 1024,
+        "pss": kb["Pss"] * 1024,
+        "uss": (kb["Private_Clean"] + kb["Private_Dirty"]) * 1024,
+        "shared": (kb["Shared_Clean"] + kb["Shared_Dirty"]) * 1024,
+    }
+
+
+# --------------------------------------------------------------------------------------------------
+def preload(requests: Iterable[SuggestRequest] = ()) -> TextAbstractor:
+    """
+    Load the pipeline once for every worker to come, as `abstract.shared_pool`. The
+    schemas of `requests` are fetched and parsed into `schema_cache`, and each request
+    is run once, which compiles the Negex triggers for the pipeline's vocab and interns
+    the strings of the schemas. The abstractor is left cleared.
+    """
+    abstractor = TextAbstractor(abstract.pipeline_path)
+    for request in requests:
+        abstract.create_abstractor(request, abstractor).nlp(request.text)
+    abstractor.clear()
+    abstract.shared_pool = AbstractorPool(
+        abstract.recycle_docs, abstract.recycle_strings, abstractor=abstractor
+    )
+    return abstractor
+
+
+def freeze():
+    """
+    Move every object alive into the permanent generation, which the collector never
+    scans, so that collections in the workers do not write to the pages they share.
+    Reference counts still do, for the objects a worker touches.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+# --------------------------------------------------------------------------------------------------
+class Handler(BaseHTTPRequestHandler):
+    """`POST /process_text` with a `SuggestRequest`, answered with its response."""
+
+    def do_POST(self):
+        if self.path != PATH:
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            request = SuggestRequest(**json.loads(body))
+        except (ValueError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        try:
+            response = json.dumps(
+                abstract.process_text(request), default=pydantic_encoder
+            )
+        except Exception as e:
+            self.send_error(500, f"{type(e).__name__}: {e}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(response.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+# --------------------------------------------------------------------------------------------------
+class PreforkServer:
+    """
+    Serves `process_text` over HTTP from `workers` processes forked from this one, once
+    it has loaded the pipeline and the schemas of `requests` with `preload` and frozen
+    them with `freeze`. The workers share those pages copy-on-write, start without
+    loading anything and take turns accepting connections on the socket bound here,
+    one request at a time. A worker that exits is replaced.
+
+    The workers reuse the preloaded pipeline until `abstract.recycle_docs` or
+    `abstract.recycle_strings` has it rebuilt, and a rebuilt one is their own.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        requests: Iterable[SuggestRequest] = (),
+    ):
+        self.workers = workers
+        self.requests = list(requests)
+        self.socket = socket.create_server((host, port), backlog=128)
+        self.address: Tuple[str, int] = self.socket.getsockname()[:2]
+        self.pids: List[int] = []
+        self._stopping = False
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.address[0]}:{self.address[1]}{PATH}"
+
+    def start(self):
+        preload(self.requests)
+        freeze()
+        for _ in range(self.workers):
+            self.pids.append(self._fork())
+
+    def _fork(self) -> int:
+        pid = os.fork()
+        if pid > 0:
+            return pid
+        # worker: serve until terminated, without ever returning into the caller's stack
+        try:
+            # the threads of the schema fetch executor are not forked with it
+            abstract.schema_fetch_executor = None
+            # nor those of the schema refresher, so the worker starts its own
+            refresher = abstract.schema_refresher
+            if refresher is not None:
+                abstract.schema_refresher = None
+                abstract.enable_schema_refresh(refresher.manifest, refresher.interval)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            server = HTTPServer(self.address, Handler, bind_and_activate=False)
+            server.socket = self.socket
+            server.serve_forever()
+        finally:
+            os._exit(1)
+
+    def wait(self):
+        """Replace workers that exit, until `stop`."""
+        while not self._stopping:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                return
+            except InterruptedError:
+                continue
+            if pid in self.pids and not self._stopping:
+                self.pids[self.pids.index(pid)] = self._fork()
+
+    def stop(self):
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.pids = []
+        self.socket.close()
+
+    def memory(self) -> List[Dict[str, int]]:
+        """`memory_usage` of every worker."""
+        return [memory_usage(pid) for pid in self.pids]
+
+    def __enter__(self) -> "PreforkServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+# --------------------------------------------------------------------------------------------------
+def measure_worker(
+    conn, request: SuggestRequest, cache: Optional[Dict] = None, load: bool = False
+):
+    """
+    Process `request` once, send back `memory_usage` and wait to be told to exit, so
+    that all workers of a measurement are alive at once.
+    :param conn: pipe to the parent
+    :param request:
+    :param cache: `schema_cache` entries for workers that do not inherit them
+    :param load: load the pipeline, instead of sharing the parent's
+    """
+    if cache:
+        abstract.schema_cache.update(cache)
+    if load:
+        preload()
+    abstract.process_text(request)
+    conn.send(memory_usage())
+    conn.recv()
+
+
+def measure(request: SuggestRequest, workers: int = 2) -> Dict[str, Dict]:
+    """
+    Per-worker memory of `workers` processes that each run `request`, when `preforked`
+    from this process after `preload` and `freeze`, and when `independent` processes
+    that each load the pipeline, as a web server's workers otherwise do. Both get the
+    schemas of `request` from `schema_cache`. Call it from a process that has not loaded
+    the pipeline yet, since it preloads it, and shares it until it returns.
+    :return: by mode, the mean `uss`, `pss` and `rss` in bytes and every worker's usage
+    """
+    results = {}
+    abstract.prefetch_schemas(
+        TextAbstractor(abstract.pipeline_path), request.abstractor_abstraction_schemas
+    )
+    cache = {
+        abstract.get_schema_key(m): abstract.schema_cache[abstract.get_schema_key(m)]
+        for m in request.abstractor_abstraction_schemas
+    }
+    try:
+        for mode, context, args in [
+            ("independent", "spawn", (request, cache, True)),
+            ("preforked", "fork", (request,)),
+        ]:
+            if mode == "preforked":
+                preload([request])
+                freeze()
+            ctx = multiprocessing.get_context(context)
+            pipes, processes = [], []
+            for _ in range(workers):
+                parent, child = ctx.Pipe()
+                process = ctx.Process(target=measure_worker, args=(child, *args))
+                process.start()
+                pipes.append(parent)
+                processes.append(process)
+            usage = [p.recv() for p in pipes]
+            for p, process in zip(pipes, processes):
+                p.send(None)
+                process.join()
+            results[mode] = {
+                **{k: sum(u[k] for u in usage) // workers for k in MEASURES},
+                "workers": usage,
+            }
+    finally:
+        abstract.shared_pool = None
+        gc.unfreeze()
+    return results
+
+
+# --------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Serve process_text from workers forked after loading the pipeline"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--request",
+        action="append",
+        help="SuggestRequest JSON file whose schemas are preloaded, repeatable",
+    )
+    parser.add_argument(
+        "--fixtures", help="schema JSON dir or package, the schema service if unset"
+    )
+    parser.add_argument(
+        "--measure",
+        action="store_true",
+        help="report per-worker memory, preforked and loading independently, and exit",
+    )
+    args = parser.parse_args(argv)
+    if args.measure and not args.request and not args.fixtures:
+        parser.error("--measure requires --request or --fixtures")
+
+    service = None
+    if args.fixtures:
+        from clinspacy.loadtest import SchemaService
+
+        service = SchemaService(args.fixtures)
+    if args.request:
+        requests_json = [Path(r).read_text() for r in args.request]
+    elif service is not None:
+        requests_json = [service.fixtures.joinpath("request.json").read_text()]
+    else:
+        requests_json = []
+    requests = [SuggestRequest(**json.loads(r)) for r in requests_json]
+
+    with service.installed() if service else nullcontext():
+        if args.measure:
+            print(json.dumps(measure(requests[0], args.workers)))
+            return
+        server = PreforkServer(args.workers, args.host, args.port, requests)
+        signal.signal(signal.SIGTERM, lambda *_: server.stop())
+        server.start()
+        print(json.dumps({"url": server.url, "workers": server.pids}), file=sys.stderr)
+        try:
+            server.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
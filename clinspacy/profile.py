@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import gc
+import json
+import pstats
+import random
+import cProfile
+import threading
+import tracemalloc
+from functools import partial
+from time import perf_counter
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
+from pydantic.json import pydantic_encoder
+from textabstractor.dataclasses import SuggestRequest, ProcessTextResponse
+
+# imported by clinspacy.abstract, so spaCy is only imported when a request is profiled
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from spacy.tokens import Doc
+
+
+# --------------------------------------------------------------------------------------------------
+class Profile:
+    """
+    Measurements of one request. `process_text` runs the pipeline through `run`, which
+    calls `measure` for the tokenizer and then for every component, and hands the
+    profile back to its `profiler` when done.
+    """
+
+    def __init__(self, profiler, request: SuggestRequest):
+        self.profiler = profiler
+        self.request = request
+        self.record: Dict = {
+            "time": datetime.now().isoformat(),
+            "text_length": len(request.text),
+            "schemas": [
+                m.abstractor_abstraction_schema_uri
+                for m in request.abstractor_abstraction_schemas
+            ],
+            "components": {},
+        }
+
+    def start(self):
+        pass
+
+    def measure(self, name: str, func: Callable, *args):
+        return func(*args)
+
+    def attach(self, doc: Doc):
+        """Set up `doc` for the measurements the components take themselves."""
+        pass
+
+    def run(self, nlp: Language, text: str) -> Doc:
+        doc = self.measure("tokenizer", nlp.make_doc, text)
+        self.attach(doc)
+        for name, proc in nlp.pipeline:
+            doc = self.measure(name, proc, doc)
+        return doc
+
+    def count(self, doc: Optional[Doc], response: Optional[ProcessTextResponse] = None):
+        objects = self.record["objects"] = {}
+        if doc is not None:
+            groups = spans = relations = 0
+            for group in doc.spans.values():
+                groups += 1
+                spans += len(group)
+                relations += len(group.attrs.get("relations", []))
+            objects.update(
+                tokens=len(doc),
+                span_groups=groups,
+                spans=spans,
+                relations=relations,
+                strings=len(doc.vocab.strings),
+                lexemes=len(doc.vocab),
+            )
+        if response is not None:
+            objects["sentences"] = len(response.sentences)
+            objects["suggestions"] = len(response.suggestions)
+
+    def finish(self) -> Dict:
+        return self.record
+
+
+# --------------------------------------------------------------------------------------------------
+class Profiles(Profile):
+    """
+    Several profiles of one request taken at once, each by its own profiler. Every step
+    is measured by all of them, nested in order, so the measurements of the later ones
+    include the overhead of the earlier ones.
+    """
+
+    def __init__(self, profiles: List[Profile]):
+        self.profiles = profiles
+        self.profiler = self
+        self.request = profiles[0].request
+
+    @staticmethod
+    def combine(*profiles: Optional[Profile]) -> Optional[Profile]:
+        """The profiles that are not None, combined if there are more than one."""
+        profiles = [p for p in profiles if p is not None]
+        if len(profiles) > 1:
+            return Profiles(profiles)
+        return profiles[0] if profiles else None
+
+    def measure(self, name: str, func: Callable, *args):
+        for profile in self.profiles:
+            func = partial(profile.measure, name, func)
+        return func(*args)
+
+    def attach(self, doc: Doc):
+        for profile in self.profiles:
+            profile.attach(doc)
+
+    def count(self, doc: Optional[Doc], response: Optional[ProcessTextResponse] = None):
+        for profile in self.profiles:
+            profile.count(doc, response)
+
+    def finish(self, profile: Optional[Profiles] = None) -> List[Dict]:
+        """Hand every profile back to its profiler, as the profiler of them all."""
+        return [p.profiler.finish(p) for p in self.profiles]
+
+
+# --------------------------------------------------------------------------------------------------
+class MemoryProfile(Profile):
+    """
+    Memory accounting of one request, traced with `tracemalloc` from `start` to `finish`.
+    For every pipeline component it records the bytes still allocated after the
+    component ran, the peak reached while it ran, both relative to the memory traced
+    when the component started, and the growth of the memory `tracemalloc` keeps its
+    traces in, which follows the number of blocks allocated. Exact block counts and live
+    docs take a pass over the heap each, so they are only counted in `debug` mode.
+    """
+
+    def __init__(self, profiler, request: SuggestRequest, debug: bool = False):
+        super().__init__(profiler, request)
+        self.debug = debug
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._base, _ = tracemalloc.get_traced_memory()
+
+    def measure(self, name: str, func: Callable, *args):
+        if self.debug:
+            blocks = len(tracemalloc.take_snapshot().traces)
+        traces = tracemalloc.get_tracemalloc_memory()
+        current, _ = tracemalloc.get_traced_memory()
+        peak = self.record.get("peak", 0)
+        tracemalloc.reset_peak()
+        result = func(*args)
+        after, component_peak = tracemalloc.get_traced_memory()
+        component = self.record["components"][name] = {
+            "allocated": after - current,
+            "peak": component_peak - current,
+            "traces": tracemalloc.get_tracemalloc_memory() - traces,
+        }
+        if self.debug:
+            component["blocks"] = len(tracemalloc.take_snapshot().traces) - blocks
+        self.record["peak"] = max(peak, component_peak - self._base)
+        return result
+
+    def count(self, doc: Optional[Doc], response: Optional[ProcessTextResponse] = None):
+        super().count(doc, response)
+        if self.debug:
+            from spacy.tokens import Doc
+
+            self.record["objects"]["live_docs"] = sum(
+                1 for o in gc.get_objects() if isinstance(o, Doc)
+            )
+
+    def finish(self) -> Dict:
+        current, peak = tracemalloc.get_traced_memory()
+        self.record["peak"] = max(self.record.get("peak", 0), peak - self._base)
+        self.record["retained"] = current - self._base
+        if self._started_tracing:
+            tracemalloc.stop()
+        return self.record
+
+
+# --------------------------------------------------------------------------------------------------
+class MemoryProfiler:
+    """
+    Opt-in memory profiling of `process_text`. A `sample_rate` fraction of requests is
+    traced with `tracemalloc`, and each profile is appended as a JSON line to `log_path`
+    and kept as `last`. Tracing is only on while a sampled request runs, but it traces
+    every thread of the process, so concurrent requests add to a profile's numbers.
+    `debug` adds the counts that walk the heap, see `MemoryProfile`.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        log_path: Optional[Union[str, Path]] = None,
+        debug: bool = False,
+    ):
+        self.sample_rate = sample_rate
+        self.log_path = Path(log_path) if log_path else None
+        self.debug = debug
+        self.last: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def sample(self, request: SuggestRequest) -> Optional[MemoryProfile]:
+        """Start a profile for `request` if it is sampled, with one profile at a time."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = MemoryProfile(self, request, self.debug)
+        profile.start()
+        return profile
+
+    def finish(self, profile: MemoryProfile) -> Dict:
+        try:
+            record = profile.finish()
+        finally:
+            self._lock.release()
+        self.last = record
+        if self.log_path is not None:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+
+# --------------------------------------------------------------------------------------------------
+class LatencyProfile(Profile):
+    """
+    Wall-clock timings of one request by pipeline component, and of the matching
+    components by schema predicate, plus a `cProfile` of the whole request when it was
+    sampled for one.
+    """
+
+    def __init__(self, profiler, request: SuggestRequest, profiled: bool):
+        super().__init__(profiler, request)
+        self.cprofile = cProfile.Profile() if profiled else None
+
+    def start(self):
+        self._start = perf_counter()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def measure(self, name: str, func: Callable, *args):
+        start = perf_counter()
+        result = func(*args)
+        self.record["components"][name] = perf_counter() - start
+        return result
+
+    def attach(self, doc: Doc):
+        doc._.schema_times = self.record.setdefault("schemas_seconds", {})
+
+    def finish(self) -> Dict:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.record["latency"] = perf_counter() - self._start
+        return self.record
+
+
+# --------------------------------------------------------------------------------------------------
+class LatencyProfiler:
+    """
+    Captures slow requests to `process_text`. Every request is timed by pipeline
+    component, and a `sample_rate` fraction of them also runs under `cProfile`. When a
+    request takes longer than `threshold` seconds it is saved to its own directory under
+    `path`: `profile.json` with the note length, schema URIs and timings, `request.json`
+    to replay it with `replay`, and `profile.prof` if it was profiled. Saved requests
+    hold the note text. The time of the matching components is also summed by schema
+    predicate over all requests, see `schema_report`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        threshold: float = 1.0,
+        sample_rate: float = 0.1,
+    ):
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.requests = 0
+        self.slow_requests = 0
+        self.schemas_seconds: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def sample(self, request: SuggestRequest) -> Optional[LatencyProfile]:
+        if not self.enabled:
+            return None
+        profile = LatencyProfile(self, request, random.random() < self.sample_rate)
+        profile.start()
+        return profile
+
+    def finish(self, profile: LatencyProfile) -> Dict:
+        record = profile.finish()
+        with self._lock:
+            self.requests += 1
+            for predicate, components in record.get("schemas_seconds", {}).items():
+                totals = self.schemas_seconds.setdefault(predicate, {})
+                for component, seconds in components.items():
+                    totals[component] = totals.get(component, 0.0) + seconds
+            if record["latency"] <= self.threshold:
+                return record
+            self.slow_requests += 1
+            path = self.path / f"{datetime.now():%Y%m%d-%H%M%S}-{self.slow_requests}"
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "profile.json").write_text(json.dumps(record, indent=2))
+        (path / "request.json").write_text(
+            json.dumps(profile.request, default=pydantic_encoder)
+        )
+        if profile.cprofile is not None:
+            profile.cprofile.dump_stats(path / "profile.prof")
+        return record
+
+    def schema_report(self) -> List[Dict]:
+        """
+        Matching time by schema predicate over all requests so far, costliest first.
+        :return: the predicate, its total `seconds` and its seconds by component
+        """
+        with self._lock:
+            report = [
+                {
+                    "predicate": predicate,
+                    "seconds": sum(components.values()),
+                    "components": dict(components),
+                }
+                for predicate, components in self.schemas_seconds.items()
+            ]
+        return sorted(report, key=lambda r: r["seconds"], reverse=True)
+
+
+# --------------------------------------------------------------------------------------------------
+def replay(path: Union[str, Path]) -> pstats.Stats:
+    """
+    Rerun a request saved by `LatencyProfiler` under `cProfile`, e.g.
+    `replay(path).sort_stats("cumulative").print_stats("clinspacy")`.
+    :param path: directory of the saved request
+    :return: the profile of the rerun
+    """
+    from clinspacy.abstract import process_text
+
+    request = SuggestRequest(**json.loads((Path(path) / "request.json").read_text()))
+    profiler = cProfile.Profile()
+    profiler.runcall(process_text, request)
+    return pstats.Stats(profiler)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from clinspacy.abstract import TextAbstractor
+
+
+# --------------------------------------------------------------------------------------------------
+def vocab_size(nlp: Language) -> Dict[str, int]:
+    """Strings interned in the StringStore of `nlp` and lexemes in its vocab."""
+    return {"strings": len(nlp.vocab.strings), "lexemes": len(nlp.vocab)}
+
+
+# --------------------------------------------------------------------------------------------------
+class AbstractorPool:
+    """
+    Holds a long-lived `TextAbstractor` and replaces it with a freshly built one once it
+    has processed `max_docs` docs or its StringStore has grown by `max_strings` strings
+    since it was built, as every new token string of every note is interned for good.
+    A fresh pipeline has the same config, so results do not change.
+
+    Requests `acquire` the current abstractor and keep it until they are done: the
+    check and the swap happen on `acquire`, so an abstractor is never replaced under a
+    request, and one that was replaced is freed when its last request releases it.
+    0 disables either limit.
+    """
+
+    def __init__(
+        self,
+        max_docs: int = 0,
+        max_strings: int = 0,
+        factory: Optional[Callable[[], TextAbstractor]] = None,
+        abstractor: Optional[TextAbstractor] = None,
+    ):
+        self.max_docs = max_docs
+        self.max_strings = max_strings
+        self.factory = factory or default_factory
+        self.recycles = 0
+        self.generation = 0
+        # requests holding each generation
+        self.in_flight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._abstractor = None
+        if abstractor is not None:
+            self._install(abstractor)
+
+    def _install(self, abstractor: TextAbstractor):
+        self._abstractor = abstractor
+        self.docs = 0
+        self.base_strings = len(abstractor.nlp.vocab.strings)
+
+    @property
+    def abstractor(self) -> TextAbstractor:
+        """The current abstractor, built on first access."""
+        with self._lock:
+            return self._current()
+
+    def _current(self) -> TextAbstractor:
+        if self._abstractor is None:
+            self._install(self.factory())
+        return self._abstractor
+
+    @property
+    def added_strings(self) -> int:
+        return len(self.abstractor.nlp.vocab.strings) - self.base_strings
+
+    def due(self) -> bool:
+        """The current abstractor is to be replaced on the next `acquire`."""
+        with self._lock:
+            return self._due()
+
+    def _due(self) -> bool:
+        if self._abstractor is None:
+            return False
+        added = len(self._abstractor.nlp.vocab.strings) - self.base_strings
+        return (self.max_docs > 0 and self.docs >= self.max_docs) or (
+            self.max_strings > 0 and added >= self.max_strings
+        )
+
+    def recycle(self):
+        """Replace the current abstractor with a fresh one, on the next `acquire`."""
+        with self._lock:
+            self._retire()
+
+    def _retire(self):
+        from clinspacy import tag
+
+        self._abstractor = None
+        self.generation += 1
+        self.recycles += 1
+        # the token type memo outlives every vocab, so it goes too
+        tag.orth_types.clear()
+
+    @contextmanager
+    def acquire(self) -> Iterator[TextAbstractor]:
+        with self._lock:
+            if self._due():
+                self._retire()
+            abstractor = self._current()
+            generation = self.generation
+            self.in_flight[generation] = self.in_flight.get(generation, 0) + 1
+        try:
+            yield abstractor
+        finally:
+            with self._lock:
+                self.in_flight[generation] -= 1
+                if self.in_flight[generation] == 0:
+                    del self.in_flight[generation]
+                if generation == self.generation:
+                    self.docs += 1
+
+    def stats(self) -> Dict:
+        size = vocab_size(self.abstractor.nlp)
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "recycles": self.recycles,
+                "docs": self.docs,
+                "added_strings": size["strings"] - self.base_strings,
+                **size,
+                "in_flight": sum(self.in_flight.values()),
+                "retired_in_flight": sum(
+                    n for g, n in self.in_flight.items() if g != self.generation
+                ),
+            }
+
+
+def default_factory() -> TextAbstractor:
+    from clinspacy import abstract
+
+    return abstract.TextAbstractor(abstract.pipeline_path)
@@ -0,0 +1,158 @@
+import json
+import threading
+import textabstractor
+from time import monotonic, perf_counter
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+from textabstractor.dataclasses import AbstractionSchemaMetaData
+
+# returns the metadata of every schema worth keeping warm, with current `updated_at`s
+Manifest = Callable[[], List[AbstractionSchemaMetaData]]
+
+
+# --------------------------------------------------------------------------------------------------
+def load_manifest(path: Union[str, Path]) -> Manifest:
+    """Manifest read from a JSON list of schema metadata, re-read on every poll."""
+
+    def manifest() -> List[AbstractionSchemaMetaData]:
+        return [
+            AbstractionSchemaMetaData(**m) for m in json.loads(Path(path).read_text())
+        ]
+
+    return manifest
+
+
+# --------------------------------------------------------------------------------------------------
+class SchemaRefresher:
+    """
+    Stale-while-revalidate for `abstract.schema_cache`. A request carrying a newer
+    `updated_at` than a cached schema keeps getting the cached patterns, while the new
+    version is fetched and parsed on a background thread with its own pipeline, and
+    then swapped into the cache in a single assignment. With a `manifest`, every
+    `interval` seconds the schemas it lists that are missing or out of date are
+    refreshed the same way.
+    """
+
+    def __init__(self, manifest: Optional[Manifest] = None, interval: float = 60.0):
+        self.manifest = manifest
+        self.interval = interval
+        self.pending: Dict[str, AbstractionSchemaMetaData] = {}
+        # when each pending schema was first served stale
+        self.stale_since: Dict[str, float] = {}
+        # requests served at least one stale schema
+        self.stale_served = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.refresh_seconds = 0.0
+        self.last_refresh_seconds: Optional[float] = None
+        self.max_staleness = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="schema-refresh")
+        self._abstractor = None
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def refresh(self, schema_metadata: AbstractionSchemaMetaData, stale: bool = True):
+        """
+        Schedule a refresh of `schema_metadata` unless the same or a newer version is
+        already pending.
+        :param schema_metadata:
+        :param stale: the cached version is being served meanwhile
+        """
+        from clinspacy.abstract import get_schema_key
+
+        key = get_schema_key(schema_metadata)
+        with self._lock:
+            if stale:
+                self.stale_since.setdefault(key, monotonic())
+            pending = self.pending.get(key)
+            if pending is not None and pending.updated_at >= schema_metadata.updated_at:
+                return
+            self.pending[key] = schema_metadata
+        self._executor.submit(self._refresh, key, schema_metadata)
+
+    def served_stale(self):
+        with self._lock:
+            self.stale_served += 1
+
+    def _refresh(self, key: str, schema_metadata: AbstractionSchemaMetaData):
+        from clinspacy import abstract
+        from clinspacy.parse import parse_schema
+
+        start = perf_counter()
+        try:
+            if self._abstractor is None:
+                self._abstractor = abstract.TextAbstractor(abstract.pipeline_path)
+            schema = textabstractor.textabstract.get_abstraction_schema(schema_metadata)
+            patterns = parse_schema(schema, schema_metadata, self._abstractor.nlp)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+                if self.pending.get(key) is schema_metadata:
+                    del self.pending[key]
+            return
+
+        with self._lock:
+            cached = abstract.schema_cache.get(key)
+            if cached is None or cached[0].updated_at < schema_metadata.updated_at:
+                abstract.cache_schema(key, schema_metadata, patterns)
+            elapsed = perf_counter() - start
+            self.refreshes += 1
+            self.refresh_seconds += elapsed
+            self.last_refresh_seconds = elapsed
+            if self.pending.get(key) is schema_metadata:
+                del self.pending[key]
+                if key in self.stale_since:
+                    staleness = monotonic() - self.stale_since.pop(key)
+                    self.max_staleness = max(self.max_staleness, staleness)
+
+    def poll(self):
+        from clinspacy.abstract import is_cached
+
+        for schema_metadata in self.manifest():
+            if not is_cached(schema_metadata):
+                self.refresh(schema_metadata, stale=False)
+
+    def start(self):
+        """Start polling the manifest in a daemon thread."""
+        if self.manifest is None or self._poller is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.poll()
+                except Exception:
+                    with self._lock:
+                        self.failures += 1
+                self._stop.wait(self.interval)
+
+        self._stop.clear()
+        self._poller = threading.Thread(target=run, daemon=True)
+        self._poller.start()
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict:
+        now = monotonic()
+        with self._lock:
+            return {
+                "pending": len(self.pending),
+                "stale_served": self.stale_served,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "last_refresh_seconds": self.last_refresh_seconds,
+                "mean_refresh_seconds": (
+                    self.refresh_seconds / self.refreshes if self.refreshes else None
+                ),
+                "max_staleness": max(
+                    [self.max_staleness]
+                    + [now - since for since in self.stale_since.values()]
+                ),
+            }
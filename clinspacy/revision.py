@@ -0,0 +1,238 @@
+from bisect import bisect_right
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+from spacy.tokens.doc import Doc
+from textabstractor.dataclasses import (
+    ProcessTextResponse,
+    SuggestRequest,
+    Suggestion,
+)
+from clinspacy import abstract
+from clinspacy.abstract import (
+    TextAbstractor,
+    add_schema,
+    add_sections,
+    extract_sections,
+    extract_sentences,
+    extract_suggestion_groups,
+    filter_out_covered,
+    prefetch_schemas,
+)
+
+# pipes that run over the whole text of every revision; the rest only run over windows
+# around the sentences that changed
+SEGMENT_PIPES = ["pysbd", "sectionizer"]
+
+# sentences on either side of a window, processed for tagger context only
+CONTEXT_SENTENCES = 1
+
+# suggestions for one span: the span's own suggestion followed by its related values
+Block = List[Suggestion]
+
+
+# --------------------------------------------------------------------------------------------------
+class Revision:
+    """
+    Stored results of one revision of a note: its text, sentence offsets and, per span
+    group, the unfiltered suggestion blocks of every sentence.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        sentence_begins: List[int],
+        groups: Dict[str, Dict[int, List[Block]]],
+        signature: Tuple,
+        reprocessed_sentences: int = 0,
+    ):
+        self.text = text
+        self.sentence_begins = sentence_begins
+        self.groups = groups
+        self.signature = signature
+        self.reprocessed_sentences = reprocessed_sentences
+
+    def sentence_texts(self) -> List[str]:
+        ends = self.sentence_begins[1:] + [len(self.text)]
+        return [self.text[b:e] for b, e in zip(self.sentence_begins, ends)]
+
+
+# --------------------------------------------------------------------------------------------------
+def request_signature(request: SuggestRequest) -> Tuple:
+    return (
+        tuple(
+            (
+                m.abstractor_abstraction_schema_uri,
+                m.abstractor_rule_type,
+                str(m.updated_at),
+            )
+            for m in request.abstractor_abstraction_schemas
+        ),
+        tuple(repr(s) for s in request.abstractor_sections),
+    )
+
+
+# --------------------------------------------------------------------------------------------------
+def shift(suggestion: Suggestion, delta: int) -> Suggestion:
+    return Suggestion(
+        predicate=suggestion.predicate,
+        begin=suggestion.begin + delta,
+        end=suggestion.end + delta,
+        type=suggestion.type,
+        value=suggestion.value,
+        assertion=suggestion.assertion,
+    )
+
+
+# --------------------------------------------------------------------------------------------------
+def split_blocks(suggestions: List[Suggestion]) -> List[Block]:
+    blocks = []
+    for s in suggestions:
+        # values related to a name span directly follow the name's suggestion
+        if s.type == "value" and blocks and blocks[-1][0].type == "name":
+            blocks[-1].append(s)
+        else:
+            blocks.append([s])
+    return blocks
+
+
+# --------------------------------------------------------------------------------------------------
+def dirty_sentences(
+    old_texts: List[str], new_texts: List[str], margin: int
+) -> Tuple[List[int], Dict[int, int]]:
+    """
+    Diff two revisions at sentence granularity.
+    :param old_texts:
+    :param new_texts:
+    :param margin: unchanged sentences around an edit that are reprocessed as well
+    :return: the new sentences to reprocess, and the old sentence of every other one
+    """
+    dirty = set()
+    old_of_new = {}
+    opcodes = SequenceMatcher(None, old_texts, new_texts, autojunk=False).get_opcodes()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            for k in range(j2 - j1):
+                old_of_new[j1 + k] = i1 + k
+        elif j1 == j2:
+            # a deletion is an edit between new sentences j1 - 1 and j1
+            dirty.update(range(j1 - margin, j1 + margin))
+        else:
+            dirty.update(range(j1 - margin, j2 + margin))
+    dirty = sorted(d for d in dirty if 0 <= d < len(new_texts))
+    return dirty, {j: i for j, i in old_of_new.items() if j not in dirty}
+
+
+# --------------------------------------------------------------------------------------------------
+def process_window(
+    abstractor: TextAbstractor, doc: Doc, sents: List, first: int, last: int
+) -> Dict[str, Dict[int, List[Block]]]:
+    """
+    Run the lemmatizer and the schema pipes over sentences `first` to `last`, plus
+    `CONTEXT_SENTENCES` on either side, and collect the blocks of sentences `first` to
+    `last` by span group, in the order the window has the groups. The tagger only sees
+    that much context, so a tag that depends on text further away may differ from
+    `process_text`'s.
+    """
+    start = max(first - CONTEXT_SENTENCES, 0)
+    end = min(last + CONTEXT_SENTENCES, len(sents) - 1)
+    offset = sents[start].start_char
+    window = doc[sents[start].start : sents[end].end].as_doc()
+    for name, proc in abstractor.nlp.pipeline:
+        if name not in SEGMENT_PIPES:
+            window = proc(window)
+
+    begins = [s.start_char for s in sents]
+    groups = {}
+    for key, suggestions in extract_suggestion_groups(window).items():
+        groups[key] = {}
+        for block in split_blocks(suggestions):
+            idx = bisect_right(begins, block[0].begin + offset) - 1
+            if first <= idx <= last:
+                block = [shift(s, offset) for s in block]
+                groups[key].setdefault(idx, []).append(block)
+    return groups
+
+
+# --------------------------------------------------------------------------------------------------
+def process_revision(
+    request: SuggestRequest,
+    previous: Optional[Revision] = None,
+    abstractor: Optional[TextAbstractor] = None,
+    margin: int = 1,
+) -> Tuple[ProcessTextResponse, Revision]:
+    """
+    Incremental `process_text` for an amended note. The new text is segmented into
+    sentences and sections in full, diffed against the previous revision sentence by
+    sentence, and tagging, matching, negation and relation extraction only re-run over
+    the changed sentences and `margin` sentences around them. Suggestions of the other
+    sentences are taken from `previous` with their offsets shifted. Pass no `previous`
+    (or one for different schemas or sections) to process the whole note.
+    :return: the response, equal to that of `process_text` as long as the tags of the
+    reprocessed sentences do not depend on text beyond `CONTEXT_SENTENCES`, and the
+    revision to pass along with the next amendment
+    """
+    abstractor = abstractor or TextAbstractor(abstract.pipeline_path)
+    abstractor.clear()
+    add_sections(abstractor, request)
+    prefetch_schemas(abstractor, request.abstractor_abstraction_schemas)
+    for meta_schema in request.abstractor_abstraction_schemas:
+        add_schema(abstractor, meta_schema)
+
+    with abstractor.nlp.select_pipes(enable=SEGMENT_PIPES):
+        doc = abstractor.nlp(request.text)
+    sents = list(doc.sents)
+    new_texts = [s.text_with_ws for s in sents]
+    signature = request_signature(request)
+
+    if previous is None or previous.signature != signature:
+        dirty, old_of_new = list(range(len(sents))), {}
+    else:
+        dirty, old_of_new = dirty_sentences(
+            previous.sentence_texts(), new_texts, margin
+        )
+
+    # reprocess runs of consecutive dirty sentences
+    groups: Dict[str, Dict[int, List[Block]]] = {}
+    if previous is not None and previous.signature == signature:
+        groups = {key: {} for key in previous.groups}
+    runs = []
+    for idx in dirty:
+        if runs and runs[-1][1] == idx - 1:
+            runs[-1][1] = idx
+        else:
+            runs.append([idx, idx])
+    for first, last in runs:
+        for key, blocks in process_window(abstractor, doc, sents, first, last).items():
+            groups.setdefault(key, {}).update(blocks)
+
+    # carry over the unchanged sentences
+    for j, i in old_of_new.items():
+        delta = sents[j].start_char - previous.sentence_begins[i]
+        for key, blocks in previous.groups.items():
+            if i in blocks:
+                groups[key][j] = [[shift(s, delta) for s in b] for b in blocks[i]]
+
+    # span groups in the order of the span ruler, as `process_text` has them, however
+    # the windows came across them
+    order = {m.name: i for i, m in enumerate(abstractor.span_ruler.matchers)}
+    groups = dict(sorted(groups.items(), key=lambda item: order.get(item[0], -1)))
+    suggestions = [
+        s
+        for blocks in groups.values()
+        for j in sorted(blocks)
+        for block in blocks[j]
+        for s in block
+    ]
+    response = ProcessTextResponse(
+        sections=extract_sections(doc),
+        sentences=extract_sentences(doc),
+        suggestions=filter_out_covered(suggestions),
+    )
+    revision = Revision(
+        request.text,
+        [s.start_char for s in sents],
+        groups,
+        signature,
+        reprocessed_sentences=len(dirty),
+    )
+    return response, revision
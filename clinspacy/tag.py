@@ -0,0 +1,162 @@
+import os
+import re
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from spacy.attrs import ORTH
+from spacy.language import Language
+from spacy.tokens import Doc, Token
+
+# value type flags of a token; a token can have several, e.g. "13.10.1968" is LIKE_NUM
+NUMBER = 1
+DATE = 2
+PERCENT = 4
+HYPHEN = 8
+# first of the 5 tokens of a date the tokenizer splits at hyphens, e.g. "1968-10-13"
+DATE_START = 16
+DATE_TOKENS = 5
+
+# single-token dates, exactly those the token pattern of date schemas has always matched
+DATE_FORMATS = [
+    r"\d{1,2}/\d{1,2}/\d\d(?:\d\d)?",  # 10/13/1968, 10/13/68
+]
+DATE_RE = re.compile(r"^(?:" + "|".join(DATE_FORMATS) + r")$")
+
+# further date formats common in clinical notes, opt-in with `set_extended_dates` or
+# CLINSPACY_EXTENDED_DATES=1, and then matched as DATE_TOKENS tokens when the tokenizer
+# splits them at hyphens
+EXTENDED_DATE_FORMATS = DATE_FORMATS + [
+    r"\d{1,2}-\d{1,2}-\d\d(?:\d\d)?",  # 10-13-1968, 10-13-68
+    r"\d{1,2}\.\d{1,2}\.\d{4}",  # 13.10.1968
+    r"\d{4}-\d{1,2}-\d{1,2}",  # 1968-10-13
+    r"\d{4}/\d{1,2}/\d{1,2}",  # 1968/10/13
+]
+EXTENDED_DATE_RE = re.compile(r"^(?:" + "|".join(EXTENDED_DATE_FORMATS) + r")$")
+
+extended_dates = os.environ.get("CLINSPACY_EXTENDED_DATES", "0") == "1"
+date_re = EXTENDED_DATE_RE if extended_dates else DATE_RE
+
+# value type flags of every token text classified so far, by orth id, which is the same
+# hash in every vocab; cleared once it holds MAX_ORTH_TYPES texts, as vocabs come and go
+orth_types: Dict[int, int] = {}
+MAX_ORTH_TYPES = 1000000
+
+
+# --------------------------------------------------------------------------------------------------
+def set_extended_dates(enabled: bool):
+    """
+    Tag the `EXTENDED_DATE_FORMATS` as dates too, or only the `DATE_FORMATS`, in docs
+    tagged from now on. Schemas parsed before keep the date token pattern they had.
+    """
+    global extended_dates, date_re
+    extended_dates = enabled
+    date_re = EXTENDED_DATE_RE if enabled else DATE_RE
+    orth_types.clear()
+
+
+# --------------------------------------------------------------------------------------------------
+def classify(text: str, like_num: bool) -> int:
+    flags = 0
+    if like_num:
+        flags |= NUMBER
+    if date_re.match(text):
+        flags |= DATE
+    if text == "%":
+        flags |= PERCENT
+    if text == "-":
+        flags |= HYPHEN
+    return flags
+
+
+# --------------------------------------------------------------------------------------------------
+def value_types(doc: Doc) -> np.ndarray:
+    """
+    Value type flags of the tokens of `doc`, from `doc._.value_types` if the token_typer
+    has run, otherwise classified here. Every distinct token text is only classified
+    once per process.
+    """
+    if doc._.value_types is not None:
+        return doc._.value_types
+    if len(doc) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    orths, inverse = np.unique(doc.to_array(ORTH), return_inverse=True)
+    if len(orth_types) + len(orths) > MAX_ORTH_TYPES:
+        orth_types.clear()
+    flags = np.empty(len(orths), dtype=np.uint8)
+    for idx, orth in enumerate(orths.tolist()):
+        flag = orth_types.get(orth)
+        if flag is None:
+            lexeme = doc.vocab[orth]
+            flag = orth_types[orth] = classify(lexeme.orth_, lexeme.like_num)
+        flags[idx] = flag
+    types = flags[inverse.reshape(-1)]
+
+    # number - number - number
+    n = len(types) - DATE_TOKENS + 1
+    if extended_dates and n > 0:
+        starts = np.ones(n, dtype=bool)
+        for offset in range(DATE_TOKENS):
+            flag = HYPHEN if offset % 2 else NUMBER
+            starts &= (types[offset : offset + n] & flag) > 0
+        for i in np.flatnonzero(starts).tolist():
+            if date_re.match(doc[i : i + DATE_TOKENS].text):
+                types[i] |= DATE_START
+    return types
+
+
+# --------------------------------------------------------------------------------------------------
+def match_value_type(doc: Doc, value_type: str) -> List[Tuple[int, int]]:
+    """
+    Token ranges of dates, or of numbers optionally followed by "%", in the order the
+    `Matcher` emits them for the equivalent token patterns.
+    """
+    types = value_types(doc)
+    if value_type == "date":
+        return [
+            (i, i + 1) if types[i] & DATE else (i, i + DATE_TOKENS)
+            for i in np.flatnonzero(types & (DATE | DATE_START)).tolist()
+        ]
+    matches = []
+    for i in np.flatnonzero(types & NUMBER).tolist():
+        matches.append((i, i + 1))
+        if i + 1 < len(types) and types[i + 1] & PERCENT:
+            matches.append((i, i + 2))
+    return matches
+
+
+# --------------------------------------------------------------------------------------------------
+def get_value_type(token: Token) -> Optional[str]:
+    types = value_types(token.doc)
+    flags = int(types[token.i])
+    if flags & DATE or np.any(
+        types[max(token.i - DATE_TOKENS + 1, 0) : token.i + 1] & DATE_START
+    ):
+        return "date"
+    if flags & NUMBER:
+        return "number"
+    if flags & PERCENT:
+        return "percent"
+    return None
+
+
+if not Doc.has_extension("value_types"):
+    Doc.set_extension("value_types", default=None)
+if not Token.has_extension("value_type"):
+    Token.set_extension("value_type", getter=get_value_type)
+
+
+# --------------------------------------------------------------------------------------------------
+@Language.factory("token_typer")
+class TokenTyper:
+    """
+    Classifies every token of a doc as a date, number or percent sign in one pass, for
+    date and number schemas to match on instead of running regex and LIKE_NUM token
+    patterns per schema and per relation context.
+    """
+
+    def __init__(self, nlp: Language, name: str):
+        self.name = name
+
+    def __call__(self, doc):
+        doc._.value_types = None
+        doc._.value_types = value_types(doc)
+        return doc
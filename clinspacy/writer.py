@@ -0,0 +1,290 @@
+import json
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from textabstractor.dataclasses import ProcessTextResponse, SectionSpan
+from clinspacy.columnar import TextColumns, TYPES, ASSERTIONS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# flattened tables and their column types, ready to load into NOTE_NLP staging
+TABLES = {
+    "sections": {
+        "note_id": "string",
+        "section_number": "int64",
+        "section_name": "string",
+        "begin": "int64",
+        "end": "int64",
+        "begin_header": "int64",
+        "end_header": "int64",
+    },
+    "sentences": {
+        "note_id": "string",
+        "sentence_number": "int64",
+        "begin": "int64",
+        "end": "int64",
+    },
+    "suggestions": {
+        "note_id": "string",
+        "predicate": "string",
+        "type": "string",
+        "value": "string",
+        "assertion": "string",
+        "begin": "int64",
+        "end": "int64",
+        "sentence_number": "int64",
+        "section_number": "int64",
+    },
+}
+
+
+# --------------------------------------------------------------------------------------------------
+def dumps(row: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(row)
+    return json.dumps(row, separators=(",", ":")).encode("utf-8")
+
+
+# --------------------------------------------------------------------------------------------------
+class TableFile:
+    """
+    The part file currently being written for one table. Parts are written under a
+    `.partial` name and renamed when closed, so any `part-*.jsonl` or `part-*.parquet`
+    file on disk is complete.
+    """
+
+    def __init__(self, path: Path, fmt: str, columns: Dict[str, str]):
+        self.path = path
+        self.partial_path = path.with_name(path.name + ".partial")
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.types = columns
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, buffer: Dict[str, List]):
+        n = len(buffer[self.columns[0]])
+        if self.fmt == "jsonl":
+            if self._file is None:
+                self._file = open(self.partial_path, "wb")
+            lines = [
+                dumps(dict(zip(self.columns, values)))
+                for values in zip(*[buffer[c] for c in self.columns])
+            ]
+            self._file.write(b"\n".join(lines) + b"\n")
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([(c, getattr(pa, t)()) for c, t in self.types.items()])
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(str(self.partial_path), schema)
+            self._writer.write_table(pa.Table.from_pydict(buffer, schema=schema))
+        self.rows += n
+
+    def close(self) -> Optional[Path]:
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+        if self._writer is not None:
+            self._writer.close()
+        if self.rows == 0:
+            return None
+        self.partial_path.rename(self.path)
+        return self.path
+
+
+# --------------------------------------------------------------------------------------------------
+class ResponseWriter:
+    """
+    Streams responses, keyed by note id, into flattened `sections`, `sentences` and
+    `suggestions` tables under `path`, one directory per table. Rows are buffered and
+    written every `batch_size` rows, and a table's part file is rotated once it holds
+    `rows_per_file` rows (None rotates only on `rotate` and `close`).
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        fmt: str = "jsonl",
+        batch_size: int = 10000,
+        rows_per_file: Optional[int] = 1000000,
+    ):
+        if fmt not in ["jsonl", "parquet"]:
+            raise ValueError(f"unsupported format: {fmt}")
+        if fmt == "parquet":
+            import pyarrow  # noqa: F401
+        self.path = Path(path)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.rows_per_file = rows_per_file
+        self.buffers: Dict[str, Dict[str, List]] = {}
+        self.files: Dict[str, TableFile] = {}
+        self.part_numbers: Dict[str, int] = {}
+        self.buffered_rows = 0
+        for table, columns in TABLES.items():
+            (self.path / table).mkdir(parents=True, exist_ok=True)
+            self.buffers[table] = {c: [] for c in columns}
+            # continue numbering after any parts left by an earlier run
+            existing = [
+                int(p.name.split(".")[0].split("-")[1])
+                for p in (self.path / table).glob("part-*")
+            ]
+            self.part_numbers[table] = max(existing, default=-1) + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, note_id: str, response: Union[ProcessTextResponse, TextColumns]):
+        if isinstance(response, TextColumns):
+            self._append_columns(note_id, response)
+        else:
+            self._append_response(note_id, response)
+        if self.buffered_rows >= self.batch_size:
+            self.flush()
+
+    def write_all(
+        self, responses: Iterable[Tuple[str, Union[ProcessTextResponse, TextColumns]]]
+    ):
+        for note_id, response in responses:
+            self.write(note_id, response)
+
+    def _extend(self, table: str, rows: Dict[str, List]):
+        buffer = self.buffers[table]
+        for column, values in rows.items():
+            buffer[column].extend(values)
+        self.buffered_rows += len(rows["note_id"])
+
+    def _append_sections(self, note_id: str, sections: List[SectionSpan]):
+        self._extend(
+            "sections",
+            {
+                "note_id": [note_id] * len(sections),
+                "section_number": [s.section_number for s in sections],
+                "section_name": [s.section_name for s in sections],
+                "begin": [s.begin for s in sections],
+                "end": [s.end for s in sections],
+                "begin_header": [s.begin_header for s in sections],
+                "end_header": [s.end_header for s in sections],
+            },
+        )
+
+    def _append_response(self, note_id: str, response: ProcessTextResponse):
+        sections = response.sections
+        sentence_begins = [s.begin for s in response.sentences]
+        self._append_sections(note_id, sections)
+        self._extend(
+            "sentences",
+            {
+                "note_id": [note_id] * len(response.sentences),
+                "sentence_number": [s.sentence_number for s in response.sentences],
+                "begin": sentence_begins,
+                "end": [s.end for s in response.sentences],
+            },
+        )
+        begins = [s.begin for s in response.suggestions]
+        self._extend(
+            "suggestions",
+            {
+                "note_id": [note_id] * len(begins),
+                "predicate": [s.predicate for s in response.suggestions],
+                "type": [s.type for s in response.suggestions],
+                "value": [s.value for s in response.suggestions],
+                "assertion": [s.assertion for s in response.suggestions],
+                "begin": begins,
+                "end": [s.end for s in response.suggestions],
+                "sentence_number": locate_sentences(sentence_begins, begins),
+                "section_number": locate_sections(sections, begins),
+            },
+        )
+
+    def _append_columns(self, note_id: str, columns: TextColumns):
+        self._append_sections(note_id, columns.sections)
+        sentence_begins = columns.sentence_begins.tolist()
+        self._extend(
+            "sentences",
+            {
+                "note_id": [note_id] * len(sentence_begins),
+                "sentence_number": list(range(len(sentence_begins))),
+                "begin": sentence_begins,
+                "end": columns.sentence_ends.tolist(),
+            },
+        )
+        begins = columns.begins.tolist()
+        self._extend(
+            "suggestions",
+            {
+                "note_id": [note_id] * len(begins),
+                "predicate": [columns.predicates[i] for i in columns.predicate_ids],
+                "type": [TYPES[i] for i in columns.types],
+                "value": [columns.values[i] for i in columns.value_ids],
+                "assertion": [ASSERTIONS[i] for i in columns.assertions],
+                "begin": begins,
+                "end": columns.ends.tolist(),
+                "sentence_number": locate_sentences(sentence_begins, begins),
+                "section_number": locate_sections(columns.sections, begins),
+            },
+        )
+
+    def flush(self):
+        for table, buffer in self.buffers.items():
+            if len(buffer["note_id"]) == 0:
+                continue
+            if table not in self.files:
+                name = f"part-{self.part_numbers[table]:05d}.{self.fmt}"
+                self.part_numbers[table] += 1
+                self.files[table] = TableFile(
+                    self.path / table / name, self.fmt, TABLES[table]
+                )
+            self.files[table].write(buffer)
+            self.buffers[table] = {c: [] for c in TABLES[table]}
+            if self.rows_per_file and self.files[table].rows >= self.rows_per_file:
+                self.files.pop(table).close()
+        self.buffered_rows = 0
+
+    def rotate(self) -> List[Path]:
+        """
+        Flush buffered rows and close the current part files.
+        :return: the part files completed by this call
+        """
+        self.flush()
+        paths = [f.close() for f in self.files.values()]
+        self.files = {}
+        return [p for p in paths if p is not None]
+
+    def close(self) -> List[Path]:
+        return self.rotate()
+
+
+# --------------------------------------------------------------------------------------------------
+def locate_sentences(
+    sentence_begins: List[int], begins: List[int]
+) -> List[Optional[int]]:
+    """Index of the sentence of each begin, None before the first sentence."""
+    numbers = []
+    for b in begins:
+        i = bisect_right(sentence_begins, b) - 1
+        numbers.append(i if i >= 0 else None)
+    return numbers
+
+
+def locate_sections(
+    sections: List[SectionSpan], begins: List[int]
+) -> List[Optional[int]]:
+    """Number of the section of each begin, the later one where sections overlap."""
+    ordered = sorted(sections, key=lambda s: s.begin)
+    section_begins = [s.begin for s in ordered]
+    numbers = []
+    for b in begins:
+        i = bisect_right(section_begins, b) - 1
+        numbers.append(
+            ordered[i].section_number if i >= 0 and b <= ordered[i].end else None
+        )
+    return numbers
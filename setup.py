@@ -23,7 +23,18 @@ setup(
     packages=find_packages(include=["clinspacy", "clinspacy.*"]),
     package_data={"clinspacy": ["data/*"]},
     include_package_data=True,
-    entry_points={"textabstractor": ["clinspacy = clinspacy.abstract"]},
+    entry_points={
+        "console_scripts": ["clinspacy = clinspacy.bulk:main"],
+        "textabstractor": ["clinspacy = clinspacy.abstract"],
+        "spacy_factories": [
+            "pysbd = clinspacy.segment:PySBDSentenceSplitter",
+            "sectionizer = clinspacy.segment:Sectionizer",
+            "token_typer = clinspacy.tag:TokenTyper",
+            "span_match_ruler = clinspacy.match:SpanRuler",
+            "negex = clinspacy.negate:Negex",
+            "relextractor = clinspacy.extract:RelationExtractor",
+        ],
+    },
     python_requires=">=3.9.0",
     install_requires=[
         "textabstractor",
@@ -34,6 +45,7 @@ setup(
     ],
     extras_require={
         "interactive": ["jupyterlab", "rise"],
+        "bulk": ["orjson", "pyarrow"],
         "dev": [
             "black",
             "pyment",
@@ -6,6 +6,7 @@ from clinspacy.abstract import TextAbstractor
 from importlib_resources import files
 import textabstractor_testdata.breast as data
 from pathlib import Path
+from pydantic.json import pydantic_encoder
 from typing import Dict, List
 from textabstractor.dataclasses import (
     AbstractionSchema,
@@ -14,7 +15,6 @@ from textabstractor.dataclasses import (
     ProcessTextResponse,
 )
 
-
 dir_path = Path(os.path.dirname(os.path.realpath(__file__)))
 
 
@@ -92,3 +92,14 @@ def process_text_responses() -> Dict[str, ProcessTextResponse]:
 @pytest.fixture(scope="function")
 def abstractor() -> TextAbstractor:
     return TextAbstractor()
+
+
+@pytest.fixture(scope="function")
+def fixtures(schemas, tmp_path) -> Path:
+    for schema_id, schema in schemas.items():
+        (tmp_path / f"{schema_id}.json").write_text(
+            json.dumps(
+                {"abstractor_abstraction_schema": schema}, default=pydantic_encoder
+            )
+        )
+    return tmp_path
@@ -1,6 +1,7 @@
 import pytest
 import textabstractor
 from clinspacy import abstract
+from clinspacy.abstract import TextAbstractor
 from pathlib import Path
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
@@ -15,12 +16,29 @@ def test_pipeline_loaded(abstractor):
         "tagger",
         "attribute_ruler",
         "lemmatizer",
+        "token_typer",
         "span_match_ruler",
         "negex",
         "relextractor",
     ]
 
 
+def test_pipeline_round_trip(abstractor, tmp_path):
+    abstractor.to_disk(tmp_path / "pipeline")
+    loaded = TextAbstractor(tmp_path / "pipeline")
+    assert loaded.nlp.pipe_names == abstractor.nlp.pipe_names
+    assert loaded.nlp.meta["version"] == abstractor.nlp.meta["version"]
+    assert (
+        loaded.negex.pre_neg_matcher.patterns
+        == abstractor.negex.pre_neg_matcher.patterns
+    )
+
+    text = "Carcinoma in-situ was not identified (2.0 cm) -- see note."
+    assert [t.text for t in loaded.nlp.make_doc(text)] == [
+        t.text for t in abstractor.nlp.make_doc(text)
+    ]
+
+
 @pytest.mark.parametrize(
     "note_number, expected",
     [
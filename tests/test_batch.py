@@ -0,0 +1,40 @@
+import copy
+import textabstractor
+from clinspacy import abstract
+from clinspacy.batch import fill, process_batches, schedule
+
+
+def test_schedule():
+    lengths = [50, 10, 300, 20, 40, 10]
+    assert schedule(lengths, batch_chars=100, batch_size=3) == [[1, 5, 3], [4, 0], [2]]
+    assert schedule(lengths, 100, 3, by_length=False) == [[0, 1], [2], [3, 4, 5]]
+    assert schedule([], 100, 3) == []
+    assert fill([10, 10]) == 1.0
+    assert fill([10, 30]) == 40 / 60
+
+
+def test_process_batches(suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    requests = []
+    for text in notes + [notes[0][:200], "", "\n\n".join(notes)]:
+        request = copy.deepcopy(suggest_request)
+        request.text = text
+        requests.append(request)
+    expected = [abstract.process_text(request) for request in requests]
+
+    batch_chars = max(len(note) for note in notes)
+    responses, report = process_batches(requests, batch_chars, batch_size=4)
+    assert responses == expected
+    stats = report.to_dict()
+    assert stats["docs"] == len(requests)
+    assert stats["outliers"] == 1
+    assert 0 < stats["fill"] <= 1
+    for batch in report.batches:
+        if not batch["outlier"]:
+            assert batch["docs"] <= 4 and batch["chars"] <= batch_chars
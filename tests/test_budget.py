@@ -0,0 +1,78 @@
+import textabstractor
+from clinspacy import abstract
+from clinspacy.budget import Budget, PartialResponse
+
+
+class CountdownBudget(Budget):
+    """Exceeded after `checks` checks, to stop at every point in turn."""
+
+    def __init__(self, checks: int):
+        super().__init__(0)
+        self.checks = checks
+
+    def exceeded(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def test_budget():
+    budget = Budget(60)
+    assert not budget.exceeded() and budget.complete
+    budget.skip("negex", ["a"])
+    other = Budget(0)
+    assert other.exceeded()
+    other.truncate("relextractor", ["b"])
+    budget.merge(other)
+    assert budget.skipped == ["negex"]
+    assert budget.truncated == ["relextractor"]
+    assert budget.incomplete == {"a", "b"}
+    response = budget.response(textabstractor.dataclasses.ProcessTextResponse())
+    assert isinstance(response, PartialResponse)
+    assert response.incomplete == ["a", "b"]
+
+
+def test_process_text_budget(suggest_request, schemas, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = """
+    A. The tumor size was 1cm at the greatest extent, no DCIS.
+    B. HER2 FISH is POSITIVE.
+    C. HER2 FISH is NEGATIVE.
+    Note: The specimen was collected on 10/13/1968.
+    """
+    expected = abstract.process_text(suggest_request)
+
+    monkeypatch.setattr(abstract, "time_budget", 60.0)
+    assert abstract.process_text(suggest_request) == expected
+
+    monkeypatch.setattr(abstract, "time_budget", 1e-9)
+    response = abstract.process_text(suggest_request)
+    assert isinstance(response, PartialResponse)
+    assert "relextractor" in response.skipped
+    assert response.suggestions == []
+
+    # stopped at every check in turn, whatever schemas complete match the full run
+    abstractor = abstract.create_abstractor(suggest_request)
+    full = abstract.annotate(abstractor, suggest_request.text, suggest_request)
+    expected_groups = abstract.extract_suggestion_groups(full)
+    checks = 0
+    while True:
+        budget = CountdownBudget(checks)
+        doc = abstract.annotate(
+            abstractor, suggest_request.text, suggest_request, budget=budget
+        )
+        if budget.complete:
+            break
+        sections, sentences, groups = abstract.extract_partial(doc, budget)
+        assert sentences in [[], expected.sentences]
+        assert budget.incomplete.isdisjoint(groups)
+        for key, group in groups.items():
+            assert group == expected_groups[key]
+        checks += 1
+    assert budget.checks >= 0
+    assert abstract.extract_response(doc, budget) == expected
@@ -0,0 +1,111 @@
+import json
+import pytest
+import textabstractor
+from clinspacy import abstract, bulk
+from clinspacy.bulk import CHECKPOINT, Checkpoint, main, make_shards, read_notes, run
+
+
+def read_rows(path, table):
+    return [
+        json.loads(line)
+        for p in sorted((path / table).glob("part-*.jsonl"))
+        for line in p.read_text().splitlines()
+    ]
+
+
+def test_read_notes(tmp_path):
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "b.txt").write_text("B")
+    (tmp_path / "notes" / "a.txt").write_text("A")
+    (tmp_path / "c.jsonl").write_text('{"note_id": 3, "text": "C"}\n\n')
+    (tmp_path / "d.txt").write_text("D")
+    notes = read_notes([tmp_path / "notes", tmp_path / "c.jsonl", tmp_path / "d.txt"])
+    assert list(notes) == [("a", "A"), ("b", "B"), ("3", "C"), ("d", "D")]
+    assert [len(s) for _, s in make_shards([("a", "A")] * 5, 2)] == [2, 2, 1]
+
+
+def test_checkpoint(tmp_path):
+    checkpoint = Checkpoint(tmp_path, 10)
+    (tmp_path / "sentences").mkdir()
+    part = tmp_path / "sentences" / "part-00000.jsonl"
+    part.write_text("")
+    orphan = tmp_path / "sentences" / "part-00001.jsonl.partial"
+    orphan.write_text("")
+    checkpoint.add(0, 10, 100, [part])
+    with open(tmp_path / CHECKPOINT, "a") as f:
+        f.write('{"shard": 1, "no')
+
+    checkpoint = Checkpoint(tmp_path, 10)
+    assert checkpoint.done(0) and not checkpoint.done(1)
+    assert checkpoint.remove_orphans() == [orphan]
+    assert part.exists()
+    with pytest.raises(ValueError):
+        Checkpoint(tmp_path, 20)
+
+
+def test_run(tmp_path, suggest_request, schemas, notes, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    corpus = [(f"note-{i}", text) for i, text in enumerate(notes + notes[:1])]
+    expected = run(corpus, suggest_request, tmp_path / "expected", shard_size=2)
+    assert (expected.shards, expected.notes) == (3, 5)
+
+    # killed after the first shard, with a part of the second left behind
+    output = tmp_path / "output"
+    process_shard = bulk.process_shard
+
+    def killed(shard, shard_notes):
+        if shard == 1:
+            (output / "suggestions" / "part-00009.jsonl").write_text("{}\n")
+            raise KeyboardInterrupt
+        return process_shard(shard, shard_notes)
+
+    monkeypatch.setattr(bulk, "process_shard", killed)
+    with pytest.raises(KeyboardInterrupt):
+        run(corpus, suggest_request, output, shard_size=2)
+    monkeypatch.setattr(bulk, "process_shard", process_shard)
+
+    resumed = run(corpus, suggest_request, output, shard_size=2)
+    assert (resumed.shards, resumed.notes) == (2, 3)
+    for table in ["sections", "sentences", "suggestions"]:
+        assert sorted(read_rows(output, table), key=json.dumps) == sorted(
+            read_rows(tmp_path / "expected", table), key=json.dumps
+        )
+    assert {r["note_id"] for r in read_rows(output, "suggestions")} == {
+        note_id for note_id, _ in corpus
+    }
+
+
+def test_main(tmp_path, suggest_request, schemas, capsys):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    (tmp_path / "request.json").write_text(suggest_request.json())
+    with open(tmp_path / "notes.jsonl", "w") as f:
+        for i in range(3):
+            text = "HER2 FISH is POSITIVE. The tumor size was 1cm."
+            f.write(json.dumps({"note_id": i, "text": text}) + "\n")
+    argv = [str(tmp_path / "notes.jsonl"), "--request", str(tmp_path / "request.json")]
+    argv += ["--output", str(tmp_path / "output"), "--shard-size", "2"]
+    main(argv + ["--processes", "2"])
+    out, err = capsys.readouterr()
+    assert json.loads(out)["notes"] == 3
+    assert len(err.splitlines()) == 2
+    rows = read_rows(tmp_path / "output", "suggestions")
+    assert sorted({r["note_id"] for r in rows}) == ["0", "1", "2"]
+    expected = abstract.process_text(
+        suggest_request.copy(update={"text": text}, deep=True)
+    )
+    assert len(rows) == 3 * len(expected.suggestions)
+
+    main(argv)
+    assert json.loads(capsys.readouterr().out)["notes"] == 0
@@ -0,0 +1,65 @@
+import textabstractor
+from clinspacy import abstract, chunk
+from clinspacy.chunk import process_windows, split_windows
+
+
+def test_split_windows():
+    text = "First paragraph.\n\nSecond one here.\nStill second.\n\nThird."
+    windows = split_windows(text, 30)
+    assert [text[b:e] for b, e in windows] == [
+        "First paragraph.\n\n",
+        "Second one here.\n",
+        "Still second.\n\nThird.",
+    ]
+    assert split_windows("nobreaksatall", 5) == [(0, 5), (5, 10), (10, 13)]
+    assert split_windows(text, len(text)) == [(0, len(text))]
+
+
+def test_process_windows(suggest_request, schemas, notes, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = "\n\n".join(notes[:3])
+    monkeypatch.setattr(abstract, "window_chars", 0)
+    expected = abstract.process_text(suggest_request)
+
+    response = process_windows(suggest_request, 4000)
+    assert [(s.begin, s.end) for s in response.sections] == [
+        (s.begin, s.end) for s in expected.sections
+    ]
+    assert response.sentences == expected.sentences
+    assert response.suggestions == expected.suggestions
+
+    monkeypatch.setattr(abstract, "window_chars", 4000)
+    monkeypatch.setattr(abstract, "window_workers", 2)
+    assert abstract.process_text(suggest_request) == response
+    # the workers and their pipelines are kept for the next long text
+    executor = chunk.window_pools[2]
+    assert abstract.process_text(suggest_request) == response
+    assert chunk.window_pools[2] is executor
+
+
+def test_process_windows_without_headers(suggest_request, schemas, notes, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    # no window starts with a section header
+    suggest_request.abstractor_sections = []
+    suggest_request.text = "\n\n".join(notes[:3])
+    monkeypatch.setattr(abstract, "window_chars", 0)
+    expected = abstract.process_text(suggest_request)
+
+    response = process_windows(suggest_request, 4000)
+    assert [(s.begin, s.end) for s in response.sections] == [
+        (s.begin, s.end) for s in expected.sections
+    ]
+    assert response.sentences == expected.sentences
+    assert response.suggestions == expected.suggestions
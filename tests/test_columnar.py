@@ -0,0 +1,35 @@
+import numpy as np
+import textabstractor
+from clinspacy import abstract
+from clinspacy.columnar import covered_mask
+from textabstractor.dataclasses import Suggestion
+
+
+def test_covered_mask():
+    suggestions = [
+        Suggestion(
+            predicate="p", begin=b, end=e, type="value", value="v", assertion="present"
+        )
+        for b, e in [(0, 10), (2, 5), (2, 5), (0, 10), (8, 14), (8, 12), (20, 21)]
+    ]
+    expected = abstract.filter_out_covered(suggestions)
+    mask = covered_mask(
+        np.array([s.begin for s in suggestions]), np.array([s.end for s in suggestions])
+    )
+    assert [s for s, covered in zip(suggestions, mask) if not covered] == expected
+
+
+def test_columns_to_response(suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+
+    suggest_request.text = notes[2]
+    columns = abstract.process_text_columns(suggest_request)
+    response = abstract.process_text(suggest_request)
+    assert len(columns) == len(response.suggestions)
+    assert columns.to_response() == response
@@ -0,0 +1,61 @@
+import json
+import pickle
+import textabstractor
+from clinspacy.bulk import run
+from clinspacy.corpus import convert, is_corpus, main, read_text_files
+
+
+def test_corpus(tmp_path, notes):
+    (tmp_path / "notes" / "xtra").mkdir(parents=True)
+    for i, text in enumerate(notes):
+        (tmp_path / "notes" / f"note-{i}.txt").write_text(text)
+    (tmp_path / "notes" / "xtra" / "note-é.txt").write_text("Größe 1cm.")
+
+    corpus = convert(read_text_files(tmp_path / "notes"), tmp_path / "corpus")
+    assert is_corpus(tmp_path / "corpus")
+    assert len(corpus) == len(notes) + 1
+    assert list(corpus) == [(f"note-{i}", text) for i, text in enumerate(notes)] + [
+        ("note-é", "Größe 1cm.")
+    ]
+    assert corpus.metadata(len(notes)) == {"path": "xtra/note-é.txt"}
+    assert corpus.lengths()[-1] == len("Größe 1cm.".encode("utf-8"))
+    assert [len(r) for r in corpus.ranges(2)] == [2, 2, 1]
+    assert list(pickle.loads(pickle.dumps(corpus))) == list(corpus)
+
+    empty = convert([], tmp_path / "empty")
+    assert len(empty) == 0 and list(empty) == []
+
+
+def test_main(tmp_path, capsys):
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "a.txt").write_text("HER2 FISH is POSITIVE.")
+    main([str(tmp_path / "notes"), "--output", str(tmp_path / "corpus")])
+    assert json.loads(capsys.readouterr().out) == {"notes": 1, "bytes": 22}
+
+
+def test_run_corpus(tmp_path, suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    (tmp_path / "notes").mkdir()
+    for i, text in enumerate(notes):
+        (tmp_path / "notes" / f"note-{i}.txt").write_text(text)
+    corpus = convert(read_text_files(tmp_path / "notes"), tmp_path / "corpus")
+
+    run(list(corpus), suggest_request, tmp_path / "expected", shard_size=3)
+    progress = run(corpus, suggest_request, tmp_path / "output", 2, shard_size=3)
+    assert (progress.shards, progress.notes) == (2, len(notes))
+    for table in ["sections", "sentences", "suggestions"]:
+        expected, rows = [
+            sorted(
+                line
+                for p in (path / table).glob("part-*.jsonl")
+                for line in p.read_text().splitlines()
+            )
+            for path in [tmp_path / "expected", tmp_path / "output"]
+        ]
+        assert rows == expected
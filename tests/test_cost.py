@@ -0,0 +1,70 @@
+import json
+import textabstractor
+from clinspacy.cost import analyze, main, pattern_stats, schema_cost
+
+
+def test_pattern_stats():
+    stats = pattern_stats(
+        [
+            [{"LEMMA": "her2"}, {"ORTH": "-", "OP": "?"}, {"LEMMA": "neu"}],
+            [{"ORTH": "(", "OP": "?"}, {"TEXT": {"REGEX": "^\\d+$"}}],
+        ]
+    )
+    assert stats == {
+        "patterns": 2,
+        "tokens": 5,
+        "optional": 2,
+        "optional_density": 0.4,
+        "regex": 1,
+        "unanchored": 1,
+        "branches": 4,
+        "longest": 3,
+    }
+    assert pattern_stats([])["optional_density"] == 0.0
+
+
+def test_analyze(suggest_request, schemas, abstractor):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    reports = analyze(suggest_request.abstractor_abstraction_schemas, abstractor)
+    assert len(reports) == len(suggest_request.abstractor_abstraction_schemas)
+    keys = [(r["branches"], r["regex"], r["patterns"]) for r in reports]
+    assert keys == sorted(keys, reverse=True)
+    for report in reports:
+        schema = schemas[
+            next(
+                m.abstractor_abstraction_schema_id
+                for m in suggest_request.abstractor_abstraction_schemas
+                if m.abstractor_abstraction_schema_uri == report["schema_uri"]
+            )
+        ]
+        assert report["predicate"] == schema.predicate
+        assert report["typed"] <= report["values"]
+
+    date = schema_cost(
+        {},
+        [
+            {
+                "predicate": "has_surgery_date",
+                "patterns": [[{"TEXT": {"REGEX": "x"}}]],
+                "value_type": "date",
+            }
+        ],
+    )
+    assert (date["predicate"], date["typed"], date["patterns"]) == (
+        "has_surgery_date",
+        1,
+        0,
+    )
+
+
+def test_main(suggest_request, fixtures, capsys):
+    (fixtures / "request.json").write_text(suggest_request.json())
+    main(["--fixtures", str(fixtures)])
+    reports = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(reports) == len(suggest_request.abstractor_abstraction_schemas)
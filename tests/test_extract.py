@@ -12,7 +12,6 @@ from textabstractor.dataclasses import (
     SuggestRequest,
 )
 
-
 dir_path = Path(os.path.dirname(os.path.realpath(__file__)))
 
 
@@ -51,24 +50,24 @@ def test_relation_extractor(suggest_request, abstractor):
     abstractor.span_ruler.add(
         f"{name_patterns['rule_type']}:{name_patterns['value']}", name_patterns
     )
-    doc = abstractor.nlp(
-        """
+    doc = abstractor.nlp("""
     The patient has DCIS. Tumor size: large, 3.5cm, less then 4.0cm.
     Certainly less than 5.0cm. Tumor extent is 10%, very small.
-    """
-    )
+    """)
 
     spans = doc.spans["name:tumor size"]
 
     assert len(spans) == 2
-    assert "value_map" in spans.attrs
-    assert len(spans.attrs["value_map"]) == 2
-    assert len(spans.attrs["value_map"][spans[0]]) == 3
-    assert spans.attrs["value_map"][spans[0]][0].label_ == "large"
-    assert spans.attrs["value_map"][spans[0]][1].label_ == "3.5"
-    assert spans.attrs["value_map"][spans[0]][2].label_ == "4.0"
-    assert len(spans.attrs["value_map"][spans[1]]) == 1
-    assert spans.attrs["value_map"][spans[1]][0].label_ == "10%"
+    assert set(spans.attrs) == {"ruleset", "relations", "labels"}
+    relations = get_relations(spans)
+    assert len(relations) == 2
+    assert len(relations[0]) == 3
+    assert relations[0][0].label_ == "large"
+    assert relations[0][1].label_ == "3.5"
+    assert relations[0][2].label_ == "4.0"
+    assert len(relations[1]) == 1
+    assert relations[1][0].label_ == "10%"
+    assert spans.attrs["relations"].dtype == np.int32
 
 
 def test_no_xxx_identified(abstractor):
@@ -156,3 +155,31 @@ def test_not_identified():
     assert len([r for r in response.suggestions if r.type == "value"]) == 2
     assert len([r for r in response.suggestions if r.value == "not identified"]) == 1
     assert len([r for r in response.suggestions if r.value == "present"]) == 1
+
+
+def test_value_window(abstractor):
+    abstractor.nlp.replace_pipe(
+        "relextractor", "relextractor", config={"value_window": 5}
+    )
+    name_patterns = {
+        "predicate": "has_tumor_size",
+        "patterns": [[{"LEMMA": "tumor"}, {"LEMMA": "size"}]],
+        "value": "tumor size",
+        "rule_type": "name",
+        "object_type": "list",
+        "value_patterns": [
+            {
+                "predicate": "has_tumor_size",
+                "patterns": [[{"LIKE_NUM": True}]],
+                "value": "number",
+                "rule_type": "value",
+                "object_type": "number",
+            }
+        ],
+    }
+    abstractor.span_ruler.add("has_tumor_size", name_patterns)
+    doc = abstractor.nlp(
+        "1 " + "large " * 10 + "tumor size of 2 and " + "large " * 10 + "3"
+    )
+    relations = get_relations(doc.spans["has_tumor_size"])
+    assert [s.label_ for s in relations[0]] == ["2"]
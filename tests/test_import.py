@@ -0,0 +1,36 @@
+import os
+import sys
+import json
+import subprocess
+
+# seconds allowed for `import clinspacy.abstract` once the host has imported textabstractor
+IMPORT_BUDGET = float(os.environ.get("CLINSPACY_IMPORT_BUDGET", "0.25"))
+
+MEASURE = """
+import sys, time, json
+import textabstractor.dataclasses
+start = time.perf_counter()
+import clinspacy.abstract
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import():
+    out = subprocess.run(
+        [sys.executable, "-c", MEASURE], capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_is_lazy():
+    modules = measure_import()["modules"]
+    assert "spacy" not in modules
+    assert "pysbd" not in modules
+    assert "clinspacy.negate" not in modules
+
+
+def test_import_time_budget():
+    # best of three, to keep a cold filesystem cache from failing the run
+    elapsed = min(measure_import()["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET
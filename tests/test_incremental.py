@@ -0,0 +1,84 @@
+import copy
+import time
+import datetime
+import textabstractor
+from clinspacy import abstract
+from clinspacy.incremental import IncrementalAbstractor
+from clinspacy.loadtest import SchemaService, clear_schema_cache
+
+
+def test_reprocess_changed_schema(abstractor, suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = notes[0]
+    expected = abstract.process_text(suggest_request)
+
+    incremental = IncrementalAbstractor(abstractor)
+    matched = []
+    match_schema = incremental.match_schema
+    incremental.match_schema = lambda doc_bytes, meta: (
+        matched.append(meta.abstractor_abstraction_schema_id)
+        or match_schema(doc_bytes, meta)
+    )
+    assert incremental.process_text("note-1", suggest_request) == expected
+    assert len(matched) == 15
+
+    matched.clear()
+    changed = suggest_request.abstractor_abstraction_schemas[3]
+    changed.updated_at = changed.updated_at + datetime.timedelta(days=1)
+    assert incremental.process_text("note-1", suggest_request) == expected
+    assert matched == [changed.abstractor_abstraction_schema_id]
+
+    matched.clear()
+    assert incremental.process_text("note-1", suggest_request) == expected
+    assert matched == []
+
+
+def test_reprocess_refreshed_schema(
+    abstractor, suggest_request, fixtures, notes, monkeypatch
+):
+    monkeypatch.setattr(abstract, "schema_refresher", None)
+    suggest_request.text = notes[0]
+    service = SchemaService(fixtures, latency=0.5)
+    clear_schema_cache()
+    with service.installed():
+        abstract.prefetch_schemas(
+            abstractor, suggest_request.abstractor_abstraction_schemas
+        )
+        refresher = abstract.enable_schema_refresh()
+        try:
+            incremental = IncrementalAbstractor(abstractor)
+            matched = []
+            match_schema = incremental.match_schema
+            incremental.match_schema = lambda doc_bytes, meta: (
+                matched.append(meta.abstractor_abstraction_schema_id)
+                or match_schema(doc_bytes, meta)
+            )
+            incremental.process_text("note-1", suggest_request)
+
+            # the stale patterns are served, and matched again once refreshed
+            schema_metadatas = suggest_request.abstractor_abstraction_schemas
+            changed = copy.deepcopy(schema_metadatas[3])
+            changed.updated_at += datetime.timedelta(days=1)
+            schema_metadatas[3] = changed
+            matched.clear()
+            incremental.process_text("note-1", suggest_request)
+            assert matched == [changed.abstractor_abstraction_schema_id]
+            deadline = time.monotonic() + 30
+            while refresher.stats()["pending"]:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+
+            matched.clear()
+            incremental.process_text("note-1", suggest_request)
+            assert matched == [changed.abstractor_abstraction_schema_id]
+            matched.clear()
+            incremental.process_text("note-1", suggest_request)
+            assert matched == []
+        finally:
+            refresher.stop()
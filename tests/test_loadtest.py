@@ -0,0 +1,78 @@
+import json
+import copy
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from clinspacy import abstract
+from clinspacy.loadtest import (
+    SchemaService,
+    SchemaServiceError,
+    clear_schema_cache,
+    run_scenario,
+)
+
+
+def test_schema_service(suggest_request, schemas, fixtures):
+    schema_metadata = suggest_request.abstractor_abstraction_schemas[0]
+    service = SchemaService(fixtures)
+    assert (
+        service.get_abstraction_schema(schema_metadata)
+        == schemas[schema_metadata.abstractor_abstraction_schema_id]
+    )
+    with service.serving() as url:
+        with urlopen(
+            f"{url}/{schema_metadata.abstractor_abstraction_schema_id}.json"
+        ) as f:
+            assert json.loads(f.read()) == service.fetch_json(
+                schema_metadata.abstractor_abstraction_schema_id
+            )
+        service.failure_rate = 1.0
+        with pytest.raises(HTTPError):
+            urlopen(f"{url}/{schema_metadata.abstractor_abstraction_schema_id}.json")
+    with pytest.raises(SchemaServiceError):
+        service.get_abstraction_schema(schema_metadata)
+    assert (service.fetches, service.failures) == (5, 2)
+
+
+def test_run_scenario(suggest_request, fixtures):
+    suggest_request.text = "HER2 FISH is POSITIVE. The tumor size was 1cm."
+    requests = [copy.copy(suggest_request) for _ in range(4)]
+    service = SchemaService(fixtures, latency=0.01)
+    schemas = len(suggest_request.abstractor_abstraction_schemas)
+
+    cold = run_scenario("cold", requests, service, concurrency=2)
+    assert cold.errors == 0
+    assert cold.fetches >= schemas
+    assert run_scenario("warm", requests, service, concurrency=2).fetches == 0
+    churn = run_scenario("churn", requests, service, concurrency=1)
+    assert churn.fetches == len(requests)
+    assert churn.to_dict()["requests"] == len(requests)
+    assert churn.percentile(50) <= churn.percentile(99)
+
+    service.failure_rate = 1.0
+    assert run_scenario("cold", requests, service).errors == len(requests)
+    # priming the cache does not fail, churned schemas do
+    churn = run_scenario("churn", requests, service, concurrency=1)
+    assert churn.errors == len(requests)
+    assert service.failure_rate == 1.0
+
+
+def test_fetch_schemas(suggest_request, fixtures):
+    schema_metadatas = suggest_request.abstractor_abstraction_schemas
+    service = SchemaService(fixtures, latency=0.2)
+    clear_schema_cache()
+    with service.installed():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(2) as executor:
+            results = list(executor.map(abstract.fetch_schemas, [schema_metadatas] * 2))
+        elapsed = time.perf_counter() - start
+    assert results[0] == results[1]
+    assert len(results[0]) == len(
+        {abstract.get_schema_key(m) for m in schema_metadatas}
+    )
+    # fetched concurrently, and once for both requests
+    assert elapsed < 0.2 * len(schema_metadatas)
+    assert service.fetches == len(results[0])
+    assert abstract.schema_fetches == {}
@@ -1,6 +1,8 @@
+import gc
 import spacy
 import pytest
 from spacy.lang.en import English
+from clinspacy import match
 from clinspacy.match import *
 
 
@@ -24,16 +26,16 @@ def test_span_matcher_on_doc(patterns):
     doc = nlp("This is a test. Hello world!")
     group = span_matcher.match(doc)
     assert len(group) == 2
-    assert group.attrs["id"] == "id1"
-    assert group.attrs["predicate"] == "predicate1"
+    assert get_attrs(group)["id"] == "id1"
+    assert get_attrs(group)["predicate"] == "predicate1"
     texts = [s.text for s in group]
     assert "Hello world" in texts
     assert "Hello" in texts
 
     group = span_matcher.match(doc, keep_longest=True)
     assert len(group) == 1
-    assert group.attrs["id"] == "id1"
-    assert group.attrs["predicate"] == "predicate1"
+    assert get_attrs(group)["id"] == "id1"
+    assert get_attrs(group)["predicate"] == "predicate1"
     assert group[0].text == "Hello world"
 
 
@@ -58,3 +60,78 @@ def test_span_ruler(patterns):
     assert "span_match_ruler" in nlp.pipe_names
     doc = nlp("This is a test. Hello world!")
     assert len(doc.spans) == 2
+
+
+def test_pattern_anchors(patterns):
+    assert pattern_anchor([{"ORTH": ",", "OP": "?"}, {"LEMMA": "tumor"}]) == (
+        "LEMMA",
+        {"tumor"},
+    )
+    assert pattern_anchor([{"LIKE_NUM": True}, {"ORTH": "%", "OP": "?"}]) is None
+    assert pattern_length([{"LOWER": "a"}, {"LOWER": "b", "OP": "?"}]) == 2
+    assert pattern_length([{"LOWER": "a", "OP": "+"}]) is None
+
+    span_matcher = SpanMatcher(patterns["predicate"], patterns)
+    assert span_matcher.anchors == {"LOWER": {"hello"}}
+    nlp = English()
+    doc = nlp("Nothing to see. Still nothing. Hello world!")
+    assert span_matcher.candidate_regions(nlp("Nothing to see here.")) == []
+    assert span_matcher.candidate_regions(doc) == [(6, 9)]
+    assert [s.text for s in span_matcher.match(doc)] == ["Hello", "Hello world"]
+
+    span_matcher = SpanMatcher("number", {"patterns": [[{"LIKE_NUM": True}]]})
+    assert span_matcher.anchors is None
+    assert span_matcher.candidate_regions(doc) is None
+
+
+def test_ruleset(patterns):
+    ruleset_id = get_ruleset_id(patterns)
+    assert get_ruleset_id(patterns) == ruleset_id
+    # the same metadata from another pattern dict, e.g. of another process
+    assert get_ruleset_id(dict(patterns)) == ruleset_id
+    assert get_ruleset_id({**patterns, "id": "id2"}) != ruleset_id
+
+    group = SpanMatcher(patterns["predicate"], patterns).match(English()("hello"))
+    assert group.attrs == {"ruleset": ruleset_id}
+    assert "patterns" not in get_attrs(group)
+    with pytest.raises(TypeError):
+        get_attrs(group)["id"] = "id2"
+
+
+def test_ruleset_lifetime(patterns, monkeypatch):
+    monkeypatch.setattr(match, "RULESET_IDS_MAXSIZE", 2)
+    patterns = {**patterns, "id": "lifetime"}
+    span_matcher = SpanMatcher(patterns["predicate"], patterns)
+    ruleset_id = span_matcher.ruleset
+    # a replaced schema's patterns are forgotten, the matchers using them keep theirs
+    forget_rulesets([patterns])
+    assert id(patterns) not in match.ruleset_ids
+    assert match.rulesets[ruleset_id]["id"] == "lifetime"
+    del span_matcher
+    gc.collect()
+    assert ruleset_id not in match.rulesets
+
+    others = [{**patterns, "id": f"id{i}"} for i in range(3)]
+    for p in others:
+        get_ruleset_id(p)
+    assert [p for p, _ in match.ruleset_ids.values()] == others[1:]
+
+
+def test_ruleset_outlives_pipeline(patterns):
+    patterns = {**patterns, "id": "outlives"}
+    nlp = English()
+    nlp.add_pipe("span_match_ruler").add("groups", patterns)
+    doc = nlp("Hello world!")
+    ruleset_id = doc.spans["groups"].attrs["ruleset"]
+    # the doc holds the ruleset of its groups once the pipeline is gone
+    forget_rulesets([patterns])
+    del nlp
+    gc.collect()
+    assert get_attrs(doc.spans["groups"])["id"] == "outlives"
+
+    copied = Doc(doc.vocab).from_bytes(doc.to_bytes())
+    del doc
+    gc.collect()
+    assert ruleset_id not in match.rulesets
+    # a ruleset no longer registered leaves the bare attrs
+    assert get_attrs(copied.spans["groups"]) == {"ruleset": ruleset_id}
@@ -0,0 +1,47 @@
+import textabstractor
+from clinspacy import abstract
+from clinspacy.memo import SentenceMemo
+
+
+def test_sentence_memo_lru():
+    memo = SentenceMemo(maxsize=2)
+    assert memo.get("a") is None
+    memo.put("a", {})
+    memo.put("b", {})
+    assert memo.get("a") == {}
+    memo.put("c", {})
+    assert memo.get("b") is None
+    assert memo.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+        "hit_rate": 1 / 3,
+    }
+    assert not SentenceMemo().enabled
+
+
+def test_memoized_process_text(suggest_request, schemas, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = """
+    A. The tumor size was 1cm at the greatest extent.
+    B. HER2 FISH is POSITIVE.
+    C. HER2 FISH is NEGATIVE.
+    Note: The specimen was collected on 10/13/1968.
+    """ * 3
+    expected = abstract.process_text(suggest_request)
+
+    memo = SentenceMemo(maxsize=100)
+    monkeypatch.setattr(abstract, "sentence_memo", memo)
+    assert abstract.process_text(suggest_request) == expected
+    assert memo.hits > 0
+    misses = memo.misses
+    assert abstract.process_text(suggest_request) == expected
+    assert memo.misses == misses
@@ -3,6 +3,7 @@ import pytest
 from spacy.lang.en import English
 from clinspacy import parse
 from clinspacy.negate import *
+from clinspacy.negate import config
 
 
 @pytest.fixture
@@ -131,7 +132,7 @@ def test_negation(abstractor, sample_text, suggest_request, schemas):
     span_groups = [
         group
         for _, group in doc.spans.items()
-        if group and group.attrs.get("rule_type", "") == "value"
+        if group and get_attrs(group).get("rule_type", "") == "value"
     ]
     spans = [s for g in span_groups for s in g]
     spans.sort()
@@ -142,3 +143,71 @@ def test_negation(abstractor, sample_text, suggest_request, schemas):
     assert spans[4]._.negated is False
     assert spans[5]._.negated is True
     assert spans[6]._.negated is True
+
+
+def test_trigger_matcher(abstractor, sample_text):
+    negex = Negex(abstractor.nlp, "negex")
+    # the same trigger phrases as config.yml, in one matcher labelled by kind
+    for kind, trigger_matcher in zip(TRIGGERS, negex.trigger_matchers):
+        assert trigger_matcher.patterns == Negex.parse_phrases(
+            kind, config["negation"][kind], abstractor.nlp
+        )
+    matcher = negex.matcher(abstractor.nlp.vocab)
+    assert len(matcher) == len(TRIGGERS)
+    assert negex.matcher(abstractor.nlp.vocab) is matcher
+
+    doc = abstractor.nlp(sample_text)
+    triggers = negex.match_triggers(doc)
+    for kind, trigger_matcher in zip(TRIGGERS, negex.trigger_matchers):
+        assert triggers[kind] == [(s.start, s.end) for s in trigger_matcher.match(doc)]
+
+
+def test_load_without_parsing(abstractor, tmp_path, monkeypatch):
+    negex = Negex(abstractor.nlp, "negex")
+    negex.to_disk(tmp_path / "negex")
+
+    def parse_phrases(*args):
+        raise AssertionError("trigger phrases parsed")
+
+    monkeypatch.setattr(Negex, "parse_phrases", parse_phrases)
+    loaded = Negex(abstractor.nlp, "negex").from_disk(tmp_path / "negex")
+    assert [m.patterns for m in loaded.trigger_matchers] == [
+        m.patterns for m in negex.trigger_matchers
+    ]
+
+
+def test_resolve_triggers():
+    triggers = Negex.resolve_triggers(
+        {
+            "pseudo_negations": [(0, 3)],
+            "pre_negations": [(0, 1), (5, 6), (8, 9)],
+            "post_negations": [(1, 3), (5, 7), (8, 9)],
+            "terminators": [(10, 11), (10, 12)],
+        }
+    )
+    assert triggers == {
+        "pseudo_negations": [(0, 3)],
+        "pre_negations": [(8, 9)],
+        "post_negations": [(5, 7), (8, 9)],
+        "terminators": [(10, 12)],
+    }
+
+
+@pytest.mark.parametrize(
+    "scope_window, negated", [(None, True), (100, True), (5, False)]
+)
+def test_scope_window(abstractor, scope_window, negated):
+    abstractor.nlp.replace_pipe("negex", "negex", config={"scope_window": scope_window})
+    abstractor.span_ruler.add(
+        "DCIS",
+        {
+            "predicate": "has_dcis",
+            "patterns": [[{"LOWER": "dcis"}]],
+            "value": "DCIS",
+            "rule_type": "value",
+            "object_type": "list",
+        },
+    )
+    doc = abstractor.nlp("No evidence of " + "large " * 20 + "DCIS was found.")
+    assert len(list(doc.sents)) == 1
+    assert [s._.negated for s in doc.spans["DCIS"]] == [negated]
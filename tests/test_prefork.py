@@ -0,0 +1,117 @@
+import gc
+import sys
+import copy
+import json
+import time
+import pytest
+import urllib.error
+import urllib.request
+import textabstractor
+from datetime import timedelta
+from pydantic.json import pydantic_encoder
+from clinspacy import abstract
+from clinspacy.loadtest import SchemaService, cached_updated_at, clear_schema_cache
+from clinspacy.prefork import PreforkServer, measure, memory_usage
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="forks and reads /proc"
+)
+
+
+@pytest.fixture
+def cached_schemas(suggest_request, schemas, monkeypatch):
+    monkeypatch.setattr(abstract, "shared_pool", None)
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    yield
+    gc.unfreeze()
+
+
+def test_memory_usage():
+    usage = memory_usage()
+    assert 0 < usage["uss"] <= usage["pss"] <= usage["rss"]
+
+
+def test_prefork_server(cached_schemas, suggest_request, notes, monkeypatch):
+    suggest_request.text = notes[2]
+    expected = json.loads(
+        json.dumps(abstract.process_text(suggest_request), default=pydantic_encoder)
+    )
+    process_text = abstract.process_text
+
+    def failing(request):
+        if request.text == "fail":
+            raise RuntimeError("failed")
+        return process_text(request)
+
+    monkeypatch.setattr(abstract, "process_text", failing)
+    body = json.dumps(suggest_request, default=pydantic_encoder).encode("utf-8")
+
+    with PreforkServer(workers=2, requests=[suggest_request]) as server:
+        assert abstract.shared_pool is not None and len(server.pids) == 2
+        for _ in range(3):
+            with urllib.request.urlopen(server.url, body) as response:
+                assert json.loads(response.read()) == expected
+        # a failing request is answered with an error, and the worker serves on
+        broken = json.dumps({**json.loads(body), "text": "fail"}).encode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(server.url, broken)
+        assert e.value.code == 500
+        with urllib.request.urlopen(server.url, body) as response:
+            assert json.loads(response.read()) == expected
+        # most of a worker's memory is the master's, shared copy-on-write
+        for usage in server.memory():
+            assert usage["shared"] > usage["uss"]
+
+
+def test_prefork_schema_refresh(suggest_request, fixtures, notes, monkeypatch):
+    monkeypatch.setattr(abstract, "shared_pool", None)
+    monkeypatch.setattr(abstract, "schema_refresher", None)
+    suggest_request.text = notes[2]
+    schema_metadatas = suggest_request.abstractor_abstraction_schemas
+    updated = copy.deepcopy(schema_metadatas[0])
+    updated.updated_at += timedelta(days=1)
+    process_text = abstract.process_text
+
+    def served_updated_at(request):
+        process_text(request)
+        return str(cached_updated_at(updated))
+
+    monkeypatch.setattr(abstract, "process_text", served_updated_at)
+    clear_schema_cache()
+    polled = copy.deepcopy(schema_metadatas[1])
+    polled.updated_at += timedelta(days=1)
+    with SchemaService(fixtures).installed():
+        # the master's refresher threads are running by the time it forks
+        refresher = abstract.enable_schema_refresh(lambda: [polled], interval=0.05)
+        try:
+            deadline = time.monotonic() + 30
+            while not abstract.is_cached(polled):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            with PreforkServer(workers=1, requests=[suggest_request]) as server:
+                schema_metadatas[0] = updated
+                body = json.dumps(suggest_request, default=pydantic_encoder)
+                # the worker serves the stale schema, and refreshes it on its own
+                while True:
+                    with urllib.request.urlopen(server.url, body.encode()) as response:
+                        if json.loads(response.read()) == str(updated.updated_at):
+                            break
+                    assert time.monotonic() < deadline
+                    time.sleep(0.05)
+        finally:
+            refresher.stop()
+            gc.unfreeze()
+
+
+def test_measure(cached_schemas, suggest_request, notes):
+    suggest_request.text = notes[2]
+    results = measure(suggest_request, workers=2)
+    assert len(results["preforked"]["workers"]) == 2
+    assert results["preforked"]["uss"] < results["independent"]["uss"]
+    assert abstract.shared_pool is None
@@ -0,0 +1,130 @@
+import json
+import textabstractor
+from clinspacy import abstract
+from clinspacy.profile import LatencyProfiler, MemoryProfiler, replay
+
+
+def test_memory_profiler(suggest_request, schemas, tmp_path, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = """
+    A. The tumor size was 1cm at the greatest extent.
+    B. HER2 FISH is POSITIVE.
+    C. HER2 FISH is NEGATIVE.
+    Note: The specimen was collected on 10/13/1968.
+    """
+    expected = abstract.process_text(suggest_request)
+
+    profiler = MemoryProfiler(sample_rate=1.0, log_path=tmp_path / "memory.jsonl")
+    monkeypatch.setattr(abstract, "memory_profiler", profiler)
+    assert abstract.process_text(suggest_request) == expected
+    assert abstract.process_text(suggest_request) == expected
+
+    records = [
+        json.loads(line)
+        for line in (tmp_path / "memory.jsonl").read_text().splitlines()
+    ]
+    assert len(records) == 2
+    assert records[-1] == profiler.last
+    assert list(profiler.last["components"]) == [
+        "setup",
+        "tokenizer",
+        "pysbd",
+        "sectionizer",
+        "tagger",
+        "attribute_ruler",
+        "lemmatizer",
+        "token_typer",
+        "span_match_ruler",
+        "negex",
+        "relextractor",
+    ]
+    assert profiler.last["peak"] > 0
+    assert profiler.last["text_length"] == len(suggest_request.text)
+    assert profiler.last["objects"]["suggestions"] == len(expected.suggestions)
+    assert "blocks" not in profiler.last["components"]["tagger"]
+    assert "live_docs" not in profiler.last["objects"]
+
+    profiler.debug = True
+    assert abstract.process_text(suggest_request) == expected
+    assert "blocks" in profiler.last["components"]["tagger"]
+    assert profiler.last["objects"]["live_docs"] >= 1
+
+    assert MemoryProfiler().sample(suggest_request) is None
+
+
+def test_latency_profiler(suggest_request, tmp_path, monkeypatch):
+    suggest_request.text = "HER2 FISH is POSITIVE."
+    suggest_request.abstractor_abstraction_schemas = []
+    profiler = LatencyProfiler(tmp_path, threshold=3600, sample_rate=1.0)
+    monkeypatch.setattr(abstract, "latency_profiler", profiler)
+    abstract.process_text(suggest_request)
+    assert (profiler.requests, profiler.slow_requests) == (1, 0)
+    assert list(tmp_path.iterdir()) == []
+
+    profiler.threshold = 0
+    response = abstract.process_text(suggest_request)
+    assert (profiler.requests, profiler.slow_requests) == (2, 1)
+    [path] = tmp_path.iterdir()
+    assert sorted(p.name for p in path.iterdir()) == [
+        "profile.json",
+        "profile.prof",
+        "request.json",
+    ]
+    record = json.loads((path / "profile.json").read_text())
+    assert record["text_length"] == len(suggest_request.text)
+    assert record["latency"] >= sum(record["components"].values())
+    assert record["objects"]["sentences"] == len(response.sentences)
+
+    monkeypatch.setattr(abstract, "latency_profiler", LatencyProfiler())
+    stats = replay(path)
+    assert stats.total_calls > 0
+
+
+def test_memory_and_latency(suggest_request, tmp_path, monkeypatch):
+    suggest_request.text = "HER2 FISH is POSITIVE."
+    suggest_request.abstractor_abstraction_schemas = []
+    memory = MemoryProfiler(sample_rate=1.0)
+    latency = LatencyProfiler(tmp_path, threshold=0, sample_rate=0.0)
+    monkeypatch.setattr(abstract, "memory_profiler", memory)
+    monkeypatch.setattr(abstract, "latency_profiler", latency)
+    abstract.process_text(suggest_request)
+    # a request sampled for memory is timed too, and saved when slow
+    assert (latency.requests, latency.slow_requests) == (1, 1)
+    [path] = tmp_path.iterdir()
+    record = json.loads((path / "profile.json").read_text())
+    assert list(record["components"]) == list(memory.last["components"])
+    assert memory.last["peak"] > 0
+
+
+def test_schema_times(suggest_request, schemas, tmp_path, monkeypatch):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = "HER2 FISH is POSITIVE. No evidence of DCIS."
+    expected = abstract.process_text(suggest_request)
+
+    profiler = LatencyProfiler(tmp_path, threshold=3600, sample_rate=0.0)
+    monkeypatch.setattr(abstract, "latency_profiler", profiler)
+    for _ in range(2):
+        assert abstract.process_text(suggest_request) == expected
+    report = profiler.schema_report()
+    predicates = {
+        schemas[m.abstractor_abstraction_schema_id].predicate
+        for m in suggest_request.abstractor_abstraction_schemas
+    }
+    assert {r["predicate"] for r in report} == predicates | {"(shared)"}
+    assert [r["seconds"] for r in report] == sorted(
+        [r["seconds"] for r in report], reverse=True
+    )
+    components = {c for r in report for c in r["components"]}
+    assert components == {"span_match_ruler", "negex", "relextractor"}
@@ -0,0 +1,62 @@
+import textabstractor
+from clinspacy import abstract, tag
+from clinspacy.abstract import TextAbstractor
+from clinspacy.incremental import IncrementalAbstractor
+from clinspacy.recycle import AbstractorPool
+
+
+def test_abstractor_pool(abstractor):
+    built = []
+
+    def factory():
+        built.append(TextAbstractor())
+        return built[-1]
+
+    pool = AbstractorPool(max_docs=2, factory=factory, abstractor=abstractor)
+    with pool.acquire() as first:
+        assert first is abstractor
+    with pool.acquire() as second:
+        assert second is abstractor
+    assert pool.due()
+
+    # a request holding the retired pipeline keeps it until it is done
+    with pool.acquire() as third:
+        assert third is built[0] and built[0] is not abstractor
+        assert pool.stats()["in_flight"] == 1
+    assert pool.stats()["recycles"] == 1
+
+    pool = AbstractorPool(max_strings=10, factory=factory)
+    with pool.acquire() as held:
+        held.nlp("Unheardof tokens zyxwv qwertz asdfgh yxcvbn poiuzt lkjhgf mnbvcx")
+        assert pool.due()
+        tag.orth_types[0] = 0
+        with pool.acquire() as fresh:
+            assert fresh is not held
+            stats = pool.stats()
+            assert stats["in_flight"] == 2 and stats["retired_in_flight"] == 1
+    assert tag.orth_types == {}
+    assert pool.stats()["added_strings"] == 0
+    assert pool.stats()["strings"] == len(built[-1].nlp.vocab.strings)
+
+
+def test_incremental_recycle(abstractor, suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    expected = []
+    for note in notes[:2]:
+        suggest_request.text = note
+        expected.append(abstract.process_text(suggest_request))
+
+    incremental = IncrementalAbstractor(abstractor, max_docs=1)
+    for _ in range(2):
+        for i, note in enumerate(notes[:2]):
+            suggest_request.text = note
+            assert incremental.process_text(f"note-{i}", suggest_request) == (
+                expected[i]
+            )
+    assert incremental.pool.recycles == 3
@@ -0,0 +1,52 @@
+import copy
+import time
+from datetime import timedelta
+from clinspacy import abstract
+from clinspacy.loadtest import SchemaService, clear_schema_cache
+
+
+def wait_for(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stale_while_revalidate(suggest_request, fixtures, abstractor, monkeypatch):
+    monkeypatch.setattr(abstract, "schema_refresher", None)
+    schema_metadatas = suggest_request.abstractor_abstraction_schemas
+    service = SchemaService(fixtures, latency=0.5)
+    clear_schema_cache()
+    with service.installed():
+        abstract.prefetch_schemas(abstractor, schema_metadatas)
+        refresher = abstract.enable_schema_refresh()
+        try:
+            updated = copy.deepcopy(schema_metadatas[0])
+            updated.updated_at += timedelta(days=1)
+            key = abstract.get_schema_key(updated)
+            stale = abstract.schema_cache[key][1]
+
+            start = time.perf_counter()
+            for _ in range(2):
+                abstract.prefetch_schemas(abstractor, [updated])
+                assert abstract.get_schema_patterns(abstractor, updated) is stale
+            assert time.perf_counter() - start < 0.5
+            assert refresher.stats()["pending"] == 1
+
+            wait_for(lambda: refresher.stats()["pending"] == 0)
+            assert abstract.schema_cache[key][0].updated_at == updated.updated_at
+            assert abstract.get_schema_patterns(abstractor, updated) is not stale
+            stats = refresher.stats()
+            assert (stats["stale_served"], stats["refreshes"]) == (2, 1)
+            assert stats["max_staleness"] >= 0.5
+        finally:
+            refresher.stop()
+
+        polled = copy.deepcopy(schema_metadatas[1])
+        polled.updated_at += timedelta(days=1)
+        refresher = abstract.enable_schema_refresh(lambda: [polled], interval=0.05)
+        try:
+            wait_for(lambda: abstract.is_cached(polled))
+            assert refresher.stats()["stale_served"] == 0
+        finally:
+            refresher.stop()
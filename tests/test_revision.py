@@ -0,0 +1,70 @@
+import textabstractor
+from clinspacy import abstract
+from clinspacy.revision import process_revision, dirty_sentences
+
+
+def test_dirty_sentences():
+    old = ["A. ", "B. ", "C. ", "D. ", "E. "]
+    dirty, old_of_new = dirty_sentences(old, ["A. ", "B. ", "X. ", "D. ", "E. "], 1)
+    assert dirty == [1, 2, 3]
+    assert old_of_new == {0: 0, 4: 4}
+    dirty, old_of_new = dirty_sentences(old, ["A. ", "B. ", "D. ", "E. "], 0)
+    assert dirty == []
+    assert old_of_new == {0: 0, 1: 1, 2: 3, 3: 4}
+
+
+def test_process_revision(abstractor, suggest_request, schemas, notes):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    suggest_request.text = notes[0]
+    response, revision = process_revision(suggest_request, abstractor=abstractor)
+    assert response == abstract.process_text(suggest_request)
+    num_sentences = len(response.sentences)
+    assert revision.reprocessed_sentences == num_sentences
+
+    # addendum in the middle of the note, plus an edited sentence near the end
+    middle = len(notes[0]) // 2
+    amended = (
+        notes[0][:middle] + " Addendum: no DCIS was identified. " + notes[0][middle:]
+    )
+    amended = amended.replace("carcinoma", "carcinomas", 1)
+    suggest_request.text = amended
+    response, revision = process_revision(suggest_request, revision, abstractor)
+    assert response == abstract.process_text(suggest_request)
+    assert revision.reprocessed_sentences < num_sentences // 4
+
+
+def test_multi_sentence_edit(abstractor, suggest_request, schemas):
+    for schema_meta_data in suggest_request.abstractor_abstraction_schemas:
+        textabstractor.textabstract.schema_cache[
+            schema_meta_data.abstractor_abstraction_schema_uri
+        ] = (
+            schema_meta_data,
+            schemas[schema_meta_data.abstractor_abstraction_schema_id],
+        )
+    sentences = [
+        "The specimen was received in formalin.",
+        "Invasive ductal carcinoma of the left breast was found.",
+        "Margins are negative.",
+        "HER2 FISH is POSITIVE.",
+        "Lymph nodes were examined.",
+        "The patient tolerated the procedure well.",
+    ]
+    suggest_request.text = " ".join(sentences)
+    _, revision = process_revision(suggest_request, abstractor=abstractor)
+
+    # two consecutive sentences replaced by three
+    sentences[2:4] = [
+        "No evidence of DCIS.",
+        "Tumor extent is 10%, very small.",
+        "HER2 FISH is NEGATIVE.",
+    ]
+    suggest_request.text = " ".join(sentences)
+    response, revision = process_revision(suggest_request, revision, abstractor)
+    assert response == abstract.process_text(suggest_request)
+    assert revision.reprocessed_sentences < len(sentences)
@@ -0,0 +1,93 @@
+import pytest
+from spacy.lang.en import English
+from spacy.matcher import Matcher
+from clinspacy.tag import *
+from clinspacy.match import SpanMatcher, get_attrs
+from clinspacy.parse import get_date_schema, get_number_schema
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    nlp = English()
+    nlp.add_pipe("token_typer")
+    return nlp
+
+
+@pytest.fixture
+def extended_dates():
+    set_extended_dates(True)
+    yield
+    set_extended_dates(False)
+
+
+@pytest.mark.parametrize("text", ["10/13/1968", "1/3/68"])
+def test_dates(nlp, text):
+    doc = nlp(f"Seen on {text} .")
+    dates = [doc[start:end] for start, end in match_value_type(doc, "date")]
+    assert [d.text for d in dates] == [text]
+    assert [t._.value_type for t in dates[0]] == ["date"]
+    assert doc[0]._.value_type is None
+    assert doc[-1]._.value_type is None
+
+
+@pytest.mark.parametrize(
+    "text", ["10-13-1968", "13.10.1968", "1968-10-13", "1968/10/13", "10.13.68"]
+)
+def test_dates_as_token_pattern(nlp, text):
+    # only m/d/y dates, as the regex token pattern of date schemas
+    doc = nlp(f"Seen on {text} .")
+    assert match_value_type(doc, "date") == []
+    assert all(DATE_RE.match(t.text) is None for t in doc)
+
+
+def test_extended_dates(nlp, extended_dates):
+    doc = nlp("collected on 2019-12-01 and 10-13-1968 , 13.10.1968 and 1968/10/13")
+    dates = [doc[start:end].text for start, end in match_value_type(doc, "date")]
+    assert dates == ["2019-12-01", "10-13-1968", "13.10.1968", "1968/10/13"]
+    assert [t.text for t in doc if t._.value_type == "date"] == [
+        "2019",
+        "-",
+        "12",
+        "-",
+        "01",
+        "10",
+        "-",
+        "13",
+        "-",
+        "1968",
+        "13.10.1968",
+        "1968/10/13",
+    ]
+
+    set_extended_dates(False)
+    doc = nlp("collected on 2019-12-01 and 10-13-1968 , 13.10.1968 and 1968/10/13")
+    assert match_value_type(doc, "date") == []
+
+
+def test_numbers(nlp):
+    doc = nlp("Ki-67 is 5 % and ten of 20 cells , 10/13/68 %")
+    assert [t.text for t in doc if t._.value_type == "number"] == ["5", "ten", "20"]
+    assert [t.text for t in doc if t._.value_type == "percent"] == ["%", "%"]
+    assert [t.text for t in doc if t._.value_type == "date"] == ["10/13/68"]
+
+
+def test_untagged_doc():
+    # docs made outside the pipeline, e.g. by Span.as_doc, are classified on demand
+    doc = English()("Tumor is 5 % , seen 10/13/1968")
+    assert doc._.value_types is None
+    assert list(value_types(doc)) == [0, 0, NUMBER, PERCENT, 0, 0, DATE]
+    assert list(value_types(English()(""))) == []
+
+
+@pytest.mark.parametrize("get_schema", [get_number_schema, get_date_schema])
+def test_same_as_token_patterns(nlp, schemas, get_schema):
+    doc = nlp("Dated 1/2/2020 : 5 % of 12 %% , 3 4 % , 10/13/68 and 68-10 - 13 .")
+    patterns = get_schema(next(iter(schemas.values())))[0]
+    matcher = Matcher(nlp.vocab)
+    matcher.add("values", patterns["patterns"])
+    expected = [(start, end) for _, start, end in matcher(doc)]
+    assert match_value_type(doc, patterns["value_type"]) == expected
+
+    group = SpanMatcher(patterns["predicate"], patterns).match(doc)
+    assert [(s.start, s.end) for s in group] == expected
+    assert "value_type" not in get_attrs(group)
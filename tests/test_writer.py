@@ -0,0 +1,93 @@
+import json
+import pytest
+from clinspacy.writer import ResponseWriter, locate_sections, locate_sentences
+from textabstractor.dataclasses import (
+    ProcessTextResponse,
+    SectionSpan,
+    SentenceSpan,
+    Suggestion,
+)
+
+
+@pytest.fixture
+def response() -> ProcessTextResponse:
+    return ProcessTextResponse(
+        sections=[
+            SectionSpan(
+                section_number=0,
+                section_name="COMMENT",
+                begin=0,
+                end=40,
+                begin_header=0,
+                end_header=7,
+            )
+        ],
+        sentences=[
+            SentenceSpan(sentence_number=0, begin=0, end=20),
+            SentenceSpan(sentence_number=1, begin=21, end=40),
+        ],
+        suggestions=[
+            Suggestion(
+                predicate="has_cancer_histology",
+                begin=25,
+                end=28,
+                type="value",
+                value="DCIS",
+                assertion="absent",
+            )
+        ],
+    )
+
+
+def test_write_jsonl(tmp_path, response):
+    with ResponseWriter(tmp_path, batch_size=4, rows_per_file=8) as writer:
+        writer.write_all((f"note-{i}", response) for i in range(10))
+
+    parts = sorted((tmp_path / "suggestions").glob("part-*.jsonl"))
+    assert len(parts) == 2
+    rows = [json.loads(line) for p in parts for line in p.read_text().splitlines()]
+    assert len(rows) == 10
+    assert rows[0] == {
+        "note_id": "note-0",
+        "predicate": "has_cancer_histology",
+        "type": "value",
+        "value": "DCIS",
+        "assertion": "absent",
+        "begin": 25,
+        "end": 28,
+        "sentence_number": 1,
+        "section_number": 0,
+    }
+    sentences = [
+        json.loads(line)
+        for p in sorted((tmp_path / "sentences").glob("part-*.jsonl"))
+        for line in p.read_text().splitlines()
+    ]
+    assert len(sentences) == 20
+    assert not list(tmp_path.glob("*/*.partial"))
+
+
+def test_locate():
+    assert locate_sentences([5, 21], [0, 5, 20, 25]) == [None, 0, 0, 1]
+    sections = [
+        SectionSpan(
+            section_number=n,
+            section_name="S",
+            begin=b,
+            end=e,
+            begin_header=b,
+            end_header=b,
+        )
+        for n, (b, e) in enumerate([(30, 40), (0, 20)])
+    ]
+    assert locate_sections(sections, [0, 20, 25, 30, 41]) == [1, 1, None, 0, None]
+    assert locate_sections([], [0]) == [None]
+
+
+def test_write_parquet(tmp_path, response):
+    pq = pytest.importorskip("pyarrow.parquet")
+    with ResponseWriter(tmp_path, fmt="parquet", batch_size=4) as writer:
+        writer.write_all((f"note-{i}", response) for i in range(10))
+    table = pq.read_table(tmp_path / "suggestions" / "part-00000.parquet")
+    assert table.num_rows == 10
+    assert table.column("value").to_pylist() == ["DCIS"] * 10